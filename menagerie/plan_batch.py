@@ -0,0 +1,162 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import plan_protein_stability
+import plan_binding
+import plan_ngs_prep
+
+from util.plan_session import PlanSession
+from util.user_input import get_batch_args
+from util.format_output import print_blue, warn
+from util.catalog import Catalog
+
+PLAN_TYPES = {
+    "stability": plan_protein_stability,
+    "binding": plan_binding,
+    "ngs_prep": plan_ngs_prep
+}
+
+# Each worker process logs in once and uses the session for all of its plans
+worker_session = None
+
+def main():
+    args = get_batch_args(sorted(PLAN_TYPES))
+    plan_paths = find_plan_paths(args.plan_paths)
+
+    if not plan_paths:
+        warn("No plan folders found")
+        return
+
+    if args.refresh_catalog:
+        Catalog(args.server).invalidate()
+
+    print_blue("Planning {} {} plans".format(len(plan_paths), args.plan_type))
+
+    plan_session = PlanSession(args.server)
+    provision_samples(plan_session, plan_paths)
+
+    if args.processes > 1:
+        with ProcessPoolExecutor(max_workers=args.processes,
+                                 initializer=start_worker,
+                                 initargs=(args.server,)) as pool:
+            results = list(pool.map(run_in_worker, [args] * len(plan_paths), plan_paths))
+
+    else:
+        results = [run_plan(args, plan_path, plan_session) for plan_path in plan_paths]
+
+    report(results)
+
+def find_plan_paths(patterns):
+    """
+    Expands the folders and glob patterns given on the command line into
+    the folders that contain a plan.json file, in the order given.
+
+    :param patterns: folders or glob patterns
+    :type patterns: list
+    :return: list
+    """
+    plan_paths = []
+
+    for pattern in patterns:
+        matches = [p for p in sorted(glob.glob(pattern)) if os.path.isfile(os.path.join(p, "plan.json"))]
+        if not matches:
+            warn("No plan folders match {}".format(pattern))
+
+        plan_paths += [p for p in matches if p not in plan_paths]
+
+    return plan_paths
+
+def provision_samples(plan_session, plan_paths):
+    """
+    Finds or creates the Samples of the provision steps of every plan
+    together, before any plan is built. Otherwise plans built in different
+    processes could each find that a Sample is missing and create it.
+    Samples of unknown SampleTypes are left for their plans to report.
+
+    :param plan_session: the session to create the Samples with
+    :type plan_session: PlanSession
+    :param plan_paths: the plan folders
+    :type plan_paths: list
+    """
+    sample_specs = []
+
+    for plan_path in plan_paths:
+        with open(os.path.join(plan_path, "plan.json"), 'r') as f:
+            steps = json.load(f).get("steps", [])
+
+        for step in steps:
+            if step.get("type") != "provision": continue
+
+            for s in step.get("operator", {}).get("samples", []):
+                sample_specs.append((s.get("sample_type"), s["name"], {}))
+
+    sample_types = plan_session.catalog.sample_types([s[0] for s in sample_specs])
+    sample_specs = [s for s in sample_specs if sample_types[s[0]]]
+
+    if sample_specs:
+        plan_session.find_or_create_samples(sample_specs)
+
+def start_worker(aq_instance):
+    global worker_session
+    worker_session = PlanSession(aq_instance)
+
+def run_in_worker(args, plan_path):
+    return run_plan(args, plan_path, worker_session)
+
+def run_plan(args, plan_path, plan_session):
+    """
+    Builds one plan, or loads its cached build, and pushes it. Errors are
+    reported and returned, so that the rest of the batch still runs.
+
+    :param args: the command line arguments
+    :type args: Namespace
+    :param plan_path: name of folder containing configuration files
+    :type plan_path: str
+    :param plan_session: the session and lookup caches shared by the plans
+    :type plan_session: PlanSession
+    :return: (plan_path, id of the Plan, error message)
+    """
+    print_blue("Planning {}".format(plan_path))
+
+    inputs = {
+        'plan_path': plan_path,
+        'start_date': args.start_date,
+        'aq_instance': args.server
+    }
+
+    try:
+        plan = PLAN_TYPES[args.plan_type].load_plan(args, inputs, plan_session)
+
+        if args.ephemeral:
+            return plan_path, None, None
+
+        plan.create_aq_plan(args.batch_size)
+        plan.add_data_associations()
+        plan.report()
+
+    except Exception as e:
+        warn("Failed to plan {}: {}".format(plan_path, e))
+        return plan_path, None, str(e)
+
+    return plan_path, plan.aq_plan.id, None
+
+def report(results):
+    print()
+    print_blue("Batch finished")
+
+    for plan_path, plan_id, error in results:
+        if error:
+            print("{}: failed ({})".format(plan_path, error))
+        elif plan_id:
+            print("{}: Plan {}".format(plan_path, plan_id))
+        else:
+            print("{}: built".format(plan_path))
+
+    n_failed = len([r for r in results if r[2]])
+    if n_failed:
+        warn("{} of {} plans failed".format(n_failed, len(results)))
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,11 @@ from util.cursor import Cursor
 from util.cloning_plans import CloningPlan
 from util.user_input import get_input, get_args
 from util.format_output import print_blue
+from util.catalog import Catalog
+from util.plan_artifact import write_artifact
 
 def main():
-    args = get_args()
+    args = get_args(build_options=False)
 
     if args.test:
         # Override get_input() for convenience when testing code
@@ -17,6 +19,9 @@ def main():
         # Ask for inputs on the command line
         inputs = get_input(start_date=False)
 
+    if args.refresh_catalog:
+        Catalog(inputs['aq_instance']).invalidate()
+
     plan = CloningPlan(inputs['plan_path'], inputs['aq_instance'])
 
     # Keeps track of where to put the next operation in the Aquarium Designer GUI
@@ -32,8 +37,14 @@ def main():
     cursor.advance_to_next_step()
     plan_step.report()
 
-    if not args.ephemeral:
-        plan.create_aq_plan()
+    if args.auto_layout:
+        plan.auto_layout()
+
+    if args.compile:
+        write_artifact(plan, args.compile)
+
+    elif not args.ephemeral:
+        plan.create_aq_plan(args.batch_size, args.resume, args.update, args.force)
         plan.add_data_associations()
         plan.report()
 
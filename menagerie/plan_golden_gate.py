@@ -4,9 +4,11 @@ from util.plasmid_assembly_legs import GoldenGateLeg, SangerSeqLeg
 
 from util.user_input import get_input, get_args
 from util.format_output import print_blue
+from util.catalog import Catalog
+from util.plan_artifact import write_artifact
 
 def main():
-    args = get_args()
+    args = get_args(build_options=False)
 
     if args.test:
         # Override get_input() for convenience when testing code
@@ -19,6 +21,9 @@ def main():
         # Ask for inputs on the command line
         inputs = get_input(start_date=False)
 
+    if args.refresh_catalog:
+        Catalog(inputs['aq_instance']).invalidate()
+
     plan = CloningPlan(inputs['plan_path'], inputs['aq_instance'])
 
     # Keeps track of where to put the next operation in the Aquarium Designer GUI
@@ -49,8 +54,14 @@ def main():
 
                 cursor.return_y()
 
-    if not args.ephemeral:
-        plan.create_aq_plan()
+    if args.auto_layout:
+        plan.auto_layout()
+
+    if args.compile:
+        write_artifact(plan, args.compile)
+
+    elif not args.ephemeral:
+        plan.create_aq_plan(args.batch_size, args.resume, args.update, args.force)
         plan.add_data_associations()
         plan.report()
 
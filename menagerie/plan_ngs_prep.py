@@ -2,6 +2,9 @@ from util.cursor import Cursor
 from util.yeast_display_plans import YeastDisplayPlan
 from util.user_input import get_input, get_args
 from util.format_output import print_blue
+from util.catalog import Catalog
+from util.plan_artifact import write_artifact
+from util.build_cache import build_with_cache
 
 def main():
     args = get_args()
@@ -17,7 +20,50 @@ def main():
         # Ask for inputs on the command line
         inputs = get_input(start_date=False, plan_path=False)
 
-    plan = YeastDisplayPlan('/script/data', inputs['aq_instance'])
+    if args.refresh_catalog:
+        Catalog(inputs['aq_instance']).invalidate()
+
+    # The configuration is read from the folder mounted in the container
+    inputs['plan_path'] = '/script/data'
+    plan = load_plan(args, inputs)
+
+    if args.compile:
+        write_artifact(plan, args.compile)
+
+    elif not args.ephemeral:
+        plan.create_aq_plan(args.batch_size, args.resume, args.update, args.force)
+        plan.add_data_associations()
+        plan.report()
+
+def load_plan(args, inputs, plan_session=None):
+    """
+    Builds the Plan for `inputs`, or loads the cached build of it.
+
+    :param args: the command line arguments
+    :type args: Namespace
+    :param inputs: plan_path and aq_instance
+    :type inputs: dict
+    :param plan_session: the session and lookup caches to share with
+        other Plans; if None, new ones are created
+    :type plan_session: PlanSession
+    :return: ExternalPlan
+    """
+    return build_with_cache(
+        args,
+        lambda plan_session: build_plan(args, inputs, plan_session),
+        inputs['plan_path'],
+        inputs['aq_instance'],
+        "ngs_prep",
+        args.auto_layout,
+        plan_session=plan_session
+    )
+
+def build_plan(args, inputs, plan_session=None):
+    plan = YeastDisplayPlan(inputs['plan_path'], inputs['aq_instance'], plan_session=plan_session)
+    plan.jobs = args.jobs
+
+    if args.stream and not args.ephemeral:
+        plan.start_upload(args.batch_size)
 
     # Keeps track of where to put the next operation in the Aquarium Designer GUI
     cursor = Cursor(y=18)
@@ -26,13 +72,14 @@ def main():
     #   want the `dna_seq` steps
     for plan_step in plan.get_steps_by_type('dna_seq'):
         plan_step.create_step(cursor)
+        plan.flush()
 
         plan_step.report()
 
-    if not args.ephemeral:
-        plan.create_aq_plan()
-        plan.add_data_associations()
-        plan.report()
+    if args.auto_layout:
+        plan.auto_layout()
+
+    return plan
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,13 @@
+from util.compiled_plans import CompiledPlan
+from util.user_input import get_push_args
+
+def main():
+    args = get_push_args()
+
+    plan = CompiledPlan(args.path, args.server)
+    plan.create_aq_plan(args.batch_size, args.resume, args.update, args.force)
+    plan.add_data_associations()
+    plan.report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Cache of built Plans
+
+Building a Plan from the same configuration files gives the same Plan, as
+long as the catalog records and the code that builds it have not changed.
+`BuildCache` keeps a compiled Plan (see `util.plan_artifact`) for each
+configuration it has built, named after a hash of plan.json, params.json and
+aquarium_defaults.json, the other inputs of the build and the source of
+menagerie. The hash of the catalog records the Plan uses is stored with it,
+and the cached Plan is only used if they are still the same and still fresh.
+So are the results of the lookups the build made on the server (see
+`util.server_inputs`), and the cached Plan is only used if the same lookups
+give the same Samples and Items.
+A Plan loaded from the cache is a `CompiledPlan`, which is pushed like one
+that was just built.
+
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+
+from util.compiled_plans import CompiledPlan
+from util.plan_artifact import ARTIFACT_VERSION, dump_plan, read_artifact
+from util.plan_session import PlanSession
+from util.server_inputs import ServerInputs
+from util.plans import InputError
+from util.format_output import print_blue
+
+CONFIG_FILES = ["plan.json", "params.json", "aquarium_defaults.json"]
+
+def build_cache_dir():
+    """
+    Directory where built Plans are kept. Can be overridden with the
+    MENAGERIE_BUILD_CACHE_DIR environment variable.
+
+    :return: str
+    """
+    default_dir = os.path.join(os.path.expanduser("~"), ".menagerie", "builds")
+    return os.environ.get("MENAGERIE_BUILD_CACHE_DIR") or default_dir
+
+def source_hash():
+    """
+    Returns a hash of the source files of menagerie, so that Plans built by
+    other versions of the code are not used.
+
+    :return: str
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = glob.glob(os.path.join(root, "*.py")) + glob.glob(os.path.join(root, "util", "*.py"))
+    sha = hashlib.sha1()
+
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+
+    return sha.hexdigest()
+
+def catalog_keys(data):
+    """
+    Returns the names of the catalog records used by a compiled Plan.
+
+    :param data: the contents of the artifact
+    :type data: dict
+    :return: lists of names keyed by kind of record
+    """
+    return {
+        "operation_types": [n for n, c in data["operation_types"].values()],
+        "object_types": list(data["object_types"].values())
+    }
+
+class BuildCache:
+    """
+    The cached build of one configuration of a Plan.
+    """
+
+    def __init__(self, plan_path, aq_instance, *inputs):
+        """
+        :param plan_path: name of folder containing configuration files
+        :type plan_path: str
+        :param aq_instance: the instance of Aquarium to use
+            Corresponds to a key in the secrets.json file
+        :type aq_instance: str
+        :param inputs: anything else the Plan depends on, such as the name
+            of the script and the start date; must convert to str the same
+            way each time
+        :return: new BuildCache
+        """
+        self.aq_instance = aq_instance
+        self.key = self.build_key(plan_path, inputs)
+        self.path = os.path.join(build_cache_dir(), "{}-{}.json.gz".format(aq_instance, self.key))
+
+    def build_key(self, plan_path, inputs):
+        """
+        Returns a hash of the configuration files and the other inputs.
+
+        :param plan_path: name of folder containing configuration files
+        :type plan_path: str
+        :param inputs: the other inputs
+        :type inputs: tuple
+        :return: str
+        """
+        sha = hashlib.sha1()
+        header = [ARTIFACT_VERSION, self.aq_instance, [str(i) for i in inputs], source_hash()]
+        sha.update(json.dumps(header).encode())
+
+        for file_name in CONFIG_FILES:
+            path = os.path.join(plan_path, file_name)
+            sha.update(file_name.encode())
+
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    sha.update(f.read())
+
+        return sha.hexdigest()
+
+    def load(self, plan_session):
+        """
+        Returns the cached Plan, or None if there is none, or if the catalog
+        records it uses have changed or expired, or if looking up its
+        Samples and Items on the server gives different results.
+
+        :param plan_session: the session and lookup caches to use
+        :type plan_session: PlanSession
+        :return: CompiledPlan
+        """
+        if not os.path.exists(self.path): return None
+
+        try:
+            data = read_artifact(self.path)
+        except (InputError, OSError, ValueError):
+            return None
+
+        catalog = plan_session.catalog
+
+        version = catalog.version(catalog_keys(data))
+        if not version or version != data.get("catalog_version"):
+            return None
+
+        server_inputs = ServerInputs(data.get("server_inputs"))
+        if not server_inputs.unchanged(plan_session.session, catalog):
+            return None
+
+        try:
+            plan = CompiledPlan(self.path, self.aq_instance, data, plan_session)
+        except InputError:
+            return None
+
+        print_blue("Using the cached build of this plan; pass --rebuild to build it again")
+        return plan
+
+    def save(self, plan):
+        """
+        Writes a Plan that has been built to the cache. It is not written
+        if the lookups made while building it already give other results,
+        for example because the build created Samples with names it had
+        looked up; building again would give a different Plan.
+
+        :param plan: the ExternalPlan, after its steps have been created
+        :type plan: ExternalPlan
+        """
+        if not plan.server_inputs.unchanged(plan.session, plan.catalog): return
+
+        data = dump_plan(plan)
+        data["server_inputs"] = plan.server_inputs.dump()
+        data["catalog_version"] = plan.catalog.version(catalog_keys(data))
+        if not data["catalog_version"]: return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+
+        with gzip.open(temp_path, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+        os.replace(temp_path, self.path)
+
+def build_with_cache(args, build, plan_path, aq_instance, *inputs, plan_session=None):
+    """
+    Returns the cached build of a Plan if there is one, and otherwise builds
+    it and caches it.
+
+    :param args: the command line arguments
+    :type args: Namespace
+    :param build: builds the Plan; called with the PlanSession
+    :type build: function
+    :param plan_path: name of folder containing configuration files
+    :type plan_path: str
+    :param aq_instance: the instance of Aquarium to use
+    :type aq_instance: str
+    :param inputs: anything else the Plan depends on
+    :param plan_session: the session and lookup caches to share with
+        other Plans; if None, new ones are created
+    :type plan_session: PlanSession
+    :return: ExternalPlan
+    """
+    cache = BuildCache(plan_path, aq_instance, *inputs)
+
+    # Checking the cached build needs the same session as building
+    plan_session = plan_session or PlanSession(aq_instance)
+
+    if not (args.rebuild or args.refresh_catalog):
+        plan = cache.load(plan_session)
+        if plan: return plan
+
+    plan = build(plan_session)
+    cache.save(plan)
+    return plan
@@ -0,0 +1,390 @@
+"""On-disk cache of Aquarium catalog records
+
+OperationTypes, SampleTypes and ObjectTypes rarely change, but every plan
+looks up the same ones over and over. `Catalog` keeps a copy of each record it
+fetches in a JSON file for the Aquarium instance, so that later runs can skip
+the round trip until the record expires or the cache is invalidated.
+
+"""
+
+import copy
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Seconds before a cached record is fetched again from the server.
+DEFAULT_TTL = 24 * 60 * 60
+
+def catalog_dir():
+    """
+    Directory where catalog files are kept. Can be overridden with the
+    MENAGERIE_CACHE_DIR environment variable.
+
+    :return: str
+    """
+    default_dir = os.path.join(os.path.expanduser("~"), ".menagerie", "catalog")
+    return os.environ.get("MENAGERIE_CACHE_DIR") or default_dir
+
+class Catalog:
+    """
+    `Catalog` serves OperationType, SampleType and ObjectType lookups for one
+    Aquarium instance, from memory if possible, then from the file on disk,
+    and only then from the server.
+    """
+
+    # kind: (pydent model name, relationships to load and store with it)
+    kinds = {
+        "operation_types": ("OperationType", ["field_types", "allowable_field_types"]),
+        "sample_types": ("SampleType", ["field_types"]),
+        "object_types": ("ObjectType", [])
+    }
+
+    def __init__(self, aq_instance, session=None, ttl=DEFAULT_TTL):
+        """
+        :param aq_instance: the instance of Aquarium to use
+            Corresponds to a key in the secrets.json file
+        :type aq_instance: str
+        :param session: the session used to fetch missing records
+        :type session: AqSession
+        :param ttl: seconds before a cached record is fetched again
+        :type ttl: int
+        :return: new Catalog
+        """
+        self.aq_instance = aq_instance
+        self.session = session
+        self.ttl = ttl
+        self.path = os.path.join(catalog_dir(), "{}.json".format(aq_instance))
+        self.records = self.load()
+        self.models = {}
+
+        # Plans may be built from several threads
+        self.lock = threading.RLock()
+
+    def load(self):
+        """
+        Reads the catalog file for this instance.
+
+        :return: dict
+        """
+        records = {kind: {} for kind in self.kinds}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    records.update(json.load(f))
+            except ValueError:
+                pass
+
+        return records
+
+    def save(self, merge=True):
+        """
+        Writes the catalog file for this instance. Other processes may be
+        saving the same catalog, so the file is locked while it is written,
+        and records that were saved to it since it was read are kept unless
+        this catalog fetched the same record later.
+
+        :param merge: whether to keep the records saved by others
+        :type merge: bool
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path + ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if merge:
+                self.merge(self.load())
+
+            temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(temp_path, 'w') as f:
+                json.dump(self.records, f)
+
+            os.replace(temp_path, self.path)
+
+    def merge(self, records):
+        """
+        Adds records read from the file, keeping the later of two entries
+        for the same key.
+
+        :param records: records as returned by `load`
+        :type records: dict
+        """
+        with self.lock:
+            for kind, entries in records.items():
+                mine = self.records.setdefault(kind, {})
+
+                for key, entry in entries.items():
+                    if key not in mine or mine[key]["fetched_at"] < entry["fetched_at"]:
+                        mine[key] = entry
+                        self.models.pop((kind, key), None)
+
+    def invalidate(self, kind=None):
+        """
+        Forgets cached records so that they are fetched again.
+
+        :param kind: one of the keys of `Catalog.kinds`; if None, everything
+            is forgotten and the file is removed
+        :type kind: str
+        """
+        if kind:
+            self.records[kind] = {}
+            self.models = {k: v for k, v in self.models.items() if k[0] != kind}
+            self.save(merge=False)
+
+        else:
+            self.records = {k: {} for k in self.kinds}
+            self.models = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def version(self, keys):
+        """
+        Returns a hash of the cached records under some keys, which changes
+        whenever any of them is fetched again with different contents.
+        Returns None if any of them is not cached or has expired.
+
+        :param keys: lists of names keyed by kind
+        :type keys: dict
+        :return: str
+        """
+        data = []
+
+        with self.lock:
+            for kind in sorted(keys):
+                for key in sorted(set(keys[kind])):
+                    entry = self.records[kind].get(key)
+                    if not entry or not self.is_fresh(entry):
+                        return None
+
+                    data.append([kind, key, entry["data"]])
+
+        data = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def lookup(self, kind, key):
+        """
+        Returns the list of records cached under `key`, fetching and caching
+        them on a miss.
+
+        :param kind: one of the keys of `Catalog.kinds`
+        :type kind: str
+        :param key: the name of the records
+        :type key: str
+        :return: list
+        """
+        return self.lookup_many(kind, [key])[key]
+
+    def lookup_many(self, kind, keys):
+        """
+        Returns the lists of records cached under each of `keys`. All of the
+        keys that miss are fetched together in a single query.
+
+        :param kind: one of the keys of `Catalog.kinds`
+        :type kind: str
+        :param keys: the names of the records
+        :type keys: list
+        :return: dict
+        """
+        with self.lock:
+            return self.lookup_many_locked(kind, keys)
+
+    def lookup_many_locked(self, kind, keys):
+        found = {}
+        missing = []
+
+        for key in keys:
+            if key in found or key in missing: continue
+
+            models = self.models.get((kind, key))
+            entry = self.records[kind].get(key)
+
+            if models is None and entry and self.is_fresh(entry):
+                models = self.load_models(kind, entry["data"])
+                self.models[(kind, key)] = models
+
+            if models is None:
+                missing.append(key)
+            else:
+                found[key] = models
+
+        if missing:
+            name_query = missing if len(missing) > 1 else missing[0]
+            fetched = self.fetch(kind, {"name": name_query})
+
+            for key in missing:
+                models = [m for m in fetched if m.name == key]
+                self.store(kind, key, models)
+                self.models[(kind, key)] = models
+                found[key] = models
+
+            self.save()
+
+        return found
+
+    def fetch(self, kind, query):
+        """
+        Queries the server for records of one kind, along with the
+        relationships that are stored with them.
+
+        :param kind: one of the keys of `Catalog.kinds`
+        :type kind: str
+        :param query: the query to pass to `where`
+        :type query: dict
+        :return: list
+        """
+        model_name, relationships = self.kinds[kind]
+        if kind == "operation_types":
+            query = { **query, "deployed": True }
+
+        models = getattr(self.session, model_name).where(query)
+
+        related = models
+        for relationship in relationships:
+            related = self.session.browser.retrieve(related, relationship)
+
+        return models
+
+    def store(self, kind, key, models):
+        self.records[kind][key] = {
+            "fetched_at": time.time(),
+            "data": [m.dump(include=self.dump_include(kind)) for m in models]
+        }
+
+    def load_models(self, kind, data):
+        # pydent replaces nested data with models as it loads, so the
+        # stored records are copied first
+        model_name = self.kinds[kind][0]
+        return [getattr(self.session, model_name).load(copy.deepcopy(d)) for d in data]
+
+    def dump_include(self, kind):
+        """Nests the relationships of a kind into the form used by `dump`."""
+        include = {}
+        for relationship in reversed(self.kinds[kind][1]):
+            include = {relationship: include} if include else relationship
+        return include or None
+
+    def operation_types(self, name, category=None):
+        """
+        Returns the deployed OperationTypes with a name, and optionally
+        a category.
+
+        :param name: the name of the OperationType
+        :type name: str
+        :param category: the category of the OperationType
+        :type category: str
+        :return: list
+        """
+        op_types = self.lookup("operation_types", name)
+
+        if category:
+            op_types = [ot for ot in op_types if ot.category == category]
+
+        return op_types
+
+    def prefetch_operation_types(self, names):
+        """
+        Makes sure that the deployed OperationTypes for all of `names` are in
+        memory, fetching any that are not cached in one query.
+
+        :param names: the names of the OperationTypes
+        :type names: list
+        """
+        self.lookup_many("operation_types", names)
+
+    def sample_type(self, name):
+        """
+        Returns the SampleType with a name, or None if not found.
+
+        :param name: the name of the SampleType
+        :type name: str
+        :return: SampleType
+        """
+        sample_types = self.lookup("sample_types", name)
+        if sample_types: return sample_types[0]
+
+    def sample_types(self, names):
+        """
+        Returns the SampleTypes with each of `names`, fetching any that are
+        not cached in one query.
+
+        :param names: the names of the SampleTypes
+        :type names: list
+        :return: dict of SampleTypes (or None if not found) keyed by name
+        """
+        found = self.lookup_many("sample_types", names)
+        return {name: sts[0] if sts else None for name, sts in found.items()}
+
+    def sample_types_by_id(self, ids):
+        """
+        Returns the SampleTypes with each of `ids`. SampleTypes are cached by
+        name, so cached records are searched for the ids first, and any that
+        are not found are fetched in one query and cached by name.
+
+        :param ids: the ids of the SampleTypes
+        :type ids: list
+        :return: dict of SampleTypes (or None if not found) keyed by id
+        """
+        with self.lock:
+            return self.sample_types_by_id_locked(ids)
+
+    def sample_types_by_id_locked(self, ids):
+        kind = "sample_types"
+        ids = set(ids)
+        names = {}
+
+        for name, entry in self.records[kind].items():
+            if not self.is_fresh(entry): continue
+
+            for d in entry["data"]:
+                if d.get("id") in ids:
+                    names[d["id"]] = name
+
+        found = {}
+        cached = self.lookup_many(kind, sorted(set(names.values())))
+        for sts in cached.values():
+            for st in sts:
+                if st.id in ids:
+                    found[st.id] = st
+
+        missing = sorted(ids - set(found))
+        if missing:
+            id_query = missing if len(missing) > 1 else missing[0]
+            fetched = self.fetch(kind, {"id": id_query})
+
+            for st in fetched:
+                self.store(kind, st.name, [st])
+                self.models[(kind, st.name)] = [st]
+                found[st.id] = st
+
+            self.save()
+
+        return {i: found.get(i) for i in ids}
+
+    def object_type(self, name):
+        """
+        Returns the ObjectType with a name, or None if not found.
+
+        :param name: the name of the ObjectType
+        :type name: str
+        :return: ObjectType
+        """
+        object_types = self.lookup("object_types", name)
+        if object_types: return object_types[0]
+
+    def object_types(self, names):
+        """
+        Returns the ObjectTypes with each of `names`, fetching any that are
+        not cached in one query.
+
+        :param names: the names of the ObjectTypes
+        :type names: list
+        :return: dict of ObjectTypes (or None if not found) keyed by name
+        """
+        found = self.lookup_many("object_types", names)
+        return {name: ots[0] if ots else None for name, ots in found.items()}
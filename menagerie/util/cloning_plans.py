@@ -12,7 +12,7 @@ class CloningPlan(ExternalPlan):
     Originally based on JSON schema derived from BU/SAIL Puppeteer schema.
     """
 
-    def __init__(self, plan_path, aq_instance, aq_plan_name=None):
+    def __init__(self, plan_path, aq_instance, aq_plan_name=None, plan_session=None):
         """
         In addition to super(), populates self.steps with new instances
         of PlanStep (PCRStep, GibsonStep or YeastTransformationStep).
@@ -23,19 +23,25 @@ class CloningPlan(ExternalPlan):
         :param aq_instance: the instance of Aquarium to use
             Corresponds to a key in the secrets.json file
         :type aq_instance: str
+        :param plan_session: the session and lookup caches to share with
+            other Plans; if None, new ones are created
+        :type plan_session: PlanSession
         :return: new CloningPlan
         """
-        super().__init__(plan_path, aq_instance, aq_plan_name)
+        super().__init__(plan_path, aq_instance, aq_plan_name, plan_session)
 
+        sample_specs = []
         for step in self.steps:
             dst_sample_type = self.destination_sample_type(step.type)
             # Why is this block not also in XPlan?
             for txn in step.transformations:
                 for dst in txn.destination:
-                    samples = self.get_samples(dst_sample_type, dst["name"], txn.source)
-                    sample = samples[0]
+                    sample_specs.append((dst_sample_type, dst["name"], txn.source))
 
-                    self.add_input_sample(dst["name"], sample)
+        found_samples = self.find_or_create_samples(sample_specs)
+
+        for (_, sample_name, _), samples in zip(sample_specs, found_samples):
+            self.add_input_sample(sample_name, samples[0])
 
     def initialize_step(self, step_data):
         step = super().initialize_step(step_data)
@@ -78,7 +84,7 @@ class CloningPlanStep(PlanStep):
         super().__init__(plan, plan_step)
 
         for txn in self.operator.get('transformations', []):
-            self.transformations.append(CloningPlanTransformation(self, txn))
+            self.add_transformation(CloningPlanTransformation(self, txn))
 
 
 class GoldenGateStep(CloningPlanStep):
@@ -142,7 +148,7 @@ class PCRStep(CloningPlanStep):
             template_src = get_obj_by_attr(src, "input_name", "Template")
 
             for dst in txn.destination:
-                sample_type = self.plan.input_sample(template_src["name"]).sample_type.name
+                sample_type = self.plan.sample_type_name(self.plan.input_sample(template_src["name"]))
 
                 if sample_type == "DNA Library":
                     container_opt = "dna_library"
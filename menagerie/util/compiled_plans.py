@@ -0,0 +1,55 @@
+from pydent.models import Plan
+
+from util.plans import ExternalPlan
+from util.plan_session import PlanSession
+from util.plan_artifact import read_artifact, load_graph, load_data_associations
+
+class CompiledPlan(ExternalPlan):
+    """
+    A Plan read from a file written by `util.plan_artifact.write_artifact`,
+    for creating in Aquarium a Plan that was built elsewhere. There are no
+    steps to build; only the methods that create the Plan and its data
+    associations are used.
+    """
+
+    def __init__(self, path, aq_instance=None, data=None, plan_session=None):
+        """
+        Does not call super(), which reads the configuration files of the
+        plan; the artifact holds everything needed to create it.
+
+        :param path: the artifact
+        :type path: str
+        :param aq_instance: the instance of Aquarium to use; if None, the
+            one the plan was compiled for
+        :type aq_instance: str
+        :param data: the contents of the artifact, if it has already been read
+        :type data: dict
+        :param plan_session: the session and lookup caches to share with
+            other Plans; if None, new ones are created
+        :type plan_session: PlanSession
+        :return: new CompiledPlan
+        """
+        data = data or read_artifact(path)
+
+        self.aq_instance = aq_instance or data["aq_instance"]
+        plan_session = plan_session or PlanSession(self.aq_instance)
+        self.plan_session = plan_session
+        self.session = plan_session.session
+        self.catalog = plan_session.catalog
+
+        # The folder the plan was built from, which keys the journal of an
+        # upload that was streamed while it was built
+        self.plan_path = data.get("plan_path") or path
+        self.aq_plan_name = data["name"]
+        self.aq_plan = Plan(name=self.aq_plan_name)
+        self.aq_plan.connect_to_session(self.session)
+        self.streamer = None
+        self.steps = []
+
+        self.graph = load_graph(data, self.session, self.catalog)
+        self.temp_data_associations = load_data_associations(
+            data, self.session, self.graph, self.aq_plan
+        )
+
+    def initialize_step(self, step_data):
+        return None
@@ -106,6 +106,19 @@ class Cursor:
         self.update_max_min_x()
         self.update_max_min_y()
 
+    def include(self, other):
+        """
+        Extends the max and min of this Cursor to cover positions that were
+        visited with another Cursor, e.g. a copy used by a parallel task.
+
+        :param other: the other Cursor
+        :type other: Cursor
+        """
+        self.max_x = max(self.max_x, other.max_x)
+        self.min_x = min(self.min_x, other.min_x)
+        self.max_y = max(self.max_y, other.max_y)
+        self.min_y = min(self.min_y, other.min_y)
+
     def get_xy(self):
         return [self.x, self.y]
 
@@ -1,4 +1,5 @@
 from util.plans import Leg
+from util.leg_specs import OperationSpec
 
 class DNASeqLeg(Leg):
 
@@ -33,11 +34,11 @@ class DNASeqLeg(Leg):
 
 class ExtractDNALeg(DNASeqLeg):
 
-    leg_order = [
-        {"name": "Treat With Zymolyase", "category": "Next Gen Prep"},
-        {"name": "Yeast Plasmid Extraction", "category": "Next Gen Prep"},
-        {"name": "Digest Genomic DNA", "category": "Next Gen Prep"}
-    ]
+    leg_order = (
+        OperationSpec("Treat With Zymolyase", "Next Gen Prep"),
+        OperationSpec("Yeast Plasmid Extraction", "Next Gen Prep"),
+        OperationSpec("Digest Genomic DNA", "Next Gen Prep")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -45,28 +46,33 @@ class ExtractDNALeg(DNASeqLeg):
 
 class QPCRLeg(DNASeqLeg):
 
-    leg_order = [
-        {"name": None, "category": "Preparative qPCR"},
-        {"name": "Run Pre-poured Gel", "category": "Next Gen Prep"},
-        {"name": "Extract Gel Slice (NGS)", "category": "Next Gen Prep"},
-        {"name": "Purify Gel Slice (NGS)", "category": "Next Gen Prep"}
-    ]
+    leg_order = (
+        OperationSpec("Make qPCR Fragment", "Preparative qPCR"),
+        OperationSpec("Run Pre-poured Gel", "Next Gen Prep"),
+        OperationSpec("Extract Gel Slice (NGS)", "Next Gen Prep"),
+        OperationSpec("Purify Gel Slice (NGS)", "Next Gen Prep")
+    )
 
-    def __init__(self, plan_step, cursor, plates=False):
-        qpcr_operation_type = "Make qPCR Fragment"
-        if plates: qpcr_operation_type +=  " WITH PLATES"
+    # The same Leg, for qPCR with plates
+    plates_leg_order = (
+        OperationSpec("Make qPCR Fragment WITH PLATES", "Preparative qPCR"),
+    ) + leg_order[1:]
 
-        self.leg_order[0]["name"] =  qpcr_operation_type
+    other_operation_types = ["Make qPCR Fragment WITH PLATES"]
 
+    def __init__(self, plan_step, cursor, plates=False):
         super().__init__(plan_step, cursor)
 
+        if plates:
+            self.leg_order = self.plates_leg_order
+
 
 class DiluteLibraryLeg(DNASeqLeg):
 
-    leg_order = [
-        {"name": "Qubit concentration", "category": "Next Gen Prep"},
-        {"name": "Dilute to 4nM", "category": "Next Gen Prep"}
-    ]
+    leg_order = (
+        OperationSpec("Qubit concentration", "Next Gen Prep"),
+        OperationSpec("Dilute to 4nM", "Next Gen Prep")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Prototypes of Legs, for building many Legs of the same shape
+
+Plans often add hundreds of Legs of one class that differ only in the few
+inputs named in `Leg.sample_io`, such as the yeast, protease and protease
+concentration of a `SortLeg`. Setting the inputs and outputs that come from
+the defaults is the same work every time. A `LegPrototype` does that work
+once, on Operations that are not part of any Plan; each Leg then copies the
+values from the prototype. The inputs and outputs that a Leg overrides are
+set once per distinct value, and copied by every Leg that overrides them
+with the same value.
+
+"""
+
+import threading
+
+from pydent.base import ModelBase as Base
+from pydent.exceptions import AquariumModelError
+
+from util.plan_ir import OperationRecord
+from util.operation_defaults import OperationDefaults
+
+class LegPrototype:
+    """
+    The Operations of one class of Leg, with the inputs and outputs set from
+    the defaults and nothing else, and any errors that setting them raised.
+    Also holds the inputs and outputs set with each overriding value.
+    """
+
+    def __init__(self, leg, container_opt=None):
+        """
+        :param leg: a Leg of the class to build a prototype of; only its
+            class, leg_order and Plan are used
+        :type leg: Leg
+        :param container_opt: an option for specifying one of several containers
+        :type container_opt: str
+        :return: new LegPrototype
+        """
+        self.operations = []
+        self.errors = []
+        self.variants = {}
+        self.lock = threading.Lock()
+
+        for spec in leg.leg_order:
+            resolved = leg.plan.leg_specs.resolve(spec)
+            op = OperationRecord(resolved.operation_type, field_types=resolved.field_types)
+            od = leg.plan.defaults_for(spec.name) or OperationDefaults({"name": spec.name})
+            errors = {}
+
+            for ft in op.operation_type.field_types:
+                ft_io = od.get(ft.role, {}).get(ft.name, {})
+                try:
+                    leg.set_field_io(op, ft, ft_io, container_opt)
+                except AquariumModelError as e:
+                    errors[(ft.role, ft.name)] = "%s: %s" % (op.operation_type.name, e)
+
+            self.operations.append(op)
+            self.errors.append(errors)
+
+    def variant(self, leg, i, ft, ft_io, replacement, container_opt=None):
+        """
+        Returns an Operation with the input or output for one FieldType set
+        from `ft_io`, in which the defaults were overridden with
+        `replacement`, and the error that setting it raised, if any.
+
+        :param leg: the Leg that overrides the input or output
+        :type leg: Leg
+        :param i: the index of the Operation in the leg_order
+        :type i: int
+        :param ft: the FieldType
+        :type ft: FieldType
+        :param ft_io: i/o data for the FieldType, with the replacement applied
+        :type ft_io: dict
+        :param replacement: the value from `Leg.sample_io`
+        :type replacement: Sample, str or number
+        :param container_opt: an option for specifying one of several containers
+        :type container_opt: str
+        :return: (OperationRecord, str)
+        """
+        key = replacement_key(replacement)
+        if key is not None:
+            key = (i, ft.role, ft.name) + key
+            with self.lock:
+                variant = self.variants.get(key)
+            if variant: return variant[:2]
+
+        prototype_op = self.operations[i]
+        op = OperationRecord(prototype_op.operation_type, field_types=prototype_op.field_types)
+        error = None
+
+        try:
+            leg.set_field_io(op, ft, ft_io, container_opt)
+        except AquariumModelError as e:
+            error = "%s: %s" % (op.operation_type.name, e)
+
+        if key is None: return op, error
+
+        # The replacement is kept so that its id() is not reused
+        with self.lock:
+            return self.variants.setdefault(key, (op, error, replacement))[:2]
+
+
+class LegPrototypes:
+    """
+    The prototypes used to build a Plan, keyed by class of Leg, leg_order
+    and container option. Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self.prototypes = {}
+        self.lock = threading.Lock()
+
+    def get(self, leg, container_opt=None):
+        """
+        Returns the prototype for a Leg, building it on first use.
+
+        :param leg: the Leg
+        :type leg: Leg
+        :param container_opt: an option for specifying one of several containers
+        :type container_opt: str
+        :return: LegPrototype
+        """
+        key = (type(leg), leg.leg_order, container_opt)
+
+        with self.lock:
+            prototype = self.prototypes.get(key)
+
+        if prototype: return prototype
+
+        prototype = LegPrototype(leg, container_opt)
+
+        with self.lock:
+            return self.prototypes.setdefault(key, prototype)
+
+def replacement_key(replacement):
+    """
+    Returns a key for a value from `Leg.sample_io`: Samples and other models
+    by identity, and hashable values by type and value. Returns None for
+    values that cannot be used as a key, such as lists.
+
+    :param replacement: the value
+    :type replacement: Sample, str or number
+    :return: tuple
+    """
+    if isinstance(replacement, Base):
+        return ("model", id(replacement))
+
+    try:
+        hash(replacement)
+    except TypeError:
+        return None
+
+    return ("value", type(replacement), replacement)
@@ -0,0 +1,64 @@
+"""Immutable specifications of the Operations in a Leg
+
+Each `Leg` class lists its Operations as a tuple of `OperationSpec`. The
+specs are never changed at runtime; a Leg that comes in variants, such as
+`QPCRLeg` with or without plates, has one tuple per variant. A
+`LegSpecRegistry` resolves each spec to its OperationType once and shares the
+result with every Leg of the Plan.
+
+"""
+
+import threading
+from collections import namedtuple
+
+OperationSpec = namedtuple("OperationSpec", ["name", "category"], defaults=[None])
+OperationSpec.__doc__ = "The name and, optionally, the category of an OperationType."
+
+ResolvedSpec = namedtuple(
+    "ResolvedSpec", ["name", "category", "operation_types", "operation_type", "field_types"]
+)
+ResolvedSpec.__doc__ = """
+An OperationSpec with the deployed OperationTypes that match it. The first
+match is used; `field_types` maps (role, name) to its FieldTypes.
+"""
+
+class LegSpecRegistry:
+    """
+    Resolves OperationSpecs to OperationTypes through a Catalog, once per
+    spec. Safe to use from several threads.
+    """
+
+    def __init__(self, catalog):
+        """
+        :param catalog: the Catalog for looking up OperationTypes
+        :type catalog: Catalog
+        :return: new LegSpecRegistry
+        """
+        self.catalog = catalog
+        self.resolved = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, spec):
+        """
+        Returns the resolved spec, resolving it on first use.
+
+        :param spec: the spec
+        :type spec: OperationSpec
+        :return: ResolvedSpec
+        """
+        with self.lock:
+            resolved = self.resolved.get(spec)
+
+        if resolved: return resolved
+
+        op_types = self.catalog.operation_types(spec.name, spec.category)
+        op_type = op_types[0] if op_types else None
+
+        field_types = {}
+        for ft in (op_type.field_types if op_type else []):
+            field_types.setdefault((ft.role, ft.name), ft)
+
+        resolved = ResolvedSpec(spec.name, spec.category, tuple(op_types), op_type, field_types)
+
+        with self.lock:
+            return self.resolved.setdefault(spec, resolved)
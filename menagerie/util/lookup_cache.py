@@ -0,0 +1,119 @@
+"""Memoized lookups shared by everything that builds one Plan
+
+`LookupCache` remembers the result of each key it has fetched. Keys that miss
+are fetched together, and a key that is already being fetched for another
+caller is waited on rather than fetched again, so that each key costs at most
+one request per run.
+
+"""
+
+import threading
+
+class LookupCache:
+    """
+    Memoizes a bulk fetch function, one result per key.
+    """
+
+    def __init__(self, fetch_many):
+        """
+        :param fetch_many: function that takes a list of keys and returns
+            a dict of results keyed by the same keys
+        :type fetch_many: function
+        :return: new LookupCache
+        """
+        self.fetch_many = fetch_many
+        self.results = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the result for `key`, fetching it on a miss.
+
+        :param key: the key
+        :return: the result of the fetch function for `key`
+        """
+        return self.get_many([key])[key]
+
+    def get_many(self, keys):
+        """
+        Returns the results for each of `keys`. Keys that are not cached or
+        already being fetched are fetched together in a single call.
+
+        :param keys: the keys
+        :type keys: list
+        :return: dict of results keyed by key
+        """
+        keys = list(dict.fromkeys(keys))
+
+        while True:
+            owned, waiting = self.claim(keys)
+
+            if owned:
+                self.fetch(owned)
+
+            for event in waiting:
+                event.wait()
+
+            with self.lock:
+                if all(k in self.results for k in keys):
+                    return { k: self.results[k] for k in keys }
+
+            # Another caller's fetch failed; try again as the owner
+
+    def claim(self, keys):
+        """
+        Marks the keys that are neither cached nor pending as pending for
+        this caller.
+
+        :return: the claimed keys, and the events of keys pending elsewhere
+        """
+        owned = []
+        waiting = set()
+
+        with self.lock:
+            for key in keys:
+                if key in self.results: continue
+
+                event = self.pending.get(key)
+                if event:
+                    waiting.add(event)
+                else:
+                    self.pending[key] = threading.Event()
+                    owned.append(key)
+
+        return owned, waiting
+
+    def fetch(self, keys):
+        try:
+            fetched = self.fetch_many(keys)
+            with self.lock:
+                for key in keys:
+                    self.results[key] = fetched.get(key)
+
+        finally:
+            with self.lock:
+                for key in keys:
+                    event = self.pending.pop(key)
+                    event.set()
+
+    def prime(self, results):
+        """
+        Stores results that were fetched some other way.
+
+        :param results: results keyed by key
+        :type results: dict
+        """
+        with self.lock:
+            self.results.update(results)
+
+    def discard(self, keys):
+        """
+        Forgets the results for keys, so that they are fetched again.
+
+        :param keys: the keys
+        :type keys: list
+        """
+        with self.lock:
+            for key in keys:
+                self.results.pop(key, None)
@@ -0,0 +1,62 @@
+"""Per-Leg views of the operation defaults in aquarium_defaults.json
+
+The defaults of each OperationType hold resolved Samples and ObjectTypes and
+are shared by every Leg that creates an Operation of that type. Rather than
+copying them, each Leg gets an `OperationDefaults` view that reads through to
+the shared defaults and keeps its own changes in a separate overlay.
+
+"""
+
+class OperationDefaults:
+    """
+    The defaults for one OperationType, with the changes made by one Leg.
+    Supports `od[key]`, `od.get(key)` and `od[key] = value` like the dict
+    that it wraps, without ever modifying that dict.
+    """
+
+    def __init__(self, defaults):
+        """
+        :param defaults: one entry of "operation_defaults", shared with
+            other views
+        :type defaults: dict
+        :return: new OperationDefaults
+        """
+        self.defaults = defaults
+        self.overlay = {}
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        return self.defaults[key]
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+
+    def __contains__(self, key):
+        return key in self.overlay or key in self.defaults
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def override_io(self, role, name, io_key, value):
+        """
+        Replaces one kind of value ("sample" or "value") of an input or
+        output, keeping the rest of its defaults.
+
+        :param role: "input" or "output"
+        :type role: str
+        :param name: the name of the input or output
+        :type name: str
+        :param io_key: "sample" or "value"
+        :type io_key: str
+        :param value: the new list of values, as in aquarium_defaults.json
+        :type value: list
+        """
+        if role not in self.overlay:
+            self.overlay[role] = dict(self.defaults.get(role) or {})
+
+        role_io = self.overlay[role]
+        role_io[name] = dict(role_io.get(name) or {})
+        role_io[name][io_key] = value
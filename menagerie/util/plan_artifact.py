@@ -0,0 +1,251 @@
+"""Compiled Plans
+
+`write_artifact` saves a Plan that has been built to a file instead of
+creating it: the Operations with their FieldValues and positions, the Wires,
+and the data associations that are added once the Plan is created. Models
+are stored by id, along with the names needed to find OperationTypes and
+ObjectTypes in the `Catalog`. `read_artifact` and `load_graph` turn the file
+back into a `PlanGraph`, which `util.compiled_plans.CompiledPlan` pushes
+like one that was just built.
+
+The file is gzipped JSON. `ARTIFACT_VERSION` is increased whenever the
+layout changes.
+
+"""
+
+import gzip
+import json
+
+from util.plan_ir import PlanGraph, OperationRecord, FieldValueRecord, model_id
+from util.plans import InputError
+
+ARTIFACT_FORMAT = "menagerie-plan"
+ARTIFACT_VERSION = 1
+
+def write_artifact(plan, path):
+    """
+    Writes a built Plan to a file.
+
+    :param plan: the ExternalPlan, after its steps have been created
+    :type plan: ExternalPlan
+    :param path: the file to write
+    :type path: str
+    """
+    data = dump_plan(plan)
+
+    with gzip.open(path, "wt") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+    msg = "Wrote {} operations and {} wires to {}"
+    print(msg.format(len(data["operations"]), len(data["wires"]), path))
+
+def dump_plan(plan):
+    """
+    Returns the contents of the artifact for a Plan.
+
+    :param plan: the ExternalPlan
+    :type plan: ExternalPlan
+    :return: dict
+    """
+    graph = plan.graph
+    operation_types = {}
+    object_types = {}
+    fv_index = {}
+    operations = []
+
+    for i, op in enumerate(graph.operations):
+        ot = op.operation_type
+        operation_types[str(ot.id)] = [ot.name, ot.category]
+        fvs = []
+
+        for j, fv in enumerate(op.field_values):
+            fv_index[id(fv)] = [i, j]
+            if fv.object_type is not None:
+                object_types[str(fv.object_type.id)] = fv.object_type.name
+
+            fvs.append([
+                fv.field_type.id, model_id(fv.sample), model_id(fv.item), fv.value,
+                model_id(fv.object_type), model_id(fv.allowable_field_type), list(fv.assigned)
+            ])
+
+        operations.append([ot.id, op.x, op.y, fvs])
+
+    wires = [[fv_index[id(w.source)], fv_index[id(w.destination)]] for w in graph.wires]
+
+    op_index = { id(op): i for i, op in enumerate(graph.operations) }
+    data_associations = []
+
+    for tda in plan.temp_data_associations.values():
+        obj = tda['object']
+        if isinstance(obj, OperationRecord):
+            target = ["operation", op_index[id(obj)]]
+        elif obj is plan.aq_plan:
+            target = ["plan"]
+        else:
+            target = [obj.__class__.__name__, obj.id]
+
+        values = { k: v for k, v in tda.items() if k != 'object' }
+        data_associations.append([target, values])
+
+    return {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "aq_instance": plan.aq_instance,
+        "name": plan.aq_plan_name,
+        "plan_path": plan.plan_path,
+        "fingerprint": graph.fingerprint(),
+        "operation_types": operation_types,
+        "object_types": object_types,
+        "operations": operations,
+        "wires": wires,
+        "data_associations": data_associations
+    }
+
+def read_artifact(path):
+    """
+    Reads an artifact written by `write_artifact`.
+
+    :param path: the file to read
+    :type path: str
+    :return: dict
+    """
+    with gzip.open(path, "rt") as f:
+        data = json.load(f)
+
+    if data.get("format") != ARTIFACT_FORMAT:
+        raise InputError("Not a compiled plan: {}".format(path))
+
+    if data.get("version") != ARTIFACT_VERSION:
+        msg = "Compiled plan {} has version {}; this version of menagerie reads version {}"
+        raise InputError(msg.format(path, data.get("version"), ARTIFACT_VERSION))
+
+    return data
+
+def load_graph(data, session, catalog):
+    """
+    Rebuilds the plan graph of an artifact. The OperationTypes and
+    ObjectTypes come from the Catalog, and the Samples and Items are each
+    fetched with one query. Raises InputError if the result does not have
+    the fingerprint of the graph that was compiled.
+
+    :param data: the contents of the artifact
+    :type data: dict
+    :param session: the session to fetch Samples and Items with
+    :type session: AqSession
+    :param catalog: the Catalog for the instance of Aquarium
+    :type catalog: Catalog
+    :return: PlanGraph
+    """
+    operation_types = find_operation_types(data["operation_types"], catalog)
+
+    object_types = {}
+    for ot in catalog.object_types(list(data["object_types"].values())).values():
+        if ot: object_types[ot.id] = ot
+
+    fv_data = [fv for op in data["operations"] for fv in op[3]]
+    samples = find_by_id(session.Sample, [fv[1] for fv in fv_data])
+    items = find_by_id(session.Item, [fv[2] for fv in fv_data])
+
+    graph = PlanGraph()
+
+    for ot_id, x, y, fvs in data["operations"]:
+        op = graph.add_operation(operation_types[ot_id], x, y)
+        field_types = { ft.id: ft for ft in op.operation_type.field_types }
+        n_initialized = len(op.field_values)
+
+        for j, (ft_id, sample_id, item_id, value, object_type_id, aft_id, assigned) in enumerate(fvs):
+            ft = field_types.get(ft_id)
+            if not ft:
+                msg = "FieldType {} not found for OperationType {}"
+                raise InputError(msg.format(ft_id, op.operation_type.name))
+
+            if j < n_initialized:
+                fv = op.field_values[j]
+            else:
+                fv = op.add_field_value(FieldValueRecord(op, ft))
+
+            afts = { aft.id: aft for aft in ft.allowable_field_types or [] }
+
+            fv.sample = samples.get(sample_id)
+            fv.item = items.get(item_id)
+            fv.value = value
+            fv.object_type = object_types.get(object_type_id)
+            fv.allowable_field_type = afts.get(aft_id)
+            fv.assigned = tuple(assigned)
+
+    for (si, sj), (di, dj) in data["wires"]:
+        src = graph.operations[si].field_values[sj]
+        dst = graph.operations[di].field_values[dj]
+        graph.add_wire(src, dst)
+
+    if graph.fingerprint() != data["fingerprint"]:
+        raise InputError("Compiled plan does not match the records on the server")
+
+    return graph
+
+def find_operation_types(names, catalog):
+    """
+    Finds the OperationTypes of an artifact by id, looking them up in the
+    Catalog by name.
+
+    :param names: [name, category] keyed by id, as a string
+    :type names: dict
+    :param catalog: the Catalog
+    :type catalog: Catalog
+    :return: dict of OperationTypes keyed by id
+    """
+    catalog.prefetch_operation_types(sorted(set(n for n, c in names.values())))
+    found = {}
+
+    for ot_id, (name, category) in names.items():
+        matches = [ot for ot in catalog.operation_types(name, category) if ot.id == int(ot_id)]
+        if not matches:
+            raise InputError("OperationType not found: {} > {} ({})".format(category, name, ot_id))
+
+        found[int(ot_id)] = matches[0]
+
+    return found
+
+def find_by_id(model_interface, ids):
+    """
+    Fetches models by id with one query.
+
+    :param model_interface: e.g. `session.Sample`
+    :param ids: the ids; None is ignored
+    :type ids: list
+    :return: dict of models keyed by id
+    """
+    ids = sorted(set(i for i in ids if i is not None))
+    if not ids: return {}
+
+    return { m.id: m for m in model_interface.where({ "id": ids }) }
+
+def load_data_associations(data, session, graph, aq_plan):
+    """
+    Rebuilds the temporary data associations of an artifact, in the form
+    of `ExternalPlan.temp_data_associations`.
+
+    :param data: the contents of the artifact
+    :type data: dict
+    :param session: the session
+    :type session: AqSession
+    :param graph: the plan graph loaded from the artifact
+    :type graph: PlanGraph
+    :param aq_plan: the Plan that will be created
+    :type aq_plan: Plan
+    :return: dict
+    """
+    tdas = {}
+
+    for target, values in data["data_associations"]:
+        if target[0] == "operation":
+            obj = graph.operations[target[1]]
+        elif target[0] == "plan":
+            obj = aq_plan
+        else:
+            obj = getattr(session, target[0]).load({ "id": target[1] })
+
+        tda = tdas.setdefault(id(obj), { 'object': obj })
+        tda.update(values)
+
+    return tdas
@@ -0,0 +1,546 @@
+"""Lightweight in-memory representation of a Plan
+
+Legs build the Operations, FieldValues and Wires of a Plan as plain records
+instead of pydent models. The records answer the same questions that Legs ask
+of Operations while building (`input`, `output`, `set_input`, `x`, `y`, ...),
+but no pydent models are built until the Plan is pushed to Aquarium (see
+`util.plan_push`).
+
+"""
+
+import hashlib
+import json
+
+from pydent.models import Sample, Item, Collection, ObjectType
+from pydent.exceptions import AquariumModelError
+
+class FieldValueRecord:
+    """
+    An input or output of an `OperationRecord`. Values are checked and the
+    AllowableFieldType is chosen as they are set, following the same rules
+    as pydent's FieldValue, so that errors surface while the Plan is built.
+    """
+
+    __slots__ = (
+        "operation", "field_type", "name", "role", "sample", "item", "value",
+        "object_type", "allowable_field_type", "assigned", "model"
+    )
+
+    def __init__(self, operation, field_type):
+        """
+        :param operation: the Operation that the FieldValue belongs to
+        :type operation: OperationRecord
+        :param field_type: the FieldType of the FieldValue
+        :type field_type: FieldType
+        :return: new FieldValueRecord
+        """
+        self.operation = operation
+        self.field_type = field_type
+        self.name = field_type.name
+        self.role = field_type.role
+        self.sample = None
+        self.item = None
+        self.value = None
+        self.object_type = None
+        self.allowable_field_type = None
+        self.assigned = ()
+        self.model = None
+
+    def set_value(self, **values):
+        """
+        Assigns any of `sample`, `item`, `value` and `object_type`, then
+        chooses the AllowableFieldType. Raises AquariumModelError without
+        changing anything if the values are not valid together.
+
+        :return: FieldValueRecord
+        """
+        # pydent checks the Item against the current container before
+        # checking it against the new one
+        self.validate({ k: v for k, v in values.items() if k != "object_type" })
+        self.validate(values)
+
+        set_aft = any(values.get(k) for k in ["sample", "object_type", "item"])
+
+        item = values.get("item")
+        if item and not values.get("sample"):
+            values["sample"] = item.sample
+
+        previous = { key: getattr(self, key) for key in values }
+
+        for key, value in values.items():
+            setattr(self, key, value)
+
+        if set_aft:
+            try:
+                self.set_aft()
+            except AquariumModelError:
+                for key, value in previous.items():
+                    setattr(self, key, value)
+                raise
+
+        self.assigned = tuple(dict.fromkeys(self.assigned + tuple(values)))
+
+        return self
+
+    def validate(self, values):
+        if "value" in values:
+            self.validate_value(values["value"])
+
+        if "sample" in values:
+            validate_type("sample", values["sample"], [Sample])
+
+        if "item" in values:
+            sample = values.get("sample", self.sample)
+            validate_sample_and_item(sample, values["item"])
+
+        if "item" in values or "object_type" in values:
+            item = values.get("item", self.item)
+            object_type = values.get("object_type", self.object_type)
+            validate_item_and_container(item, object_type)
+
+    def validate_value(self, value):
+        if value is not None:
+            choices = self.field_type.get_choices()
+            if choices is not None and value not in choices and str(value) not in choices:
+                msg = "Value '{}' not in list of field type choices '{}'"
+                raise AquariumModelError(msg.format(value, choices))
+
+        try:
+            json.dumps(value)
+        except TypeError as e:
+            msg = "Cannot set value '{}'. Value is not json serializable."
+            raise AquariumModelError(msg.format(value)) from e
+
+    def valid_afts(self):
+        afts = self.field_type.allowable_field_types or []
+
+        if self.sample is not None:
+            afts = [a for a in afts if a.sample_type_id == self.sample.sample_type_id]
+
+        if self.object_type is not None:
+            afts = [a for a in afts if a.object_type_id == self.object_type.id]
+
+        if self.item is not None and self.item.object_type_id is not None:
+            afts = [a for a in afts if a.object_type_id == self.item.object_type_id]
+
+        return afts
+
+    def set_aft(self):
+        afts = self.valid_afts()
+
+        if not afts:
+            raise AquariumModelError(self.aft_error_message())
+
+        self.allowable_field_type = afts[0]
+
+    def aft_error_message(self):
+        aft_list = []
+        for aft in self.field_type.allowable_field_types or []:
+            st = aft.sample_type.name if aft.sample_type is not None else "none"
+            ot = aft.object_type.name if aft.object_type is not None else "none"
+            aft_list.append("{}:{}".format(st, ot))
+
+        sid = self.sample.sample_type.name if self.sample is not None else "none"
+        oid = self.object_type.name if self.object_type is not None else "none"
+
+        msg = "No allowable field types found for {}:{}:{} using {}:{}."
+        msg += " Available afts: {}"
+        return msg.format(
+            self.operation.operation_type.name, self.role, self.name,
+            sid, oid, ", ".join(aft_list)
+        )
+
+    def copy_values(self, other):
+        """
+        Copies the values and AllowableFieldType of another FieldValue of
+        the same FieldType, without checking them again.
+
+        :param other: the FieldValue to copy
+        :type other: FieldValueRecord
+        """
+        self.sample = other.sample
+        self.item = other.item
+        self.value = other.value
+        self.object_type = other.object_type
+        self.allowable_field_type = other.allowable_field_type
+        self.assigned = other.assigned
+
+    def summary(self):
+        """Returns the role, name and the ids of the values, as a list."""
+        return [
+            self.role, self.name, model_id(self.sample), model_id(self.item),
+            self.value, model_id(self.object_type), model_id(self.allowable_field_type)
+        ]
+
+    def apply(self, fv):
+        """
+        Copies the assigned values to a pydent FieldValue.
+
+        :param fv: the FieldValue
+        :type fv: FieldValue
+        """
+        if "value" in self.assigned:
+            fv.value = self.value
+
+        if "item" in self.assigned:
+            fv.item = self.item
+            if hasattr(self.item, "id"):
+                fv.child_item_id = self.item.id
+
+        if "sample" in self.assigned:
+            fv.sample = self.sample
+            if hasattr(self.sample, "id"):
+                fv.child_sample_id = self.sample.id
+
+        if "object_type" in self.assigned:
+            fv.object_type = self.object_type
+
+        if self.allowable_field_type:
+            fv.set_allowable_field_type(self.allowable_field_type)
+
+
+def model_id(model):
+    if model is not None: return model.id
+
+def validate_type(name, x, expected_types):
+    if x is not None and not isinstance(x, tuple(expected_types)):
+        msg = "Cannot set FieldValue.{} with a {}. Expected types {}"
+        raise AquariumModelError(msg.format(name, type(x), expected_types))
+
+def validate_sample_and_item(sample, item):
+    if sample and hasattr(sample, "id") and item:
+        if not item.sample_id == sample.id:
+            msg = "Cannot set FieldValue. Item {} is not a member of sample {}"
+            raise AquariumModelError(msg.format(item, sample))
+
+def validate_item_and_container(item, container):
+    validate_type("item", item, [Item, Collection])
+    validate_type("container", container, [ObjectType])
+
+    if item and container and item.object_type_id != container.id:
+        msg = "Item {} is not in container {}"
+        raise AquariumModelError(msg.format(item.id, str(container)))
+
+
+class OperationRecord:
+    """
+    An Operation of a known OperationType, with its FieldValues and position
+    in the Designer. FieldValues are also indexed by role and name.
+    """
+
+    __slots__ = ("operation_type", "x", "y", "field_values", "index", "field_types", "model")
+
+    def __init__(self, operation_type, x=0, y=0, field_types=None):
+        """
+        Creates one FieldValue for each non-array FieldType, as
+        `OperationType.instance` does.
+
+        :param operation_type: the OperationType
+        :type operation_type: OperationType
+        :param x: the x coordinate
+        :type x: int
+        :param y: the y coordinate
+        :type y: int
+        :param field_types: the FieldTypes of the OperationType keyed by
+            (role, name), if already indexed; shared, not copied
+        :type field_types: dict
+        :return: new OperationRecord
+        """
+        if field_types is None:
+            field_types = {}
+            for ft in operation_type.field_types:
+                field_types.setdefault((ft.role, ft.name), ft)
+
+        self.operation_type = operation_type
+        self.field_types = field_types
+        self.x = x
+        self.y = y
+        self.model = None
+        self.field_values = []
+        self.index = {}
+
+        for ft in operation_type.field_types:
+            if not ft.array:
+                self.add_field_value(FieldValueRecord(self, ft))
+
+    def add_field_value(self, fv):
+        self.field_values.append(fv)
+        self.index.setdefault((fv.role, fv.name), []).append(fv)
+        return fv
+
+    def copy_field_values(self, other, field_type):
+        """
+        Copies the FieldValues of one FieldType from another Operation of
+        the same OperationType, adding FieldValues where the other has more.
+
+        :param other: the Operation to copy from
+        :type other: OperationRecord
+        :param field_type: the FieldType
+        :type field_type: FieldType
+        """
+        key = (field_type.role, field_type.name)
+        fvs = self.index.get(key, [])
+
+        for i, other_fv in enumerate(other.index.get(key, [])):
+            if i < len(fvs):
+                fv = fvs[i]
+            else:
+                fv = self.add_field_value(FieldValueRecord(self, field_type))
+            fv.copy_values(other_fv)
+
+    def content_hash(self):
+        """
+        Returns a hash of the OperationType and the values of the
+        FieldValues, but not the position. Two Operations built from the
+        same inputs have the same hash.
+
+        :return: str
+        """
+        data = [self.operation_type.id, [fv.summary() for fv in self.field_values]]
+        data = json.dumps(data, default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def field_value_array(self, name, role):
+        return list(self.index.get((role, name), []))
+
+    def field_values_named(self, names, role):
+        """
+        Returns the FieldValues with role and any of the names, in the order
+        they were added.
+
+        :param names: the names of the FieldValues
+        :type names: list
+        :param role: "input" or "output"
+        :type role: str
+        :return: list
+        """
+        matches = [self.index[(role, n)] for n in names if (role, n) in self.index]
+
+        if len(matches) == 1:
+            return list(matches[0])
+
+        fvs = [fv for m in matches for fv in m]
+        fvs.sort(key=self.field_values.index)
+        return fvs
+
+    def field_value(self, name, role):
+        """Returns the FieldValue with name and role, or None if not found."""
+        fvs = self.field_value_array(name, role)
+
+        if len(fvs) > 1:
+            msg = "More than one FieldValue found for {}.{}.{}"
+            raise AquariumModelError(msg.format(self.operation_type.name, role, name))
+
+        if fvs: return fvs[0]
+
+    def input(self, name):
+        return self.field_value(name, "input")
+
+    def output(self, name):
+        return self.field_value(name, "output")
+
+    def input_array(self, name):
+        return self.field_value_array(name, "input")
+
+    def output_array(self, name):
+        return self.field_value_array(name, "output")
+
+    def set_input(self, name, sample=None, item=None, value=None, container=None):
+        values = dict(sample=sample, item=item, value=value, object_type=container)
+        return self.set_field_value(name, "input", values)
+
+    def set_output(self, name, sample=None, item=None, value=None, container=None):
+        values = dict(sample=sample, item=item, value=value, object_type=container)
+        return self.set_field_value(name, "output", values)
+
+    def set_field_value(self, name, role, values):
+        """
+        Assigns values to the FieldValue with name and role, adding a
+        FieldValue if the FieldType is an array with none yet.
+
+        :return: FieldValueRecord
+        """
+        fv = self.field_value(name, role)
+
+        if not fv:
+            field_type = self.field_type(name, role)
+            if not field_type:
+                msg = "No FieldType found for {}.{}.{}"
+                raise AquariumModelError(msg.format(self.operation_type.name, role, name))
+
+            fv = self.add_field_value(FieldValueRecord(self, field_type))
+
+        return fv.set_value(**values)
+
+    def field_type(self, name, role):
+        return self.field_types.get((role, name))
+
+
+class WireRecord:
+    """A Wire between an output and an input FieldValue."""
+
+    __slots__ = ("source", "destination")
+
+    def __init__(self, source, destination):
+        self.source = source
+        self.destination = destination
+
+
+class SpatialIndex:
+    """
+    The positions of Operations, for finding the rightmost Operation on or
+    above a row. A Fenwick tree over the rows, in which each node holds the
+    largest x of a range of rows, so that adding an Operation and finding
+    the rightmost x above a row each visit at most Y_BITS nodes. Nodes are
+    kept in a dict, since only the rows that are used have any.
+    """
+
+    # Rows from -2 ** (Y_BITS - 1) up to 2 ** (Y_BITS - 1) - 1 can be indexed
+    Y_BITS = 32
+
+    def __init__(self):
+        self.max_xs = {}
+
+    def node(self, y):
+        """Returns the 1-based index of a row in the tree."""
+        i = y + 2 ** (self.Y_BITS - 1) + 1
+        if not 0 < i <= 2 ** self.Y_BITS:
+            raise ValueError("Row out of range: {}".format(y))
+        return i
+
+    def add(self, x, y):
+        i = self.node(y)
+
+        while i <= 2 ** self.Y_BITS:
+            current = self.max_xs.get(i)
+            if current is not None and current >= x: break
+
+            self.max_xs[i] = x
+            i += i & -i
+
+    def rightmost_x(self, max_y):
+        """
+        Returns the largest x of the Operations with y <= max_y.
+
+        :param max_y: the lowest row to consider
+        :type max_y: int
+        :return: int, or None if there are no such Operations
+        """
+        if max_y < -2 ** (self.Y_BITS - 1): return None
+
+        i = self.node(min(max_y, 2 ** (self.Y_BITS - 1) - 1))
+        rightmost = None
+
+        while i > 0:
+            x = self.max_xs.get(i)
+            if x is not None and (rightmost is None or x > rightmost):
+                rightmost = x
+            i -= i & -i
+
+        return rightmost
+
+
+class PlanGraph:
+    """
+    The Operations and Wires of a Plan, in the order they were added.
+    """
+
+    def __init__(self):
+        self.operations = []
+        self.wires = []
+        self.positions = SpatialIndex()
+
+    def add_operation(self, operation_type, x=0, y=0, field_types=None):
+        """
+        Adds a new Operation.
+
+        :param operation_type: the OperationType
+        :type operation_type: OperationType
+        :param x: the x coordinate
+        :type x: int
+        :param y: the y coordinate
+        :type y: int
+        :param field_types: the FieldTypes of the OperationType keyed by
+            (role, name), if already indexed
+        :type field_types: dict
+        :return: OperationRecord
+        """
+        op = OperationRecord(operation_type, x, y, field_types)
+        self.operations.append(op)
+        self.positions.add(x, y)
+        return op
+
+    def merge(self, other):
+        """
+        Appends the Operations and Wires of another graph.
+
+        :param other: the graph to append
+        :type other: PlanGraph
+        """
+        for op in other.operations:
+            self.operations.append(op)
+            self.positions.add(op.x, op.y)
+
+        self.wires += other.wires
+
+    def index_positions(self):
+        """Rebuilds the spatial index after Operations have been moved."""
+        self.positions = SpatialIndex()
+        for op in self.operations:
+            self.positions.add(op.x, op.y)
+
+    def add_wire(self, source, destination):
+        wire = WireRecord(source, destination)
+        self.wires.append(wire)
+        return wire
+
+    def fingerprint(self):
+        """
+        Returns a hash of the Operations, their values and the Wires. Two
+        graphs built from the same inputs have the same fingerprint.
+
+        :return: str
+        """
+        index = { id(fv): [i, j] for i, op in enumerate(self.operations)
+                  for j, fv in enumerate(op.field_values) }
+
+        data = {
+            "operations": [
+                [op.operation_type.id, op.x, op.y, [fv.summary() for fv in op.field_values]]
+                for op in self.operations
+            ],
+            "wires": [
+                [index.get(id(w.source)), index.get(id(w.destination))] for w in self.wires
+            ]
+        }
+
+        data = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def materialize_operation(self, record):
+        """
+        Builds the pydent Operation for one record.
+
+        :param record: the Operation record
+        :type record: OperationRecord
+        :return: Operation
+        """
+        op = record.operation_type.instance()
+        op.x = record.x
+        op.y = record.y
+
+        # instance() creates the FieldValues of non-array FieldTypes in
+        # the same order as OperationRecord
+        initialized = iter(op.field_values)
+
+        for fv_record in record.field_values:
+            if fv_record.field_type.array:
+                fv = op.new_field_value(fv_record.name, fv_record.role)
+            else:
+                fv = next(initialized)
+
+            fv_record.apply(fv)
+            fv_record.model = fv
+
+        record.model = op
+        return op
@@ -0,0 +1,102 @@
+"""Local record of the Plans that have been created
+
+After a Plan is created, `PlanManifest` writes the server id of each of its
+Operations, with a hash of the content of the Operation, and the server ids
+of the FieldValues of each Wire, to a file named after the Plan. Running a
+plan with `--update <plan_id>` reads the file to find which Operations and
+Wires of the Plan are unchanged (see `util.plan_update`).
+
+"""
+
+import json
+import os
+
+def manifest_dir():
+    """
+    Directory where manifests are kept. Can be overridden with the
+    MENAGERIE_MANIFEST_DIR environment variable.
+
+    :return: str
+    """
+    default_dir = os.path.join(os.path.expanduser("~"), ".menagerie", "manifests")
+    return os.environ.get("MENAGERIE_MANIFEST_DIR") or default_dir
+
+class PlanManifest:
+    """
+    The content hashes of the Operations of one Plan, keyed by server id,
+    and its Wires as pairs of FieldValue ids.
+    """
+
+    def __init__(self, aq_instance, plan_id):
+        """
+        :param aq_instance: the instance of Aquarium the Plan is on
+        :type aq_instance: str
+        :param plan_id: the id of the Plan
+        :type plan_id: int
+        :return: new PlanManifest
+        """
+        self.path = os.path.join(manifest_dir(), "{}-{}.json".format(aq_instance, plan_id))
+        self.data = {
+            "plan_id": plan_id,
+            "operations": {},
+            "wires": []
+        }
+
+    @property
+    def plan_id(self):
+        return self.data["plan_id"]
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Reads the manifest file, if there is one."""
+        if not self.exists(): return
+
+        with open(self.path, 'r') as f:
+            self.data.update(json.load(f))
+
+    def save(self):
+        """Writes the manifest file."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f)
+
+        os.replace(temp_path, self.path)
+
+    def record(self, graph):
+        """
+        Replaces the contents with those of a graph that has been pushed.
+
+        :param graph: the plan graph, bound to the server's models
+        :type graph: PlanGraph
+        """
+        self.data["operations"] = {
+            str(r.model.id): r.content_hash() for r in graph.operations
+        }
+        self.data["wires"] = [
+            [w.source.model.id, w.destination.model.id] for w in graph.wires
+        ]
+
+    def add(self, operation_hashes, wires):
+        """
+        Adds Operations and Wires that were created but not yet recorded.
+
+        :param operation_hashes: content hashes keyed by server id
+        :type operation_hashes: dict
+        :param wires: (from_id, to_id) of each Wire
+        :type wires: list
+        """
+        self.data["operations"].update((str(i), h) for i, h in operation_hashes.items())
+
+        known = self.wires()
+        self.data["wires"] += [list(w) for w in wires if tuple(w) not in known]
+
+    def operation_hash(self, operation_id):
+        return self.data["operations"].get(str(operation_id))
+
+    def wires(self):
+        """Returns the Wires as a set of (from_id, to_id)."""
+        return set(tuple(w) for w in self.data["wires"])
@@ -0,0 +1,399 @@
+"""Pushing a PlanGraph to Aquarium
+
+`PlanPusher` converts the records of a `PlanGraph` to pydent models and
+creates them on the server. By default the whole Plan is created with one
+request, which is the fastest way to create it.
+
+Aquarium has no request that adds many Operations to a Plan that already
+exists: saving the Plan sends all of it again, and drops any Wires that are
+left out. So in batched mode, once the Plan exists, each Operation,
+FieldValue, PlanAssociation and Wire is created with a request of its own
+through the JSON controller. That takes many more requests, but none of
+them grows with the Plan. Progress is written to a `PushJournal` after each
+batch, so that a failed push can be resumed. `util.plan_stream` uses the
+same mode to upload a Plan while it is built.
+
+"""
+
+from util.plan_ir import model_id
+
+class PlanPusher:
+    """
+    Creates the Plan for an ExternalPlan from its graph. After each request,
+    the records are bound to the models that the server returned, so that
+    `record.model.id` is the server id, and the ids are written to the
+    journal.
+    """
+
+    def __init__(self, plan, journal, batch_size=None):
+        """
+        :param plan: the ExternalPlan to push
+        :type plan: ExternalPlan
+        :param journal: the journal for the plan graph, loaded if resuming
+        :type journal: PushJournal
+        :param batch_size: the number of Operations to send per batch; if
+            None, the whole Plan is sent in one request
+        :type batch_size: int
+        :return: new PlanPusher
+        """
+        self.plan = plan
+        self.graph = plan.graph
+        self.aq_plan = plan.aq_plan
+        self.journal = journal
+        self.batch_size = batch_size
+
+        self.pushed_operations = []
+        self.pending_wires = list(enumerate(self.graph.wires))
+        self.n_pushed_wires = 0
+        self.indices = { id(r): i for i, r in enumerate(self.graph.operations) }
+
+    def push(self):
+        """
+        Creates the Plan. In chunked mode, the Plan is first created empty,
+        then each batch of Operations is added together with the Wires whose
+        Operations have both been sent. If the journal shows that part of
+        the Plan was already created, only the rest is sent.
+        """
+        if self.journal.plan_id:
+            self.resume()
+
+        pushed = set(id(r) for r in self.pushed_operations)
+        operations = [r for r in self.graph.operations if id(r) not in pushed]
+
+        if not self.aq_plan.id and (self.batch_size or not operations):
+            self.aq_plan.save()
+            self.journal.record_plan(self.aq_plan.id)
+
+        self.push_operations(operations)
+
+    def add(self, start, records, wires):
+        """
+        Pushes Operations and Wires that were added to the graph after the
+        pusher was created. Wires are sent once both of their Operations
+        have been.
+
+        :param start: the index in the graph of the first record
+        :type start: int
+        :param records: the Operation records, in the order of the graph
+        :type records: list
+        :param wires: (index, WireRecord) for each Wire
+        :type wires: list
+        """
+        self.indices.update((id(r), start + i) for i, r in enumerate(records))
+        self.pending_wires += wires
+        self.push_operations(records)
+
+    def finish(self):
+        """
+        Sends any Wires still held back, and creates the Plan if it has no
+        Operations. Used after the last call to `add`.
+        """
+        if not self.aq_plan.id or self.pending_wires:
+            self.push_batch([])
+
+    def push_operations(self, records):
+        """
+        Sends Operations in batches of self.batch_size, or all at once.
+        Batches after the first cost a few requests per Operation (see the
+        module docstring).
+
+        :param records: the Operation records to send
+        :type records: list
+        """
+        batch_size = self.batch_size or len(records) or 1
+
+        for i in range(0, len(records), batch_size):
+            self.push_batch(records[i:i + batch_size])
+
+            if self.batch_size:
+                self.report_progress()
+
+    def resume(self):
+        """
+        Loads the Plan named in the journal and binds the records that were
+        already created to their Operations. Operations of a batch that
+        failed before they were added to the Plan are added now, and Wires
+        of that batch that were created are not sent again.
+        """
+        session = self.plan.session
+        aq_plan = session.Plan.find(self.journal.plan_id)
+
+        op_ids = [self.journal.server_id("operations", i) for i in range(len(self.graph.operations))]
+        ops = session.Operation.where({ "id": [i for i in op_ids if i] }) if any(op_ids) else []
+        session.browser.retrieve(ops, "field_values")
+        ops_by_id = { op.id: op for op in ops }
+
+        for record, op_id in zip(self.graph.operations, op_ids):
+            op = ops_by_id.get(op_id)
+            if op:
+                bind_operation(record, op)
+                self.pushed_operations.append(record)
+
+        self.plan.aq_plan = self.aq_plan = aq_plan
+
+        associated = set(pa.operation_id for pa in aq_plan.plan_associations or [])
+        self.associate([op for op in ops if op.id not in associated])
+
+        pending = [(i, w) for i, w in self.pending_wires if not self.journal.has("wires", i)]
+        created = self.existing_wires([w for i, w in pending])
+        self.pending_wires = [(i, w) for i, w in pending if wire_ids(w) not in created]
+        self.n_pushed_wires = len(self.graph.wires) - len(self.pending_wires)
+
+        msg = "Resuming Plan {}: {}/{} operations already created"
+        print(msg.format(aq_plan.id, len(self.pushed_operations), len(self.graph.operations)))
+
+    def existing_wires(self, wires):
+        """
+        Finds which of some Wires between Operations that were already
+        created are on the server.
+
+        :param wires: the Wire records
+        :type wires: list
+        :return: set of (from_id, to_id)
+        """
+        to_ids = [model_id(w.destination.model) for w in wires if all(wire_ids(w))]
+        if not to_ids: return set()
+
+        found = self.plan.session.Wire.where({ "to_id": to_ids })
+        return set((w.from_id, w.to_id) for w in found)
+
+    def push_batch(self, records):
+        """
+        Sends one batch of Operations along with the Wires that became ready.
+        If the Plan has not been created yet, it is created with the batch in
+        one request. Otherwise only the new Operations, FieldValues and Wires
+        are created, so that the size of each request does not grow with
+        the Plan.
+
+        :param records: the Operation records to send
+        :type records: list
+        """
+        wires = self.ready_wires(records)
+
+        if self.aq_plan.id:
+            self.add_operations(records)
+            self.add_wires(wires)
+        else:
+            self.create_plan(records, wires)
+
+        self.journal.record("wires", { i: list(wire_ids(w)) for i, w in wires })
+        self.journal.save()
+
+    def create_plan(self, records, wires):
+        """
+        Creates the Plan with its first Operations and the Wires between
+        them in one request.
+
+        :param records: the Operation records to send
+        :type records: list
+        :param wires: (index, WireRecord) for each Wire to send
+        :type wires: list
+        """
+        self.aq_plan.add_operations([self.graph.materialize_operation(r) for r in records])
+        for i, wire in wires:
+            self.aq_plan.wire(wire.source.model, wire.destination.model)
+
+        self.aq_plan.save()
+        self.journal.record_plan(self.aq_plan.id)
+
+        self.pushed_operations += records
+        self.bind_models()
+        self.record_operations(records)
+
+    def add_operations(self, records):
+        """
+        Adds Operations to a Plan that already exists through the JSON
+        controller. Each Operation and its FieldValues are created first,
+        and the Operations are only added to the Plan once their ids are in
+        the journal, so a failed batch never leaves the Plan with
+        Operations that `resume` does not know about.
+
+        :param records: the Operation records to send
+        :type records: list
+        """
+        if not records: return
+
+        utils = self.plan.session.utils
+        user_id = self.plan.session.current_user.id
+        ops = []
+
+        for record in records:
+            op = self.graph.materialize_operation(record)
+            op.user_id = user_id
+            op.id = utils.json_save("Operation", operation_data(op))["id"]
+
+            for fv in op.field_values:
+                fv.parent_id = op.id
+                fv.id = utils.json_save("FieldValue", field_value_data(fv))["id"]
+
+            ops.append(op)
+
+        # The Operations must be in the journal before they are on the Plan
+        self.record_operations(records)
+        self.journal.save()
+
+        self.associate(ops)
+        self.pushed_operations += records
+
+    def record_operations(self, records):
+        self.journal.record_operations(
+            { self.indices[id(r)]: r.model.id for r in records },
+            { self.indices[id(r)]: r.content_hash() for r in records }
+        )
+
+    def associate(self, ops):
+        """
+        Adds Operations that were created on their own to the Plan.
+
+        :param ops: the Operations
+        :type ops: list
+        """
+        for op in ops:
+            self.plan.session.utils.json_save("PlanAssociation", {
+                "plan_id": self.aq_plan.id,
+                "operation_id": op.id
+            })
+
+        self.aq_plan.operations = (self.aq_plan.operations or []) + ops
+
+    def add_wires(self, wires):
+        """
+        Creates Wires between Operations that are already on the server
+        through the JSON controller.
+
+        :param wires: (index, WireRecord) for each Wire to send
+        :type wires: list
+        """
+        for i, wire in wires:
+            self.plan.session.utils.json_save("Wire", {
+                "from_id": model_id(wire.source.model),
+                "to_id": model_id(wire.destination.model),
+                "active": True
+            })
+
+    def ready_wires(self, records):
+        """
+        Removes and returns the pending Wires whose Operations will both have
+        been sent once `records` are.
+
+        :param records: the Operation records about to be sent
+        :type records: list
+        :return: list of (index, WireRecord)
+        """
+        sent = set(id(r) for r in self.pushed_operations + records)
+        ready = []
+        pending = []
+
+        for i, wire in self.pending_wires:
+            ends = [wire.source.operation, wire.destination.operation]
+            if all(id(op) in sent for op in ends):
+                ready.append((i, wire))
+            else:
+                pending.append((i, wire))
+
+        self.pending_wires = pending
+        self.n_pushed_wires += len(ready)
+        return ready
+
+    def bind_models(self):
+        """
+        Points each pushed record at the model the server returned for it.
+        Operations that are new to the server are matched to the records in
+        the order they were sent, which is also the order of their ids.
+        """
+        by_id = {}
+        for record in self.pushed_operations:
+            if record.model.id:
+                by_id[record.model.id] = record
+
+        new_records = [r for r in self.pushed_operations if not r.model.id]
+        new_ops = [op for op in self.aq_plan.operations if op.id not in by_id]
+        new_ops.sort(key=lambda op: op.id)
+
+        for record, op in zip(new_records, new_ops):
+            by_id[op.id] = record
+
+        for op in self.aq_plan.operations:
+            record = by_id.get(op.id)
+            if record: bind_operation(record, op)
+
+    def report_progress(self):
+        msg = "Pushed {}/{} operations and {}/{} wires"
+        print(msg.format(
+            len(self.pushed_operations), len(self.graph.operations),
+            self.n_pushed_wires, len(self.graph.wires)
+        ))
+
+
+def bind_operation(record, op):
+    """
+    Points an Operation record and its FieldValue records at a pydent
+    Operation. FieldValues are matched by role and name, in order.
+
+    :param record: the Operation record
+    :type record: OperationRecord
+    :param op: the Operation
+    :type op: Operation
+    """
+    fvs = {}
+    for fv in sorted(op.field_values or [], key=lambda fv: fv.id or 0):
+        fvs.setdefault((fv.role, fv.name), []).append(fv)
+
+    # The records already hold the related models, which saves loading
+    # them again when the Plan is next saved
+    op.operation_type = record.operation_type
+
+    for fv_record in record.field_values:
+        matches = fvs.get((fv_record.role, fv_record.name))
+        fv = matches.pop(0) if matches else None
+
+        if fv:
+            fv.field_type = fv_record.field_type
+            fv.sample = fv_record.sample
+            fv.item = fv_record.item
+
+        fv_record.model = fv
+
+    record.model = op
+
+def wire_ids(wire):
+    return model_id(wire.source.model), model_id(wire.destination.model)
+
+def operation_data(op):
+    """
+    The attributes of a new Operation, for the JSON controller.
+
+    :param op: the Operation
+    :type op: Operation
+    :return: dict
+    """
+    return {
+        "operation_type_id": op.operation_type_id,
+        "status": op.status,
+        "user_id": op.user_id,
+        "x": op.x,
+        "y": op.y
+    }
+
+def field_value_data(fv):
+    """
+    The attributes of a new FieldValue of an Operation, for the JSON
+    controller.
+
+    :param fv: the FieldValue
+    :type fv: FieldValue
+    :return: dict
+    """
+    return {
+        "parent_class": "Operation",
+        "parent_id": fv.parent_id,
+        "name": fv.name,
+        "role": fv.role,
+        "field_type_id": fv.field_type_id,
+        "allowable_field_type_id": fv.allowable_field_type_id,
+        "child_sample_id": fv.child_sample_id,
+        "child_item_id": fv.child_item_id,
+        "value": fv.value,
+        "row": fv.row,
+        "column": fv.column
+    }
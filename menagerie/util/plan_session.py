@@ -0,0 +1,161 @@
+"""State shared by the Plans built in one process
+
+Every `ExternalPlan` needs a logged-in session, a `Catalog`, the resolved
+OperationTypes of its Legs and a cache of Samples looked up by name. None of
+these depend on the configuration of the Plan, so `PlanSession` holds them
+for any number of Plans on the same instance of Aquarium. A Plan built on its
+own gets a `PlanSession` of its own; `plan_batch.py` builds many Plans with
+one, and creates the Samples that all of them provision before any are
+built, so that Plans built in parallel do not each create the same Sample.
+
+"""
+
+from pydent.exceptions import AquariumModelError
+
+from util.pydent_helper import create_session
+from util.catalog import Catalog
+from util.lookup_cache import LookupCache
+from util.leg_specs import LegSpecRegistry
+
+class PlanSession:
+    """
+    A session for one instance of Aquarium, with the lookup caches that
+    Plans on that instance can share. Safe to use from several threads.
+    """
+
+    def __init__(self, aq_instance, session=None):
+        """
+        :param aq_instance: the instance of Aquarium to use
+            Corresponds to a key in the secrets.json file
+        :type aq_instance: str
+        :param session: a session to use instead of logging in
+        :type session: AqSession
+        :return: new PlanSession
+        """
+        self.aq_instance = aq_instance
+        self.session = session or create_session(aq_instance)
+        self.catalog = Catalog(aq_instance, self.session)
+        self.leg_specs = LegSpecRegistry(self.catalog)
+        self.named_samples = LookupCache(self.fetch_samples_by_name)
+
+    def fetch_samples_by_name(self, names):
+        """
+        Queries the server for all Samples with each of `names`. Used by
+        `self.named_samples`, which should be used for lookups instead.
+
+        :param names: the names of the Samples
+        :type names: list
+        :return: dict of lists of Samples keyed by name
+        """
+        found = { name: [] for name in names }
+        if not names: return found
+
+        for sample in self.session.Sample.where({ 'name': sorted(names) }):
+            found[sample.name].append(sample)
+
+        return found
+
+    def find_or_create_samples(self, sample_specs):
+        """
+        Searches for the Samples for all of `sample_specs` and creates the
+        ones that are not found. The SampleTypes and the existing Samples
+        are each fetched with one query, and the missing Samples are created
+        together, once each has been checked with `Sample.is_savable`, as
+        `Sample.save` would. Raises AquariumModelError if a SampleType is not
+        found or a new Sample is missing a required property.
+
+        :param sample_specs: (sample_type_name, sample_name, properties)
+            for each Sample
+        :type sample_specs: list
+        :return: dict of lists of Samples keyed by (sample_type_name,
+            sample_name)
+        """
+        sample_types = self.catalog.sample_types([s[0] for s in sample_specs])
+        for st_name, st in sample_types.items():
+            if not st:
+                raise AquariumModelError("SampleType not found: {}".format(st_name))
+
+        keys = [(st_name, sample_name) for st_name, sample_name, _ in sample_specs]
+        found = { key: [] for key in keys }
+        if not found: return found
+
+        st_names = { st.id: st_name for st_name, st in sample_types.items() }
+        aq_samples = self.session.Sample.where({
+            'name': sorted(set(key[1] for key in keys)),
+            'sample_type_id': sorted(st_names)
+        })
+
+        for s in aq_samples:
+            key = (st_names[s.sample_type_id], s.name)
+            s.sample_type = sample_types[key[0]]
+            if key in found: found[key].append(s)
+
+        missing = {}
+        for key, (_, _, properties) in zip(keys, sample_specs):
+            if not found[key]: missing.setdefault(key, properties)
+
+        if missing:
+            new_samples = self.new_samples(missing, sample_types)
+
+            # create_samples does not check the Samples as save does
+            for sample in new_samples.values():
+                sample.is_savable(do_raise=True)
+
+            self.session.utils.create_samples(list(new_samples.values()))
+
+            # Lookups by name made before the Samples existed are out of date
+            self.named_samples.discard(set(key[1] for key in missing))
+
+            for key, s in new_samples.items():
+                found[key] = [s]
+
+        return found
+
+    def new_samples(self, sample_properties, sample_types):
+        """
+        Builds unsaved Samples, resolving all sample-typed properties
+        with one query.
+
+        :param sample_properties: properties keyed by (sample_type_name,
+            sample_name)
+        :type sample_properties: dict
+        :param sample_types: SampleTypes keyed by name
+        :type sample_types: dict
+        :return: dict of Samples keyed by (sample_type_name, sample_name)
+        """
+        prop_names = []
+        for (st_name, _), properties in sample_properties.items():
+            if not properties: continue
+
+            for ft in sample_types[st_name].field_types:
+                prop = properties.get(ft.name)
+                if prop and ft.ftype == 'sample':
+                    prop_names.append(prop)
+
+        prop_samples = {}
+        for name, samples in self.named_samples.get_many(prop_names).items():
+            if samples: prop_samples[name] = samples[0]
+
+        new_samples = {}
+        for (st_name, sample_name), properties in sample_properties.items():
+            st = sample_types[st_name]
+            allowable_properties = {}
+
+            if properties:
+                for ft in st.field_types:
+                    prop = properties.get(ft.name)
+                    if prop:
+                        if ft.ftype == 'sample':
+                            prop = prop_samples.get(prop)
+
+                        allowable_properties[ft.name] = prop
+
+            new_samples[(st_name, sample_name)] = self.session.Sample.new(
+                name=sample_name,
+                project='Added by Menagerie',
+                sample_type_id=st.id,
+                sample_type=st,
+                properties=allowable_properties
+            )
+
+        return new_samples
@@ -0,0 +1,165 @@
+"""Uploading a Plan while it is built
+
+By default a Plan is built completely in memory and only then pushed to
+Aquarium. A `PlanStreamer` instead pushes the graph in the background as it
+grows: whenever a part of the Plan is finished, the Operations and Wires
+added since the last time are put on a bounded queue, and a thread takes
+them off the queue and pushes them with a `PlanPusher`. Wires are held back
+until the Operations at both ends have been created.
+
+Operations must not be changed once they have been submitted, so parts of
+the Plan are only submitted when they are finished (see
+`ExternalPlan.flush`). Finished parts are held until there are enough
+Operations for a batch, so that small parts do not each cost a round of
+requests.
+
+Until the graph is finished its fingerprint is not known, so the journal is
+filed under a key made from the instance, folder and name of the Plan, where
+`unfinished_journal` finds it for `--resume`.
+
+"""
+
+import hashlib
+import os
+import queue
+import threading
+
+from util.plan_push import PlanPusher
+from util.push_journal import PushJournal
+
+# Number of finished parts of the Plan that may wait to be uploaded before
+# building blocks
+DEFAULT_QUEUE_SIZE = 4
+
+# Number of Operations to hold back before uploading, if no batch size is
+# given
+DEFAULT_BATCH_SIZE = 100
+
+class PlanStreamer:
+    """
+    Pushes the graph of an ExternalPlan from a background thread while the
+    rest of the Plan is built. The Operations are created in the order they
+    were added to the graph, so the journal can be used with `--resume` like
+    that of an ordinary push.
+    """
+
+    def __init__(self, plan, batch_size=None, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        :param plan: the ExternalPlan to push
+        :type plan: ExternalPlan
+        :param batch_size: the number of Operations to send at a time;
+            finished parts are held until there are this many
+        :type batch_size: int
+        :param queue_size: the number of finished parts that may wait
+        :type queue_size: int
+        :return: new PlanStreamer
+        """
+        self.graph = plan.graph
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZE
+
+        # The fingerprint is not known until the graph is finished
+        self.journal = PushJournal(plan.aq_instance, journal_key(plan))
+        self.pusher = PlanPusher(plan, self.journal, batch_size)
+
+        self.queue = queue.Queue(queue_size)
+        self.n_operations = 0
+        self.n_wires = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, final=False):
+        """
+        Queues whole batches of the Operations added to the graph since they
+        were last queued, with the Wires added since then. Blocks while the
+        queue is full.
+
+        :param final: if True, queue everything that is left
+        :type final: bool
+        """
+        n_ready = len(self.graph.operations) - self.n_operations
+        if not final:
+            n_ready -= n_ready % self.batch_size
+            if not n_ready: return
+
+        operations = self.graph.operations[self.n_operations:self.n_operations + n_ready]
+        wires = list(enumerate(self.graph.wires[self.n_wires:], self.n_wires))
+
+        start = self.n_operations
+        self.n_operations += len(operations)
+        self.n_wires += len(wires)
+
+        if self.error or not (operations or wires): return
+
+        self.queue.put((start, operations, wires))
+
+    def run(self):
+        """
+        Pushes each part from the queue until `finish` is called. After an
+        error, the rest of the queue is discarded.
+        """
+        while True:
+            part = self.queue.get()
+            if part is None: break
+            if self.error: continue
+
+            try:
+                self.pusher.add(*part)
+            except Exception as e:
+                self.error = e
+
+    def finish(self, fingerprint):
+        """
+        Submits the rest of the graph and waits for the upload to finish,
+        then files the journal under the fingerprint of the finished graph.
+        Raises the error that stopped the upload, if any.
+
+        :param fingerprint: the fingerprint of the finished graph
+        :type fingerprint: str
+        """
+        self.submit(final=True)
+        self.queue.put(None)
+        self.thread.join()
+
+        if not self.error:
+            try:
+                self.pusher.finish()
+            except Exception as e:
+                self.error = e
+
+        self.journal.rename(fingerprint)
+
+        if self.error:
+            raise self.error
+
+def journal_key(plan):
+    """
+    The key of the journal of a Plan that is uploaded while it is built.
+
+    :param plan: the ExternalPlan
+    :type plan: ExternalPlan
+    :return: str
+    """
+    source = "\n".join([plan.aq_instance, os.path.abspath(plan.plan_path), plan.aq_plan_name])
+    return "stream-" + hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+def unfinished_journal(plan):
+    """
+    Finds the journal of an upload of the Plan that stopped while the Plan
+    was being built, if the Operations it records are those of the graph,
+    and files it under the fingerprint of the graph.
+
+    :param plan: the ExternalPlan, with its graph finished
+    :type plan: ExternalPlan
+    :return: PushJournal, or None
+    """
+    journal = PushJournal(plan.aq_instance, journal_key(plan))
+    journal.load()
+
+    if not journal.plan_id or not journal.matches(plan.graph):
+        return None
+
+    journal.rename(plan.graph.fingerprint())
+    return journal
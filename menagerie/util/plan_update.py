@@ -0,0 +1,265 @@
+"""Updating a Plan that was already created
+
+`PlanUpdater` changes an existing Plan to match a plan graph that was built
+again after its configuration was edited. Operations are matched to those of
+the Plan by the content hashes in the `PlanManifest` of the Plan, so only
+Operations whose type or values changed are created or removed, and only
+Wires that changed are created or deleted. Unchanged Operations are moved to
+their new positions. Operations that are not in the manifest, such as ones
+added in the Designer, are only removed when asked to.
+
+"""
+
+from pydent.exceptions import AquariumModelError
+
+from util.format_output import warn
+from util.plan_ir import model_id
+from util.plan_push import PlanPusher, bind_operation
+
+class PlanUpdater:
+    """
+    Updates the Plan named in a manifest to match the graph of an
+    ExternalPlan. Operations on the Plan that are not in the manifest,
+    such as ones added in the Designer, are kept unless `force` is set.
+    """
+
+    def __init__(self, plan, manifest, journal, batch_size=None, force=False):
+        """
+        :param plan: the ExternalPlan whose graph the Plan should match
+        :type plan: ExternalPlan
+        :param manifest: the manifest of the Plan to update, loaded
+        :type manifest: PlanManifest
+        :param journal: the journal for the plan graph, loaded if it is of
+            an earlier run of this update
+        :type journal: PushJournal
+        :param batch_size: the number of new Operations to send per request;
+            if None, they are sent at once
+        :type batch_size: int
+        :param force: if True, also remove the Operations that are not in
+            the manifest
+        :type force: bool
+        :return: new PlanUpdater
+        """
+        self.plan = plan
+        self.graph = plan.graph
+        self.session = plan.session
+        self.manifest = manifest
+        self.journal = journal
+        self.batch_size = batch_size
+        self.force = force
+
+    def update(self):
+        """
+        Moves the Operations that are kept, adds the ones that are new, then
+        removes the Operations and Wires that are no longer in the graph.
+        Only what changed is sent; the rest of the Plan is left as it is.
+
+        Each part of the update is sent on its own, so the requests do not
+        grow with the Plan. What has been added is written to the journal.
+        If an update fails partway through, the Plan may have both old and
+        new parts, and running the same update again finishes it: the
+        Operations in the journal are matched like those in the manifest,
+        so nothing is created twice.
+        """
+        aq_plan = self.session.Plan.find(self.manifest.plan_id)
+        if not aq_plan:
+            raise AquariumModelError("Plan not found: {}".format(self.manifest.plan_id))
+
+        ops = (aq_plan.operations or []) + self.adopt_journal(aq_plan)
+        self.session.browser.retrieve(ops, "field_values")
+
+        matched, new, removed, unmanaged = self.match_operations(ops)
+
+        if unmanaged and self.force:
+            removed += unmanaged
+
+        elif unmanaged:
+            msg = "Keeping Operations that menagerie did not add: {}; use --force to remove them"
+            warn(msg.format([op.id for op in unmanaged]))
+
+        started = [op.id for op in removed if op.status != "planning"]
+        if started:
+            msg = "Cannot remove Operations that are no longer planning: {}"
+            raise AquariumModelError(msg.format(started))
+
+        new_wires, stale_wires = self.match_wires()
+        self.move_operations(matched)
+
+        removed_ids = set(op.id for op in removed)
+        aq_plan.operations = [op for op in ops if op.id not in removed_ids]
+        self.plan.aq_plan = aq_plan
+
+        pusher = PlanPusher(self.plan, self.journal, self.batch_size)
+        pusher.pushed_operations = list(matched)
+        pusher.pending_wires = new_wires
+        pusher.push_operations(new)
+        pusher.finish()
+
+        self.delete_wires(stale_wires)
+        self.remove_operations(aq_plan, removed)
+
+        msg = "Updated Plan {}: {} operations kept, {} added, {} removed; {} wires added, {} deleted"
+        print(msg.format(
+            aq_plan.id, len(matched), len(new), len(removed), len(new_wires), len(stale_wires)
+        ))
+
+    def adopt_journal(self, aq_plan):
+        """
+        Adds the Operations and Wires that an earlier run of the same update
+        created before it failed to the manifest, so that they are matched
+        instead of being kept as Operations that menagerie did not add.
+        Operations that were created but not yet added to the Plan are
+        added now.
+
+        :param aq_plan: the Plan
+        :type aq_plan: Plan
+        :return: list of the Operations that were added to the Plan
+        """
+        journal = self.journal
+        if not journal.plan_id:
+            journal.record_plan(aq_plan.id)
+            return []
+
+        hashes = {}
+        for key, op_id in journal.data["operations"].items():
+            hashes[op_id] = journal.data["operation_hashes"].get(key)
+
+        self.manifest.add(hashes, journal.data["wires"].values())
+
+        on_plan = set(op.id for op in aq_plan.operations or [])
+        missing = sorted(i for i in hashes if i not in on_plan)
+        if not missing: return []
+
+        ops = self.session.Operation.where({ "id": missing })
+        for op in ops:
+            self.session.utils.json_save("PlanAssociation", {
+                "plan_id": aq_plan.id,
+                "operation_id": op.id
+            })
+
+        return ops
+
+    def match_operations(self, ops):
+        """
+        Binds each record to an unchanged Operation of the Plan with the same
+        content hash, if there is one. Operations with the same hash are
+        matched in the order they were created.
+
+        :param ops: the Operations of the Plan, with their FieldValues
+        :type ops: list
+        :return: the matched records, the new records, the Operations to
+            remove and the Operations that are not in the manifest
+        """
+        unmatched = {}
+        unmanaged = []
+
+        for op in sorted(ops, key=lambda op: op.id):
+            content_hash = self.manifest.operation_hash(op.id)
+            if content_hash:
+                unmatched.setdefault(content_hash, []).append(op)
+            else:
+                unmanaged.append(op)
+
+        matched = []
+        new = []
+
+        for record in self.graph.operations:
+            candidates = unmatched.get(record.content_hash())
+
+            if candidates:
+                op = candidates.pop(0)
+                bind_operation(record, op)
+                matched.append(record)
+            else:
+                new.append(record)
+
+        removed = []
+        for candidates in unmatched.values():
+            removed += candidates
+
+        return matched, new, removed, unmanaged
+
+    def match_wires(self):
+        """
+        Compares the Wires of the graph with those in the manifest. Must be
+        called after `match_operations`.
+
+        :return: (index, WireRecord) for each Wire to add, and the set of
+            (from_id, to_id) of the Wires to delete
+        """
+        old_wires = self.manifest.wires()
+        kept = set()
+        new_wires = []
+
+        for i, wire in enumerate(self.graph.wires):
+            key = (model_id(wire.source.model), model_id(wire.destination.model))
+            if key in old_wires:
+                kept.add(key)
+            else:
+                new_wires.append((i, wire))
+
+        return new_wires, old_wires - kept
+
+    def delete_wires(self, stale_wires):
+        """
+        Deletes Wires from the server through the JSON controller, which
+        does not depend on the version of pydent having `Wire.delete`.
+
+        :param stale_wires: (from_id, to_id) of each Wire
+        :type stale_wires: set
+        """
+        if not stale_wires: return
+
+        from_ids = sorted(set(f for f, t in stale_wires))
+        wires = self.session.Wire.where({ "from_id": from_ids })
+
+        for wire in wires:
+            if (wire.from_id, wire.to_id) in stale_wires:
+                self.session.utils.json_delete("Wire", { "id": wire.id })
+
+    def move_operations(self, records):
+        """
+        Moves the Operations of matched records to the positions of the
+        records, where they have changed.
+
+        :param records: the matched Operation records
+        :type records: list
+        """
+        for record in records:
+            op = record.model
+            if (op.x, op.y) == (record.x, record.y): continue
+
+            op.x = record.x
+            op.y = record.y
+            self.session.utils.json_save("Operation", { "id": op.id, "x": op.x, "y": op.y })
+
+    def remove_operations(self, aq_plan, ops):
+        """
+        Deletes Operations from the Plan, along with their FieldValues, the
+        Wires that connect them to other Operations and their association
+        with the Plan.
+
+        :param aq_plan: the Plan
+        :type aq_plan: Plan
+        :param ops: the Operations, with their FieldValues
+        :type ops: list
+        """
+        if not ops: return
+
+        utils = self.session.utils
+        op_ids = set(op.id for op in ops)
+        fv_ids = [fv.id for op in ops for fv in op.field_values or []]
+
+        wires = self.session.Wire.where({ "from_id": fv_ids }) + self.session.Wire.where({ "to_id": fv_ids })
+        for wire_id in sorted(set(w.id for w in wires)):
+            utils.json_delete("Wire", { "id": wire_id })
+
+        for pa in aq_plan.plan_associations or []:
+            if pa.operation_id in op_ids:
+                utils.json_delete("PlanAssociation", { "id": pa.id })
+
+        for fv_id in fv_ids:
+            utils.json_delete("FieldValue", { "id": fv_id })
+
+        for op_id in sorted(op_ids):
+            utils.json_delete("Operation", { "id": op_id })
@@ -7,8 +7,9 @@ plans.
 
 import json
 import os
-import copy
+import threading
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 import pydent
 from pydent import models
@@ -16,7 +17,18 @@ from pydent.models import Sample, Item, Plan
 from pydent.exceptions import AquariumModelError
 
 from util.format_output import warn
-from util.pydent_helper import create_session
+from util.plan_session import PlanSession
+from util.plan_ir import PlanGraph, OperationRecord
+from util.plan_push import PlanPusher
+from util.plan_stream import PlanStreamer, unfinished_journal
+from util.plan_manifest import PlanManifest
+from util.plan_update import PlanUpdater
+from util.push_journal import PushJournal
+from util.server_inputs import ServerInputs, find_plan_outputs
+from util.operation_defaults import OperationDefaults
+from util.layout import layered_layout
+from util.leg_specs import OperationSpec
+from util.leg_prototypes import LegPrototypes
 
 def get_obj_by_name(leg, name):
     return get_obj_by_attr(leg, "name", name)
@@ -32,9 +44,12 @@ class ExternalPlan(metaclass=ABCMeta):
     it also creates and manages other objects, including `PlanStep`,
     `Transformation`, and `Leg`.
     """
-    def __init__(self, plan_path, aq_instance, aq_plan_name=None):
+    def __init__(self, plan_path, aq_instance, aq_plan_name=None, plan_session=None):
         """
-        1. Creates a session from stored secrets
+        1. Creates a session from stored secrets, a Catalog for
+            looking up OperationTypes, SampleTypes and ObjectTypes, and a
+            cache of Samples looked up by name, or takes them from
+            `plan_session`, then loads the OperationTypes of all Legs
         2. Creates a new Plan in the session
         3. Reads in several JSON files for configuring the plan
         4. Populates self.defaults with found samples
@@ -49,19 +64,44 @@ class ExternalPlan(metaclass=ABCMeta):
         :param aq_plan_name: the name to assign to the Aquarium Plan, if you
             wish it to be different
         :type aq_plan_name: str
+        :param plan_session: the session and lookup caches to share with
+            other Plans; if None, new ones are created
+        :type plan_session: PlanSession
         :return: new ExternalPlan
         """
-        self.session = create_session(aq_instance)
+        plan_session = plan_session or PlanSession(aq_instance)
+
+        self.aq_instance = aq_instance
+        self.plan_session = plan_session
+        self.session = plan_session.session
+        self.catalog = plan_session.catalog
+        self.leg_specs = plan_session.leg_specs
+        self.named_samples = plan_session.named_samples
+
+        # Prototypes depend on the defaults of this Plan, so are not shared
+        self.leg_prototypes = LegPrototypes()
+        self.prefetch_operation_types()
 
         self.plan_path = plan_path
         self.aq_plan_name = aq_plan_name or os.path.split(plan_path)[1]
         self.aq_plan = Plan(name=self.aq_plan_name)
         self.aq_plan.connect_to_session(self.session)
+        self.graph = PlanGraph()
+
+        # What the lookups made while building returned, for BuildCache
+        self.server_inputs = ServerInputs()
+
+        # Number of threads for building the independent parts of a step
+        self.jobs = 1
+        self.build_context = threading.local()
+
+        # Uploads the Plan while it is built, if started with start_upload
+        self.streamer = None
 
         self.steps = []
         self.input_samples = {}
         self.input_items = {}
-        self.temp_data_associations = []
+        self.temp_data_associations = {}
 
         self.plan = self.load_json_from_file('plan.json')
 
@@ -69,6 +109,7 @@ class ExternalPlan(metaclass=ABCMeta):
         self.operation_defaults = self.aq_defaults.get("operation_defaults", [])
         self.defaults = self.operation_defaults
         self.populate_from_database()
+        self.index_defaults()
 
         self.plan_params = self.load_json_from_file("params.json")
         self.load_inputs_from_params()
@@ -100,6 +141,18 @@ class ExternalPlan(metaclass=ABCMeta):
         if step_type == "provision":
             return ProvisionStep(self, step_data)
 
+    def prefetch_operation_types(self):
+        """
+        Loads the OperationTypes used by every registered `Leg` subclass
+        into the Catalog at once, so that creating Operations does not
+        require a query per Operation.
+        """
+        names = set()
+        for leg_class in Leg.subclasses():
+            names.update(leg_class.operation_type_names())
+
+        self.catalog.prefetch_operation_types(sorted(names))
+
     def load_json_from_file(self, file_name):
         """
         Loads a file in the plan config path as a JSON object.
@@ -116,39 +169,84 @@ class ExternalPlan(metaclass=ABCMeta):
         """
         Parses part of aquarium_defaults.json and finds corresponding
         records in Aq. Populates the data structure populated with
-        the records.
+        the records. The unique Sample and ObjectType names are collected
+        first, so that each kind of record is fetched in one query.
         """
+        sample_data = []
+        ot_data = []
+
         for d in self.operation_defaults:
             for role in ["input", "output"]:
                 for io_data in d.get(role, {}).values():
-                    sample_data = io_data.get("sample", [])
-                    for s in sample_data:
-                        sample_name = s.get("name")
-                        if sample_name:
-                            try:
-                                sample = self.session.Sample.find_by_name(sample_name)
-                                if sample:
-                                    s["sample"] = sample
-                                else:
-                                    raise InputError("Sample not found: {}".format(sample_name))
-                            except InputError as e:
-                                warn(e.message)
-
-                    ot_data = io_data.get("object_type", [])
-                    for o in ot_data:
-                        ot_name = o.get("name")
-                        if ot_name:
-                            try:
-                                object_type = self.session.ObjectType.find_by_name(ot_name)
-                                if object_type:
-                                    o["object_type"] = object_type
-                                else:
-                                    raise InputError("ObjectType not found: {}".format(ot_name))
-                            except InputError as e:
-                                warn(e.message)
+                    sample_data += [s for s in io_data.get("sample", []) if s.get("name")]
+                    ot_data += [o for o in io_data.get("object_type", []) if o.get("name")]
+
+        samples = self.find_samples_by_name([s["name"] for s in sample_data])
+        object_types = self.catalog.object_types([o["name"] for o in ot_data])
+
+        for s in sample_data:
+            sample_name = s["name"]
+            try:
+                sample = samples.get(sample_name)
+                if sample:
+                    s["sample"] = sample
+                else:
+                    raise InputError("Sample not found: {}".format(sample_name))
+            except InputError as e:
+                warn(e.message)
+
+        for o in ot_data:
+            ot_name = o["name"]
+            try:
+                object_type = object_types.get(ot_name)
+                if object_type:
+                    o["object_type"] = object_type
+                else:
+                    raise InputError("ObjectType not found: {}".format(ot_name))
+            except InputError as e:
+                warn(e.message)
+
+
+    def index_defaults(self):
+        """
+        Indexes self.defaults by OperationType name. As with
+        `get_obj_by_name`, the first entry for a name is used.
+        """
+        self.defaults_by_name = {}
+        for od in self.defaults:
+            self.defaults_by_name.setdefault(od["name"], od)
+
+    def defaults_for(self, name):
+        """
+        Returns a view of the defaults for an OperationType that can be
+        changed without affecting the defaults of other Operations.
+
+        :param name: the name of the OperationType
+        :type name: str
+        :return: OperationDefaults, or None if there are no defaults
+        """
+        od = self.defaults_by_name.get(name)
+        if od is not None: return OperationDefaults(od)
 
     def load_inputs_from_params(self):
         params_inputs = self.plan_params.pop('input_samples', {})
+
+        # Gather the ids and names of all Samples so that they can be
+        # fetched together
+        aq_ids = []
+        for key, sample_data in params_inputs.items():
+            if key == "library_composition":
+                aq_ids += sample_data["components"]
+            elif key in ["plan_outputs", "items"]:
+                continue
+            elif isinstance(sample_data, list):
+                aq_ids += sample_data
+            else:
+                aq_ids.append(sample_data)
+
+        found_samples = self.find_input_samples(aq_ids)
+        self.resolve_sample_types(found_samples.values())
+
         # Find existing input samples specified in the params.json file
         for key, sample_data in params_inputs.items():
             # Special case:
@@ -158,7 +256,7 @@ class ExternalPlan(metaclass=ABCMeta):
                 component_samples = []
 
                 for sid in sample_ids:
-                    component_samples.append(self.find_input_sample(sid))
+                    component_samples.append(found_samples[sid])
 
                 sample_data["components"] = component_samples
                 self.add_input_sample(key, sample_data)
@@ -166,14 +264,13 @@ class ExternalPlan(metaclass=ABCMeta):
             # Special case:
             # Collect all of the outputs of an already-run Plan.
             elif key == "plan_outputs":
-                plan = self.session.Plan.find(sample_data["plan_id"])
-                ops = plan.operations
-
                 ot_name = sample_data["operation_type"]
-                ops = [op for op in ops if op.operation_type.name == ot_name]
+                lookup = (sample_data["plan_id"], ot_name, sample_data["output"])
+                outputs = find_plan_outputs(self.session, *lookup)
+                self.server_inputs.record_plan_outputs(*lookup, outputs)
+                self.resolve_sample_types([item for op, item in outputs if item])
 
-                for op in ops:
-                    item = op.output(sample_data["output"]).item
+                for op, item in outputs:
                     if item:
                         self.add_input_sample(op.id, item)
                     else:
@@ -183,6 +280,8 @@ class ExternalPlan(metaclass=ABCMeta):
             # A list of items
             elif key == "items":
                 items = self.session.Item.find(sample_data)
+                self.session.browser.retrieve(items, "sample")
+                self.resolve_sample_types(items)
                 for item in items:
                     self.add_input_sample(item.id, item.sample)
                     self.add_input_item(item.id, item)
@@ -192,13 +291,13 @@ class ExternalPlan(metaclass=ABCMeta):
                 found_input = []
 
                 for d in sample_data:
-                    found_input.append(self.find_input_sample(d))
+                    found_input.append(found_samples[d])
 
                 self.add_input_sample(key, found_input)
 
             # A single Sample.
             else:
-                found_input = self.find_input_sample(sample_data)
+                found_input = found_samples[sample_data]
                 if found_input:
                     self.add_input_sample(key, found_input)
 
@@ -215,35 +314,30 @@ class ExternalPlan(metaclass=ABCMeta):
         :type properties: dict
         :return: list
         """
-        st = self.session.SampleType.where({ 'name': sample_type_name })[0]
-        aq_samples = self.session.Sample.where({
-            'name': sample_name,
-            'sample_type_id': st.id
-        })
+        spec = (sample_type_name, sample_name, properties)
+        return self.find_or_create_samples([spec])[0]
 
-        if not aq_samples:
-            allowable_properties = {}
-
-            if properties:
-                for ft in st.field_types:
-                    prop = properties.get(ft.name)
-                    if prop:
-                        if ft.ftype == 'sample':
-                            prop = self.session.Sample.find_by_name(prop)
-
-                        allowable_properties[ft.name] = prop
-
-            s = self.session.Sample.new(
-                name=sample_name,
-                project='Added by Menagerie',
-                sample_type_id=st.id,
-                properties=allowable_properties
-            )
+    def find_or_create_samples(self, sample_specs):
+        """
+        Bulk version of `get_samples`. Searches for the Samples for all of
+        `sample_specs` and creates the ones that are not found, with
+        `PlanSession.find_or_create_samples`.
+
+        :param sample_specs: (sample_type_name, sample_name, properties)
+            for each Sample
+        :type sample_specs: list
+        :return: list of lists of Samples, in the order of sample_specs
+        """
+        sample_types = self.catalog.sample_types([s[0] for s in sample_specs])
+        for st_name, st in sample_types.items():
+            if not st:
+                raise InputError("SampleType not found: {}".format(st_name))
 
-            s.save()
-            aq_samples = [s]
+        found = self.plan_session.find_or_create_samples(sample_specs)
+        self.server_inputs.record_typed_samples(found)
 
-        return aq_samples
+        keys = [(st_name, sample_name) for st_name, sample_name, _ in sample_specs]
+        return [found[key] for key in keys]
 
     def get_steps_by_type(self, type, sorted_by_id=True):
         """
@@ -282,48 +376,202 @@ class ExternalPlan(metaclass=ABCMeta):
         """
         return next(s for s in self.steps if s.step_id == step_id)
 
-    def create_aq_plan(self):
-        """Creates the Plan."""
-        self.aq_plan.create()
+    def auto_layout(self):
+        """
+        Replaces the positions chosen while the Plan was built with a
+        layered layout of the Operations and Wires in self.graph.
+        """
+        layered_layout(self.graph)
+
+    def create_aq_plan(self, batch_size=None, resume=False, plan_id=None, force=False):
+        """
+        Converts the Operations and Wires in self.graph to pydent models,
+        then creates the Plan, or updates an existing one. The server ids
+        are written to a journal as they are created, and to a manifest of
+        the Plan once it is finished.
+
+        :param batch_size: if given, the Plan is created empty and the
+            Operations are sent in batches of this size
+        :type batch_size: int
+        :param resume: if True, finish the Plan recorded in the journal of
+            an earlier run that failed partway through
+        :type resume: bool
+        :param plan_id: if given, update this Plan, which must have been
+            created by menagerie, instead of creating a new one
+        :type plan_id: int
+        :param force: when updating, also remove the Operations of the Plan
+            that menagerie did not add
+        :type force: bool
+        """
+        # If the upload was started with start_upload, this waits for it
+        if self.streamer:
+            self.journal = self.streamer.journal
+            self.streamer.finish(self.graph.fingerprint())
+
+        elif plan_id:
+            manifest = PlanManifest(self.aq_instance, plan_id)
+            if not manifest.exists():
+                raise InputError("No manifest found for Plan {}; it can only be recreated".format(plan_id))
+
+            manifest.load()
+
+            # Finishes an earlier run of the same update that failed
+            self.journal = PushJournal(self.aq_instance, self.graph.fingerprint())
+            self.journal.load()
+            if self.journal.plan_id != plan_id:
+                self.journal = PushJournal(self.aq_instance, self.graph.fingerprint())
+
+            PlanUpdater(self, manifest, self.journal, batch_size, force).update()
+
+        else:
+            self.journal = PushJournal(self.aq_instance, self.graph.fingerprint())
+
+            if resume:
+                self.journal.load()
+                if not self.journal.plan_id:
+                    self.journal = unfinished_journal(self) or self.journal
+                if not self.journal.plan_id:
+                    warn("No unfinished push found for this plan; creating a new Plan")
+
+            PlanPusher(self, self.journal, batch_size).push()
+
+        manifest = PlanManifest(self.aq_instance, self.aq_plan.id)
+        manifest.record(self.graph)
+        manifest.save()
+
+    def start_upload(self, batch_size=None):
+        """
+        Starts creating the Plan in the background while it is built. Parts
+        of the graph are uploaded as they are finished (see `flush`), and
+        `create_aq_plan` waits for the rest. Cannot be used with
+        `auto_layout` or with `resume`.
+
+        :param batch_size: the number of Operations to send at a time
+        :type batch_size: int
+        """
+        self.streamer = PlanStreamer(self, batch_size)
+        self.streamer.start()
+
+    def flush(self):
+        """
+        Marks the Operations added so far as finished. If the Plan is being
+        uploaded while it is built, they are queued for upload, and must
+        not be changed afterwards; Wires to them can still be added.
+        """
+        if self.streamer:
+            self.streamer.submit()
 
     def add_wires(self, wires):
         for src, dst in wires:
             self.add_wire(src, dst)
 
     def add_wire(self, src, dst):
-        self.aq_plan.wire(src, dst)
+        self.current_graph().add_wire(src, dst)
+
+    def current_graph(self):
+        """
+        Returns the graph that Legs add to: the graph of the task running
+        in this thread under `build_parallel`, or else self.graph.
+
+        :return: PlanGraph
+        """
+        return getattr(self.build_context, "graph", None) or self.graph
+
+    def build_parallel(self, tasks):
+        """
+        Runs tasks that each build an independent part of the Plan. If
+        self.jobs is more than 1, the tasks run in a pool of that many
+        threads, each adding to its own graph, and the graphs are merged
+        into self.graph in the order of `tasks`. The Plan is then the same
+        as if the tasks had run one after another.
+
+        Tasks must not read Operations that other tasks add, and should
+        return anything else they produce rather than storing it. The
+        Operations of each task are flushed once it is finished.
+
+        :param tasks: functions that take no arguments
+        :type tasks: list
+        :return: list of the return values of the tasks, in order
+        """
+        if self.jobs <= 1 or len(tasks) < 2:
+            results = []
+            for task in tasks:
+                results.append(task())
+                self.flush()
+            return results
+
+        def run(task):
+            graph = PlanGraph()
+            self.build_context.graph = graph
+            try:
+                return graph, task()
+            finally:
+                self.build_context.graph = None
+
+        results = []
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for graph, result in pool.map(run, tasks):
+                self.graph.merge(graph)
+                self.flush()
+                self.report_operations()
+                results.append(result)
+
+        return results
+
+    def report_operations(self):
+        print("### " + str(len(self.graph.operations)) + " total operations")
+        print()
 
     def update_temp_data_assoc(self, obj, data_associations):
         """
         Adds to a structure that contains data associations that are to be added
-        to objects in the Plan once it is created.
+        to objects in the Plan once it is created. The structure is keyed by
+        the identity of the object, so adding to it does not search it.
 
         :param obj: the object that the data associations are to be added to
-            can be any object inheriting pydent.models.DataAssociatorMixin
-        :type obj: Collection, Item, Operation, Plan
+            can be any object inheriting pydent.models.DataAssociatorMixin,
+            or an OperationRecord
+        :type obj: Collection, Item, Operation, OperationRecord, Plan
         :param data_associations: the key-value pairs to be added to the temp
         :type data_associations: dict
         """
-        tdas = [a for a in self.temp_data_associations if a['object'] == obj]
-
-        if tdas:
-            tda = tdas[0]
-
-        else:
-            tda = { 'object': obj }
-            self.temp_data_associations.append(tda)
-
+        tda = self.temp_data_associations.setdefault(id(obj), { 'object': obj })
         tda.update(data_associations)
 
     def add_data_associations(self):
         """
         Iterates over self.temp_data_associations and adds each data association
-        to the indicated object.
+        to the indicated object. Associations that the journal shows were
+        already added are skipped. The journal is written once at the end,
+        and removed once all of them have been added.
         """
-        for tda in self.temp_data_associations:
-            obj = tda.pop('object')
-            for key, value in tda.items():
-                obj.associate(key, value)
+        n_added = 0
+
+        try:
+            for i, tda in enumerate(self.temp_data_associations.values()):
+                obj = tda['object']
+                if isinstance(obj, OperationRecord):
+                    obj = obj.model
+
+                for key, value in tda.items():
+                    if key == 'object': continue
+
+                    journal_key = "{}:{}".format(i, key)
+                    if self.journal.has("data_associations", journal_key): continue
+
+                    da = obj.associate(key, value)
+                    self.journal.record("data_associations", { journal_key: da.id })
+                    n_added += 1
+
+        finally:
+            # Written once, with whatever was added if one of them failed
+            self.journal.save()
+
+        if n_added:
+            print("Added {} data associations".format(n_added))
+
+        self.journal.remove()
 
     def find_input_sample(self, aq_id):
         """
@@ -333,10 +581,37 @@ class ExternalPlan(metaclass=ABCMeta):
         :type aq_id: int or str
         :return: Sample
         """
-        if isinstance(aq_id, int):
-            return self.session.Sample.find(aq_id)
-        else:
-            return self.session.Sample.find_by_name(aq_id)
+        return self.find_input_samples([aq_id])[aq_id]
+
+    def find_input_samples(self, aq_ids):
+        """
+        Find several Samples when each attribute can be either id or name.
+        The ids and the names are each fetched with a single query.
+
+        :param aq_ids: the attributes
+        :type aq_ids: list
+        :return: dict of Samples (or None if not found) keyed by attribute
+        """
+        ids = sorted(set(a for a in aq_ids if isinstance(a, int)))
+        names = [a for a in aq_ids if not isinstance(a, int)]
+
+        found = self.find_samples_by_name(names)
+        if ids:
+            found.update({ s.id: s for s in self.session.Sample.find(ids) })
+
+        return { a: found.get(a) for a in aq_ids }
+
+    def find_samples_by_name(self, names):
+        """
+        Find several Samples by name with a single query.
+
+        :param names: the names of the Samples
+        :type names: list
+        :return: dict of Samples keyed by name
+        """
+        found = self.named_samples.get_many(names)
+        self.server_inputs.record_samples(found)
+        return { name: samples[0] for name, samples in found.items() if samples }
 
     def add_input_sample(self, key, sample):
         """
@@ -362,6 +637,44 @@ class ExternalPlan(metaclass=ABCMeta):
         """
         return self.input_samples.get(sample_key)
 
+    def resolve_sample_types(self, objs):
+        """
+        Sets the SampleType of each Sample, or of the Sample of each Item,
+        from the Catalog. SampleTypes that are not cached are fetched in one
+        query, instead of one query per Sample when the attribute is read.
+
+        :param objs: Samples and Items; anything else is ignored
+        :type objs: list
+        """
+        samples = [o.sample if isinstance(o, Item) else o for o in objs]
+        samples = [
+            s for s in samples if isinstance(s, Sample) and s.sample_type_id
+            and not s.is_deserialized("sample_type")
+        ]
+        if not samples: return
+
+        sample_types = self.catalog.sample_types_by_id([s.sample_type_id for s in samples])
+
+        for s in samples:
+            st = sample_types.get(s.sample_type_id)
+            if st: s.sample_type = st
+
+    def sample_type_name(self, obj):
+        """
+        Returns the name of the SampleType of a Sample, or of the Sample of
+        an Item. Use this instead of `sample.sample_type.name`, which queries
+        the server the first time it is read.
+
+        :param obj: the Sample or Item
+        :type obj: Sample or Item
+        :return: str, or None if obj is neither
+        """
+        self.resolve_sample_types([obj])
+        sample = obj.sample if isinstance(obj, Item) else obj
+
+        if isinstance(sample, Sample):
+            return sample.sample_type.name
+
     def report(self):
         ap = self.aq_plan
         url = ap.session.url + "/plans?plan_id={}".format(ap.id)
@@ -396,6 +709,38 @@ class PlanStep:
         self.transformations = []
         self.measurements = []
         self.output_operations = {}
+        self.input_sample_types = None
+        self.inputs_by_sample_type = None
+
+    def add_transformation(self, transformation):
+        """
+        Adds a Transformation to the PlanStep. The index of inputs is built
+        again the next time it is used.
+
+        :param transformation: the Transformation
+        :type transformation: Transformation
+        """
+        self.transformations.append(transformation)
+        self.input_sample_types = None
+        self.inputs_by_sample_type = None
+
+    def index_inputs(self):
+        """
+        Indexes the unique inputs of the PlanStep by the name of their
+        SampleType, resolving each SampleType once.
+        """
+        self.input_sample_types = {}
+        self.inputs_by_sample_type = {}
+
+        for upi in self.uniq_plan_inputs():
+            obj = self.plan.input_sample(upi)
+
+            if not isinstance(obj, (Sample, Item)): continue
+
+            this_st_name = self.plan.sample_type_name(obj)
+
+            self.input_sample_types[upi] = this_st_name
+            self.inputs_by_sample_type.setdefault(this_st_name, []).append(upi)
 
     def get_inputs(self, sample_type_name):
         """
@@ -405,21 +750,23 @@ class PlanStep:
         :type sample_type_name: str
         :return: list
         """
-        sample_type_inputs = []
-
-        for upi in self.uniq_plan_inputs():
-            obj = self.plan.input_sample(upi)
+        if self.inputs_by_sample_type is None:
+            self.index_inputs()
 
-            if isinstance(obj, Sample):
-                this_st_name = obj.sample_type.name
+        return list(self.inputs_by_sample_type.get(sample_type_name, []))
 
-            elif isinstance(obj, Item):
-                this_st_name = obj.sample.sample_type.name
+    def input_sample_type(self, sample_key):
+        """
+        Returns the name of the SampleType of an input of the PlanStep.
 
-            if this_st_name == sample_type_name:
-                    sample_type_inputs.append(upi)
+        :param sample_key: the key of the input
+        :type sample_key: str
+        :return: str, or None if the key is not an input of the PlanStep
+        """
+        if self.input_sample_types is None:
+            self.index_inputs()
 
-        return sample_type_inputs
+        return self.input_sample_types.get(sample_key)
 
     def uniq_plan_inputs(self):
         """Returns a list of unique inputs used throughout the PlanStep."""
@@ -470,11 +817,12 @@ class ProvisionStep(PlanStep):
 
         print("Provisioning {} Samples".format(len(samples)))
 
-        for sample in samples:
+        sample_specs = [(s.get("sample_type"), s["name"], {}) for s in samples]
+        found_samples = self.plan.find_or_create_samples(sample_specs)
+
+        for sample, aq_samples in zip(samples, found_samples):
             sample_name = sample["name"]
-            sample_type = sample.get("sample_type")
             sample_key = sample.get("sample_key", sample_name)
-            aq_samples = self.plan.get_samples(sample_type, sample_name)
 
             if aq_samples:
                 self.plan.add_input_sample(sample_key, aq_samples[0])
@@ -498,7 +846,7 @@ class Transformation:
         for s in self.source:
             if not s.get('sample'):
                 s['sample'] = self.plan.input_sample(self.sample_key(s))
-            s['sample_type'] = s['sample'].sample_type.name
+            s['sample_type'] = self.plan.sample_type_name(s['sample'])
 
         self.destination = self.format(transformation['destination'])
         for d in self.destination:
@@ -554,12 +902,15 @@ class Leg:
     GUI. Generally, new workflows will require the creation of new concrete classes.
     """
 
-    # The oder of OperationTypes
-    leg_order = []
+    # The order of OperationTypes, as a tuple of OperationSpec
+    leg_order = ()
 
     # The list of I/O names that identify the primary sample
     primary_handles = []
 
+    # OperationTypes used by the Leg that are not in leg_order
+    other_operation_types = []
+
     def __init__(self, plan_step, cursor):
         """
         :param plan_step: the PlanStep containing this Leg
@@ -569,7 +920,7 @@ class Leg:
         """
         self.plan_step = plan_step
         self.plan = self.plan_step.plan
-        self.aq_plan = self.plan.aq_plan
+        self.graph = self.plan.current_graph()
         self.session = self.plan.session
         self.cursor = cursor
 
@@ -581,45 +932,45 @@ class Leg:
 
     def add(self, container_opt=None):
         """
-        Sets the input and output for the list of Operations, then adds the
-        operations and wires to the Aq Plan object.
+        Sets the input and output for the list of Operations, which are added
+        to the plan graph as they are created, then adds the wires.
 
         :param container_opt: an option for specifying one of several containers
         :type container_opt: str
         """
         self.create_operations(container_opt)
-        self.aq_plan.add_operations([od["operation"] for od in self.op_data])
 
         for src, dst in self.wires:
-            self.aq_plan.wire(src, dst)
+            self.plan.add_wire(src, dst)
 
-        print("### " + str(len(self.aq_plan.operations)) + " total operations")
-        print()
+        # Legs built in parallel only see the graph of their own task, so
+        # build_parallel reports the total once the graphs are merged
+        if self.graph is self.plan.graph:
+            self.plan.report_operations()
 
     def create_operations(self, container_opt):
         """
         Instantiates operations and places them in self.op_data along with data for
         populating ObjectType fields. Also wires the operations together
-        based on primary sample.
+        based on primary sample. Inputs and outputs that are not overridden
+        in self.sample_io are copied from the prototype of the Leg.
 
         :return: None
         """
+        prototype = self.plan.leg_prototypes.get(self, container_opt)
 
-        for ot_attr in self.leg_order:
-            if isinstance(ot_attr, str):
-                ot_attr = {"name": ot_attr}
-
-            od = copy.deepcopy(get_obj_by_name(self.plan.defaults, ot_attr["name"]))
+        for spec in self.leg_order:
+            od = self.plan.defaults_for(spec.name)
 
             # TODO: Make this a proper warning.
             if not od:
-                warn("Did not find Aquarium defaults for {}".format(ot_attr["name"]))
-                od = {"name": ot_attr["name"]}
+                warn("Did not find Aquarium defaults for {}".format(spec.name))
+                od = OperationDefaults({"name": spec.name})
 
-            od["operation"] = self.initialize_op(ot_attr)
+            od["operation"] = self.initialize_op(spec)
 
             this_io = self.replace_defaults(od)
-            self.set_io(od["operation"], this_io, container_opt)
+            self.copy_io(od["operation"], this_io, prototype, len(self.op_data), container_opt)
             self.op_data.append(od)
 
             if len(self.op_data) > 1:
@@ -629,74 +980,109 @@ class Leg:
 
             self.cursor.decr_y()
 
-    def initialize_op(self, ot_attr):
-
-        ot_attr["deployed"] = True
-        op_types = self.session.OperationType.where(ot_attr)
+    def initialize_op(self, spec):
+        resolved = self.plan.leg_specs.resolve(spec)
 
-        if len(op_types) != 1:
+        if len(resolved.operation_types) != 1:
             msg = "Did not find a unique Operation Type for %s: %s"
-            ots = [ot.category + " > " + ot.name for ot in op_types]
-            warn(msg % (ot_attr["name"], ots))
+            ots = [ot.category + " > " + ot.name for ot in resolved.operation_types]
+            warn(msg % (spec.name, ots))
 
-        op_type = op_types[0]
-        op = op_type.instance()
-        op.x = self.cursor.x
-        op.y = self.cursor.y
-
-        return op
+        return self.graph.add_operation(
+            resolved.operation_type, self.cursor.x, self.cursor.y, resolved.field_types
+        )
 
     def set_io(self, operation, this_io, container_opt):
         """
-        Sets the input and output for an Operation.
+        Sets the input and output for an Operation without a prototype.
+        Leg itself uses copy_io; this is kept for subclasses that call it.
 
         :param operation: the Operation to be set
-        :type operation: Operation
+        :type operation: OperationRecord
         :param this_io: dict of i/o data for an OperationType
             from aquarium_defaults.json
         :type this_io: dict
         :param container_opt: an option for specifying one of several containers
         :type container_opt: str
         """
-
         op_type = operation.operation_type
 
         for ft in op_type.field_types:
             ft_io = this_io.get(ft.role, {}).get(ft.name, {})
+            try:
+                self.set_field_io(operation, ft, ft_io, container_opt)
+            except AquariumModelError as e:
+                warn("%s: %s" % (op_type.name, e))
+
+    def copy_io(self, operation, this_io, prototype, i, container_opt):
+        """
+        Sets the input and output for an Operation by copying them from the
+        prototype of the Leg. Those named in self.sample_io are copied from
+        the variant of the prototype with the same value.
+
+        :param operation: the Operation to be set
+        :type operation: OperationRecord
+        :param this_io: dict of i/o data for an OperationType
+            from aquarium_defaults.json, with self.sample_io applied
+        :type this_io: dict
+        :param prototype: the prototype of the Leg
+        :type prototype: LegPrototype
+        :param i: the index of the Operation in the leg_order
+        :type i: int
+        :param container_opt: an option for specifying one of several containers
+        :type container_opt: str
+        """
+        for ft in operation.operation_type.field_types:
+            if ft.name in self.sample_io:
+                ft_io = this_io.get(ft.role, {}).get(ft.name, {})
+                source, error = prototype.variant(
+                    self, i, ft, ft_io, self.sample_io[ft.name], container_opt
+                )
+            else:
+                source = prototype.operations[i]
+                error = prototype.errors[i].get((ft.role, ft.name))
+
+            operation.copy_field_values(source, ft)
+            if error: warn(error)
 
-            if ft.ftype == 'sample':
-                io_list = ft_io.get("sample")
-                if io_list:
-                    io_object = io_list[0].get("sample")
-                    container = self.choose_container(ft_io, container_opt)
-                    if ft.array and isinstance(io_object, list):
-                        values = [{"sample": s, "container": container} for s in io_object]
-                        try:
-                            self.set_field_value_array(operation, ft.name, ft.role, values)
-                        except AquariumModelError as e:
-                            warn("%s: %s" % (op_type.name, e))
+    def set_field_io(self, operation, ft, ft_io, container_opt):
+        """
+        Sets the input or output for one FieldType of an Operation. Raises
+        AquariumModelError if the values are not valid.
 
+        :param operation: the Operation to be set
+        :type operation: OperationRecord
+        :param ft: the FieldType
+        :type ft: FieldType
+        :param ft_io: i/o data for the FieldType from aquarium_defaults.json
+        :type ft_io: dict
+        :param container_opt: an option for specifying one of several containers
+        :type container_opt: str
+        """
+        if ft.ftype == 'sample':
+            io_list = ft_io.get("sample")
+            if io_list:
+                io_object = io_list[0].get("sample")
+                container = self.choose_container(ft_io, container_opt)
+                if ft.array and isinstance(io_object, list):
+                    values = [{"sample": s, "container": container} for s in io_object]
+                    self.set_field_value_array(operation, ft.name, ft.role, values)
+
+                else:
+                    if isinstance(io_object, Item):
+                        sample = None
+                        item = io_object
                     else:
-                        if isinstance(io_object, Item):
-                            sample = None
-                            item = io_object
-                        else:
-                            sample = io_object
-                            item = None
-
-                        try:
-                            self.set_field_value(operation, ft.name, ft.role, sample=sample, item=item, container=container)
-                        except AquariumModelError as e:
-                            warn("%s: %s" % (op_type.name, e))
+                        sample = io_object
+                        item = None
 
-            else:
-                io_list = ft_io.get("value")
-                if io_list:
-                    io_object = io_list[0].get("value")
-                    try:
-                        self.set_field_value(operation, ft.name, ft.role, value=io_object)
-                    except AquariumModelError as e:
-                        warn("%s: %s" % (op_type.name, e))
+                    self.set_field_value(operation, ft.name, ft.role, sample=sample, item=item, container=container)
+
+        else:
+            io_list = ft_io.get("value")
+            if io_list:
+                io_object = io_list[0].get("value")
+                self.set_field_value(operation, ft.name, ft.role, value=io_object)
 
     def choose_container(self, io_data, container_opt=None):
         """
@@ -736,21 +1122,22 @@ class Leg:
             raise InputError("Unrecognized role: " + role)
 
     def replace_defaults(self, od):
-        for role in ["input", "output"]:
-            for name, replacement in self.sample_io.items():
-                role_defaults = od.get(role, {})
+        """
+        Overrides the defaults of inputs and outputs that are named in
+        self.sample_io. Only roles that have defaults are overridden.
 
-                if not role_defaults.get(name):
-                    role_defaults[name] = {}
+        :param od: the defaults for an Operation
+        :type od: OperationDefaults
+        :return: OperationDefaults
+        """
+        for role in ["input", "output"]:
+            if role not in od: continue
 
+            for name, replacement in self.sample_io.items():
                 if isinstance(replacement, Sample):
-                    role_defaults[name]["sample"] = [
-                        { "sample": replacement }
-                    ]
+                    od.override_io(role, name, "sample", [{ "sample": replacement }])
                 else:
-                    role_defaults[name]["value"] = [
-                        { "value": replacement }
-                    ]
+                    od.override_io(role, name, "value", [{ "value": replacement }])
         return od
 
     def wire_ops(self, upstr_op, dnstr_op):
@@ -759,9 +1146,9 @@ class Leg:
         Propagates the sample from the upstream op to the downstream op.
 
         :param upstr_op: the upstream (earlier) Operation
-        :type upstr_op: Operation
+        :type upstr_op: OperationRecord
         :param dnstr_op: the downstream (later) Operation
-        :type dnstr_op: Operation
+        :type dnstr_op: OperationRecord
         """
         src, dst = self.get_wire_pair(upstr_op, dnstr_op)
         self.plan.add_wire(src, dst)
@@ -775,13 +1162,15 @@ class Leg:
         :param upstr_ops: list of upstream (earlier) Operations
         :type upstr_ops: list
         :param dnstr_op: the downstream (later) Operation
-        :type dnstr_op: Operation
+        :type dnstr_op: OperationRecord
         """
-        dnstr_fvs = self.primary_io_array(dnstr_op, "input")
+        dnstr_fvs = {}
+        for fv in self.primary_io_array(dnstr_op, "input"):
+            dnstr_fvs.setdefault(fv.sample.name, fv)
 
         for upstr_op in upstr_ops:
             src = self.primary_io(upstr_op, "output")
-            dst = [fv for fv in dnstr_fvs if fv.sample.name == src.sample.name][0]
+            dst = dnstr_fvs[src.sample.name]
             self.plan.add_wire(src, dst)
 
     # TODO: This method may be redundant
@@ -791,20 +1180,17 @@ class Leg:
         primary input for the downstream Operation to have the same Sample.
 
         :param upstr_op: the upstream (earlier) Operation
-        :type upstr_ops: Operation
+        :type upstr_ops: OperationRecord
         :param dnstr_op: the downstream (later) Operation
-        :type dnstr_op: Operation
+        :type dnstr_op: OperationRecord
         """
         upstr_sample = None
 
         for h in self.primary_handles:
-            try:
-                fv = upstr_op.input(h)
-            except:
-                fv = None
-
-            if fv:
-                upstr_sample = fv.sample
+            # Array inputs have no single Sample to propagate
+            fvs = upstr_op.input_array(h)
+            if len(fvs) == 1:
+                upstr_sample = fvs[0].sample
 
         if upstr_sample:
             for h in self.primary_handles:
@@ -822,9 +1208,9 @@ class Leg:
         of the downstream and upstream Operations, respectively.
 
         :param upstr_op: the upstream (earlier) Operation
-        :type upstr_ops: Operation
+        :type upstr_ops: OperationRecord
         :param dnstr_op: the downstream (later) Operation
-        :type dnstr_op: Operation
+        :type dnstr_op: OperationRecord
         :return: list
         """
         w0 = self.primary_io(upstr_op, "output")
@@ -836,10 +1222,10 @@ class Leg:
         Gets the primary input or output FieldValue for an Operation.
 
         :param op: the Operation
-        :type op: Operation
+        :type op: OperationRecord
         :param role: the role of the FieldValue
         :type role: str
-        :return: FieldValue
+        :return: FieldValueRecord
         """
         fvs = self.primary_io_array(op, role)
         if fvs: return fvs[0]
@@ -849,23 +1235,24 @@ class Leg:
         Gets the list of primary input or output FieldValues for an Operation.
 
         :param op: the Operation
-        :type op: Operation
+        :type op: OperationRecord
         :param role: the role of the FieldValues
         :type role: str
         :return: list
         """
-        return [fv for fv in op.field_values if fv.role == role and fv.name in self.primary_handles]
+        return op.field_values_named(self.primary_handles, role)
 
     def select_op(self, ot_name):
         """
         Returns the operation of a given OperationType from the op_data attribute.
 
-        :param ot_name: the name of the OperationType of the Operation to return
-        :type ot_name: str
-        :return: Operation
+        :param ot_name: the name or spec of the OperationType of the Operation
+            to return
+        :type ot_name: str or OperationSpec
+        :return: OperationRecord
         """
-        if isinstance(ot_name, dict):
-            ot_name = ot_name["name"]
+        if isinstance(ot_name, OperationSpec):
+            ot_name = ot_name.name
 
         selected = [od for od in self.op_data if od["name"] == ot_name]
         if selected: return selected[0]["operation"]
@@ -881,14 +1268,7 @@ class Leg:
     def get_op_by_index(self, i):
         """Returns an Operation from the leg_order based on index."""
         if self.leg_order:
-            ot_attr = self.leg_order[i]
-
-            if isinstance(ot_attr, dict):
-                ot_name = ot_attr["name"]
-            else:
-                ot_name = ot_attr
-
-            return self.select_op(ot_name)
+            return self.select_op(self.leg_order[i].name)
 
     def set_start_date(self, start_date):
         """
@@ -906,6 +1286,25 @@ class Leg:
         """Returns the number of Operations in the Leg."""
         return len(cls.leg_order)
 
+    @classmethod
+    def operation_type_names(cls):
+        """Returns the names of all the OperationTypes used by the Leg."""
+        names = list(cls.other_operation_types)
+
+        for spec in cls.leg_order:
+            names.append(spec.name)
+
+        return names
+
+    @classmethod
+    def subclasses(cls):
+        """Returns all the imported classes that inherit from this one."""
+        found = []
+        for subclass in cls.__subclasses__():
+            found.append(subclass)
+            found.extend(subclass.subclasses())
+        return found
+
 
 class Measurement():
     def __init__(self, plan_step, measurement):
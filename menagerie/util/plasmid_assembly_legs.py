@@ -1,4 +1,5 @@
 from util.plans import Leg, get_obj_by_name
+from util.leg_specs import OperationSpec
 
 class CloningLeg(Leg):
 
@@ -41,12 +42,12 @@ class CloningLeg(Leg):
 
 class GoldenGateLeg(CloningLeg):
 
-    leg_order = [
-        {"name": "Assemble NEB Golden Gate", "category": "Cloning"},
-        {"name": "Transform Cells from Stripwell", "category": "Cloning"},
-        {"name": "Plate Transformed Cells", "category": "Cloning"},
-        {"name": "Check Plate", "category": "Cloning"}
-    ]
+    leg_order = (
+        OperationSpec("Assemble NEB Golden Gate", "Cloning"),
+        OperationSpec("Transform Cells from Stripwell", "Cloning"),
+        OperationSpec("Plate Transformed Cells", "Cloning"),
+        OperationSpec("Check Plate", "Cloning")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -63,12 +64,12 @@ class GoldenGateLeg(CloningLeg):
 
 class GibsonLeg(CloningLeg):
 
-    leg_order = [
-        {"name": "Assemble Plasmid", "category": "Cloning"},
-        {"name": "Transform Cells", "category": "Cloning"},
-        {"name": "Plate Transformed Cells", "category": "Cloning"},
-        {"name": "Check Plate", "category": "Cloning"}
-    ]
+    leg_order = (
+        OperationSpec("Assemble Plasmid", "Cloning"),
+        OperationSpec("Transform Cells", "Cloning"),
+        OperationSpec("Plate Transformed Cells", "Cloning"),
+        OperationSpec("Check Plate", "Cloning")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -76,17 +77,17 @@ class GibsonLeg(CloningLeg):
     def set_sample_io(self, source, destination):
         self.set_sample_outputs(destination)
         self.set_sample_inputs(source) # This needs to be set after outputs.
-        self.sample_io["Comp Cells"] = self.session.Sample.where({"name": "DH5alpha"})[-1]
+        self.sample_io["Comp Cells"] = self.plan.named_samples.get("DH5alpha")[-1]
 
 
 class SangerSeqLeg(CloningLeg):
 
-    leg_order = [
-        {"name": "Make Overnight Suspension", "category": "Cloning"},
-        {"name": "Make Miniprep", "category": "Cloning"},
-        {"name": "Send to Sequencing", "category": "Cloning"},
-        {"name": "Upload Sequencing Results", "category": "Cloning"}
-    ]
+    leg_order = (
+        OperationSpec("Make Overnight Suspension", "Cloning"),
+        OperationSpec("Make Miniprep", "Cloning"),
+        OperationSpec("Send to Sequencing", "Cloning"),
+        OperationSpec("Upload Sequencing Results", "Cloning")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -97,12 +98,14 @@ class SangerSeqLeg(CloningLeg):
 
 class PCRLeg(CloningLeg):
 
-    leg_order = [
-        {"name": "Make PCR Fragment", "category": "Cloning"},
-        {"name": "Run Gel", "category": "Cloning"},
-        {"name": "Extract Gel Slice", "category": "Cloning"},
-        {"name": "Purify Gel Slice", "category": "Cloning"}
-    ]
+    leg_order = (
+        OperationSpec("Make PCR Fragment", "Cloning"),
+        OperationSpec("Run Gel", "Cloning"),
+        OperationSpec("Extract Gel Slice", "Cloning"),
+        OperationSpec("Purify Gel Slice", "Cloning")
+    )
+
+    other_operation_types = ["Pour Gel"]
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -112,20 +115,13 @@ class PCRLeg(CloningLeg):
         self.cursor.return_y()
         self.cursor.incr_x()
 
-        pour_gel_ot = self.session.OperationType.where({
-            "name": "Pour Gel",
-            "category": "Cloning",
-            "deployed": True
-        })
-        pour_gel = pour_gel_ot[0].instance()
-        pour_gel.x = self.cursor.x
-        pour_gel.y = self.cursor.y
+        pour_gel_ot = self.plan.catalog.operation_types("Pour Gel", "Cloning")
+        pour_gel = self.graph.add_operation(pour_gel_ot[0], self.cursor.x, self.cursor.y)
 
         run_gel = get_obj_by_name(self.op_data, "Run Gel")["operation"]
         src = pour_gel.output("Lane")
         dst = run_gel.input("Gel")
 
-        self.aq_plan.add_operations([pour_gel])
         self.plan.add_wire(src, dst)
 
 
@@ -146,15 +142,15 @@ class YeastTransformationLeg(CloningLeg):
         "Digested Plasmid"
     ]
 
-    leg_order = [
-        {"name": "Plasmid Digest", "category": "Yeast"},
-        {"name": "Yeast Transformation", "category": "Yeast"},
-        {"name": "Check Yeast Plate", "category": "Yeast"},
-        {"name": "Streak on Media Plate", "category": "Library Cloning"},
-        {"name": "Check Divided Yeast Plate", "category": "Yeast"},
-        {"name": "Yeast Overnight Suspension from Collection", "category": "Yeast"},
-        {"name": "Yeast Glycerol Stock", "category": "Yeast"}
-    ]
+    leg_order = (
+        OperationSpec("Plasmid Digest", "Yeast"),
+        OperationSpec("Yeast Transformation", "Yeast"),
+        OperationSpec("Check Yeast Plate", "Yeast"),
+        OperationSpec("Streak on Media Plate", "Library Cloning"),
+        OperationSpec("Check Divided Yeast Plate", "Yeast"),
+        OperationSpec("Yeast Overnight Suspension from Collection", "Yeast"),
+        OperationSpec("Yeast Glycerol Stock", "Yeast")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -185,11 +181,11 @@ class YeastGenotypingLeg(CloningLeg):
         "PCR"
     ]
 
-    leg_order = [
-        {"name": "Yeast Lysate", "category": "Yeast"},
-        {"name": "Colony PCR", "category": "Yeast"},
-        {"name": "Fragment Analyzing", "category": "Yeast"}
-    ]
+    leg_order = (
+        OperationSpec("Yeast Lysate", "Yeast"),
+        OperationSpec("Colony PCR", "Yeast"),
+        OperationSpec("Fragment Analyzing", "Yeast")
+    )
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
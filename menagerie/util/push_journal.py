@@ -0,0 +1,153 @@
+"""Local record of what has been pushed to Aquarium
+
+While a Plan is pushed, `PushJournal` writes the server ids of the Plan, its
+Operations, Wires and DataAssociations to a file named after the fingerprint
+of the plan graph. If the push fails partway through, running the same plan
+again with `--resume` finds the file and only sends what is missing. Ids
+are recorded in memory and written with `save`, once per batch, so that the
+file is not rewritten for every record.
+
+"""
+
+import json
+import os
+
+def journal_dir():
+    """
+    Directory where journals are kept. Can be overridden with the
+    MENAGERIE_JOURNAL_DIR environment variable.
+
+    :return: str
+    """
+    default_dir = os.path.join(os.path.expanduser("~"), ".menagerie", "journals")
+    return os.environ.get("MENAGERIE_JOURNAL_DIR") or default_dir
+
+class PushJournal:
+    """
+    Server ids of the parts of one plan graph that have been created.
+    Operations and Wires are identified by their index in the graph, and
+    DataAssociations by their index in the list of temporary associations
+    and their key.
+    """
+
+    def __init__(self, aq_instance, fingerprint):
+        """
+        :param aq_instance: the instance of Aquarium the plan is pushed to
+        :type aq_instance: str
+        :param fingerprint: the fingerprint of the plan graph
+        :type fingerprint: str
+        :return: new PushJournal
+        """
+        self.aq_instance = aq_instance
+        self.fingerprint = fingerprint
+        self.path = os.path.join(journal_dir(), "{}-{}.json".format(aq_instance, fingerprint))
+        self.data = {
+            "fingerprint": fingerprint,
+            "plan_id": None,
+            "operations": {},
+            "operation_hashes": {},
+            "wires": {},
+            "data_associations": {}
+        }
+
+    @property
+    def plan_id(self):
+        return self.data["plan_id"]
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Reads the journal file, if there is one."""
+        if not self.exists(): return
+
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+
+        if data.get("fingerprint") == self.fingerprint:
+            self.data.update(data)
+
+    def save(self):
+        """Writes the journal file."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+
+        with open(temp_path, 'w') as f:
+            json.dump(self.data, f)
+
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        """Deletes the journal file once everything has been pushed."""
+        if self.exists():
+            os.remove(self.path)
+
+    def rename(self, fingerprint):
+        """
+        Files the journal under a new fingerprint, for a journal that was
+        started before the plan graph was finished.
+
+        :param fingerprint: the fingerprint of the finished plan graph
+        :type fingerprint: str
+        """
+        old_path = self.path
+        self.fingerprint = fingerprint
+        self.path = os.path.join(journal_dir(), "{}-{}.json".format(self.aq_instance, fingerprint))
+        self.data["fingerprint"] = fingerprint
+
+        if os.path.exists(old_path):
+            self.save()
+            os.remove(old_path)
+
+    def record_plan(self, plan_id):
+        self.data["plan_id"] = plan_id
+        self.save()
+
+    def record(self, kind, ids):
+        """
+        Adds server ids. They are written by the next `save`.
+
+        :param kind: "operations", "wires" or "data_associations"
+        :type kind: str
+        :param ids: server ids keyed by local index or key
+        :type ids: dict
+        """
+        self.data[kind].update({ str(k): v for k, v in ids.items() })
+
+    def record_operations(self, ids, hashes):
+        """
+        Adds the server ids of Operations, with the content hashes of their
+        records. They are written by the next `save`.
+
+        :param ids: server ids keyed by index in the graph
+        :type ids: dict
+        :param hashes: content hashes keyed by index in the graph
+        :type hashes: dict
+        """
+        self.data["operation_hashes"].update({ str(k): v for k, v in hashes.items() })
+        self.record("operations", ids)
+
+    def matches(self, graph):
+        """
+        Whether the Operations recorded in the journal are those at the same
+        positions in a plan graph. Used for journals that are not filed
+        under the fingerprint of the graph.
+
+        :param graph: the plan graph
+        :type graph: PlanGraph
+        :return: bool
+        """
+        operations = graph.operations
+
+        for key, content_hash in self.data["operation_hashes"].items():
+            i = int(key)
+            if i >= len(operations) or operations[i].content_hash() != content_hash:
+                return False
+
+        return all(int(i) < len(graph.wires) for i in self.data["wires"])
+
+    def server_id(self, kind, key):
+        return self.data[kind].get(str(key))
+
+    def has(self, kind, key):
+        return str(key) in self.data[kind]
@@ -0,0 +1,141 @@
+"""Server state that a built Plan depends on
+
+Besides its configuration files and the catalog records, building a Plan
+depends on what Aquarium returns when Samples are looked up by name and when
+the outputs of another Plan are collected for `plan_outputs`. `ServerInputs`
+records what each of these lookups returned, so that `BuildCache` can make
+the same lookups before it uses a cached build, and build the Plan again if
+any of them now returns something else.
+
+"""
+
+import threading
+
+from pydent.browser import Browser
+
+def find_plan_outputs(session, plan_id, operation_type_name, output_name):
+    """
+    Finds the output FieldValues of one name of the Operations of one type
+    in a Plan, loading their Items and the Items' Samples together.
+
+    :param session: the session to query with
+    :type session: AqSession
+    :param plan_id: the id of the Plan
+    :type plan_id: int
+    :param operation_type_name: the name of the OperationType
+    :type operation_type_name: str
+    :param output_name: the name of the output
+    :type output_name: str
+    :return: list of (Operation, Item or None)
+    """
+    plan = session.Plan.find(plan_id)
+    ops = plan.operations
+
+    # A Browser of its own, so that the results are never stale
+    browser = Browser(session)
+
+    browser.retrieve(ops, "operation_type")
+    ops = [op for op in ops if op.operation_type.name == operation_type_name]
+
+    # Load the output Items of all the Operations together
+    field_values = browser.retrieve(ops, "field_values")
+    field_values = [fv for fv in field_values if fv.role == "output" and fv.name == output_name]
+    items = browser.retrieve(field_values, "item")
+
+    # Then their Samples
+    browser.retrieve([i for i in items if i], "sample")
+
+    return [(op, op.output(output_name).item) for op in ops]
+
+class ServerInputs:
+    """
+    The results of the lookups made while building one Plan, by their
+    server ids. Safe to use from several threads.
+    """
+
+    def __init__(self, data=None):
+        """
+        :param data: the results, as returned by `dump`
+        :type data: dict
+        :return: new ServerInputs
+        """
+        data = data or {}
+        self.samples = dict(data.get("samples", {}))
+        self.typed_samples = { (st, name): ids for st, name, ids in data.get("typed_samples", []) }
+        self.plan_outputs = {
+            (plan_id, ot, output): ids for plan_id, ot, output, ids in data.get("plan_outputs", [])
+        }
+        self.lock = threading.Lock()
+
+    def record_samples(self, found):
+        """
+        :param found: lists of Samples keyed by name
+        :type found: dict
+        """
+        with self.lock:
+            self.samples.update((name, sample_ids(s)) for name, s in found.items())
+
+    def record_typed_samples(self, found):
+        """
+        :param found: lists of Samples keyed by (sample_type_name, name)
+        :type found: dict
+        """
+        with self.lock:
+            self.typed_samples.update((key, sample_ids(s)) for key, s in found.items())
+
+    def record_plan_outputs(self, plan_id, operation_type_name, output_name, outputs):
+        """
+        :param outputs: the result of `find_plan_outputs`
+        :type outputs: list
+        """
+        with self.lock:
+            key = (plan_id, operation_type_name, output_name)
+            self.plan_outputs[key] = output_ids(outputs)
+
+    def dump(self):
+        return {
+            "samples": self.samples,
+            "typed_samples": [[st, name, ids] for (st, name), ids in self.typed_samples.items()],
+            "plan_outputs": [list(key) + [ids] for key, ids in self.plan_outputs.items()]
+        }
+
+    def unchanged(self, session, catalog):
+        """
+        Makes the recorded lookups again. Samples are found with one query.
+
+        :param session: the session to query with
+        :type session: AqSession
+        :param catalog: the catalog, for the ids of SampleTypes
+        :type catalog: Catalog
+        :return: bool, whether every lookup gives the same result
+        """
+        names = set(self.samples) | set(name for st, name in self.typed_samples)
+        by_name = { name: [] for name in names }
+
+        if names:
+            for sample in session.Sample.where({ "name": sorted(names) }):
+                by_name[sample.name].append(sample)
+
+        for name, ids in self.samples.items():
+            if sample_ids(by_name[name]) != ids: return False
+
+        st_names = sorted(set(st for st, name in self.typed_samples))
+        sample_types = catalog.sample_types(st_names) if st_names else {}
+
+        for (st_name, name), ids in self.typed_samples.items():
+            st = sample_types.get(st_name)
+            if not st: return False
+
+            found = [s for s in by_name[name] if s.sample_type_id == st.id]
+            if sample_ids(found) != ids: return False
+
+        for key, ids in self.plan_outputs.items():
+            if output_ids(find_plan_outputs(session, *key)) != ids: return False
+
+        return True
+
+def sample_ids(samples):
+    return [s.id for s in samples]
+
+def output_ids(outputs):
+    return [[op.id, item.id if item else None] for op, item in outputs]
@@ -56,6 +56,20 @@ def get_start_date():
             print()
             print("You entered a value that is not on a Friday. Try again.")
 
+    start_date = next_friday(today)
+
+    print("\nPlanning experiment to start on " + start_date.strftime('%m/%d/%y'))
+
+    return start_date
+
+def next_friday(today):
+    """
+    Returns `today` if it is a Friday, and otherwise the Friday after it.
+
+    :param today: the day
+    :type today: datetime
+    :return: datetime
+    """
     dow = today.weekday()
 
     if dow <= 4:
@@ -63,11 +77,7 @@ def get_start_date():
     else:
         delay = timedelta(days=(11 - dow))
 
-    start_date = today + delay
-
-    print("\nPlanning experiment to start on " + start_date.strftime('%m/%d/%y'))
-
-    return start_date
+    return today + delay
 
 def get_plan_path():
     print()
@@ -75,7 +85,15 @@ def get_plan_path():
     plan_path = input("Path: ") 
     return plan_path
 
-def get_args():
+def get_args(build_options=True):
+    """
+    Parses the arguments of a plan script.
+
+    :param build_options: whether to accept -j, --stream and --rebuild,
+        which only apply to scripts that build with `build_with_cache`
+    :type build_options: bool
+    :return: Namespace
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--test",
                         help="bypass user inputs",
@@ -86,4 +104,140 @@ def get_args():
     parser.add_argument("-s", "--server", 
                         default="laptop",
                         help="the key pointing to the server instance in secrets.json")
-    return parser.parse_args()
\ No newline at end of file
+    parser.add_argument("-r", "--refresh-catalog",
+                        help="discard cached OperationTypes, SampleTypes and ObjectTypes",
+                        action="store_true")
+    parser.add_argument("-b", "--batch-size",
+                        type=int,
+                        help="create the plan in batches of this many operations; slower, but can be resumed")
+    parser.add_argument("-l", "--auto-layout",
+                        help="lay out the operations by their wires instead of in the order they were added",
+                        action="store_true")
+    parser.add_argument("--resume",
+                        help="finish creating a plan whose upload failed partway through",
+                        action="store_true")
+    parser.add_argument("-c", "--compile",
+                        metavar="PATH",
+                        help="write the built plan to a file for push_plan.py instead of pushing it")
+    parser.add_argument("-u", "--update",
+                        type=int,
+                        metavar="PLAN_ID",
+                        help="change a plan created earlier to match this one, keeping the operations that are unchanged")
+    parser.add_argument("--force",
+                        help="with --update, also remove operations that menagerie did not add, such as ones added in the Designer",
+                        action="store_true")
+
+    if build_options:
+        parser.add_argument("-j", "--jobs",
+                            type=int,
+                            default=1,
+                            help="build independent parts of each step with this many threads")
+        parser.add_argument("--stream",
+                            help="upload the plan in the background while it is built",
+                            action="store_true")
+        parser.add_argument("--rebuild",
+                            help="build the plan even if the same configuration was built before",
+                            action="store_true")
+
+    else:
+        parser.set_defaults(jobs=1, stream=False, rebuild=False)
+
+    args = parser.parse_args()
+
+    if args.stream and (args.auto_layout or args.resume or args.compile):
+        parser.error("--stream cannot be used with --auto-layout, --resume or --compile")
+
+    if args.update and (args.stream or args.resume or args.compile):
+        parser.error("--update cannot be used with --stream, --resume or --compile")
+
+    if args.force and not args.update:
+        parser.error("--force can only be used with --update")
+
+    return args
+
+def get_push_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path",
+                        help="a plan written with --compile")
+    parser.add_argument("-s", "--server",
+                        help="the key pointing to the server instance in secrets.json, "
+                             "if not the one the plan was compiled for")
+    parser.add_argument("-b", "--batch-size",
+                        type=int,
+                        help="create the plan in batches of this many operations; slower, but can be resumed")
+    parser.add_argument("--resume",
+                        help="finish creating a plan whose upload failed partway through",
+                        action="store_true")
+    parser.add_argument("-u", "--update",
+                        type=int,
+                        metavar="PLAN_ID",
+                        help="change a plan created earlier to match this one, keeping the operations that are unchanged")
+    parser.add_argument("--force",
+                        help="with --update, also remove operations that menagerie did not add, such as ones added in the Designer",
+                        action="store_true")
+    args = parser.parse_args()
+
+    if args.update and args.resume:
+        parser.error("--update cannot be used with --resume")
+
+    if args.force and not args.update:
+        parser.error("--force can only be used with --update")
+
+    return args
+
+def get_batch_args(plan_types):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plan_type",
+                        choices=plan_types,
+                        help="the kind of plan in every folder")
+    parser.add_argument("plan_paths",
+                        nargs="+",
+                        metavar="PATH",
+                        help="folders containing the .json files for each plan, or glob patterns matching them")
+    parser.add_argument("-s", "--server",
+                        default="laptop",
+                        help="the key pointing to the server instance in secrets.json")
+    parser.add_argument("-d", "--start-date",
+                        metavar="MM/DD/YY",
+                        help="the Friday to start the experiments; if not given, the next Friday")
+    parser.add_argument("-p", "--processes",
+                        type=int,
+                        default=1,
+                        help="build and push plans in this many processes, each with its own session")
+    parser.add_argument("-e", "--ephemeral",
+                        help="don't push plans to server",
+                        action="store_true")
+    parser.add_argument("-r", "--refresh-catalog",
+                        help="discard cached OperationTypes, SampleTypes and ObjectTypes",
+                        action="store_true")
+    parser.add_argument("-b", "--batch-size",
+                        type=int,
+                        help="create each plan in batches of this many operations; slower, but can be resumed")
+    parser.add_argument("-l", "--auto-layout",
+                        help="lay out the operations by their wires instead of in the order they were added",
+                        action="store_true")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=1,
+                        help="build independent parts of each step with this many threads")
+    parser.add_argument("--rebuild",
+                        help="build each plan even if the same configuration was built before",
+                        action="store_true")
+    parser.set_defaults(stream=False)
+    args = parser.parse_args()
+
+    if args.start_date:
+        try:
+            start_date = datetime.strptime(args.start_date, '%m/%d/%y')
+        except ValueError:
+            parser.error("--start-date must be in the form MM/DD/YY")
+
+        if start_date.weekday() != 4:
+            parser.error("--start-date must be on a Friday")
+
+        args.start_date = start_date
+
+    else:
+        args.start_date = next_friday(datetime.today())
+
+    return args
@@ -1,8 +1,9 @@
 from util.plans import Leg
+from util.leg_specs import OperationSpec
 
 class YeastDisplayLeg(Leg):
 
-    leg_order = []
+    leg_order = ()
 
     primary_handles = [
         'Yeast Culture',
@@ -32,7 +33,7 @@ class YeastDisplayLeg(Leg):
 
 class OvernightLeg(YeastDisplayLeg):
 
-    leg_order = ['Innoculate Yeast Library']
+    leg_order = (OperationSpec('Innoculate Yeast Library'),)
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -40,7 +41,7 @@ class OvernightLeg(YeastDisplayLeg):
 
 class MixCulturesLeg(YeastDisplayLeg):
 
-    leg_order = ['Mix Cultures']
+    leg_order = (OperationSpec('Mix Cultures'),)
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -55,7 +56,7 @@ class MixCulturesLeg(YeastDisplayLeg):
 
 class NaiveLeg(YeastDisplayLeg):
 
-    leg_order = ['Store Yeast Library Sample']
+    leg_order = (OperationSpec('Store Yeast Library Sample'),)
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -63,7 +64,7 @@ class NaiveLeg(YeastDisplayLeg):
 
 class InductionLeg(YeastDisplayLeg):
 
-    leg_order = ['Dilute Yeast Library']
+    leg_order = (OperationSpec('Dilute Yeast Library'),)
 
     def __init__(self, plan_step, cursor):
         super().__init__(plan_step, cursor)
@@ -71,7 +72,7 @@ class InductionLeg(YeastDisplayLeg):
 
 class TreatmentLeg(YeastDisplayLeg):
 
-    leg_order = []
+    leg_order = ()
 
     treatment_sample_types = ['Protease', 'Biotinylated Binding Target']
 
@@ -110,10 +111,10 @@ class TreatmentLeg(YeastDisplayLeg):
 class SortLeg(TreatmentLeg):
 
     leg_order = (
-        'Challenge and Label',
-        'Sort Yeast Display Library',
-        'Innoculate Yeast Library',
-        'Store Yeast Library Sample'
+        OperationSpec('Challenge and Label'),
+        OperationSpec('Sort Yeast Display Library'),
+        OperationSpec('Innoculate Yeast Library'),
+        OperationSpec('Store Yeast Library Sample')
     )
 
     def __init__(self, plan_step, cursor):
@@ -125,8 +126,8 @@ class SortLeg(TreatmentLeg):
 class FlowLeg(TreatmentLeg):
 
     leg_order = (
-        'Challenge and Label',
-        'Sort Yeast Display Library'
+        OperationSpec('Challenge and Label'),
+        OperationSpec('Sort Yeast Display Library')
     )
 
     def __init__(self, plan_step, cursor):
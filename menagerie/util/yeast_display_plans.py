@@ -1,6 +1,8 @@
+import copy
 import json
 import re
 import os
+from functools import partial
 
 from pydent.models import Sample, Item
 
@@ -14,7 +16,7 @@ class YeastDisplayPlan(ExternalPlan):
     Interface for working with the Aquarium Session and Plan models.
     Originally based on JSON schema derived from SIFT's XPlan schema.
     """
-    def __init__(self, plan_path, aq_instance, aq_plan_name=None):
+    def __init__(self, plan_path, aq_instance, aq_plan_name=None, plan_session=None):
         """
         In addition to super(), populates self.steps with new instances
         of PlanStep (YeastDisplayStep or DNASeqStep).
@@ -25,17 +27,23 @@ class YeastDisplayPlan(ExternalPlan):
         :param aq_instance: the instance of Aquarium to use
             Corresponds to a key in the secrets.json file
         :type aq_instance: str
+        :param plan_session: the session and lookup caches to share with
+            other Plans; if None, new ones are created
+        :type plan_session: PlanSession
         :return: new YeastDisplayPlan
         """
-        super().__init__(plan_path, aq_instance, aq_plan_name)
+        # Filled in by add_input_sample() as the inputs are loaded
+        self.protease_inputs = {}
 
-        # Get the list of samples for NGS
+        super().__init__(plan_path, aq_instance, aq_plan_name, plan_session)
+
+        # Get the set of samples for NGS
         # Assumes that there is only one source and only one dna_seq_step
         # TODO: This method is not great.
-        self.ngs_sample_keys = []
+        self.ngs_sample_keys = set()
         for step in self.dna_seq_steps():
             for source in step.measured_samples:
-                self.ngs_sample_keys.append(source.get("sample_key"))
+                self.ngs_sample_keys.add(source.get("sample_key"))
 
     def initialize_step(self, step_data):
         step = super().initialize_step(step_data)
@@ -58,13 +66,27 @@ class YeastDisplayPlan(ExternalPlan):
         """Get PlanSteps of operator type 'dna_seq'."""
         return self.get_steps_by_type('dna_seq')
 
+    def add_input_sample(self, key, sample):
+        """
+        In addition to super(), keeps track of the inputs that are
+        proteases.
+        """
+        super().add_input_sample(key, sample)
+
+        if self.protease_sample(sample):
+            self.protease_inputs[key] = sample
+        else:
+            self.protease_inputs.pop(key, None)
+
     def prov_protease_inputs(self):
         """
-        Return a dup of self.input_samples with only the proteases.
+        Return the entries of self.input_samples that are proteases. The
+        dict is kept up to date as samples are added and should not be
+        modified.
 
         :return: dict
         """
-        return {k:s for (k,s) in self.input_samples.items() if self.protease_sample(s)}
+        return self.protease_inputs
 
     def protease_sample(self, s):
         """
@@ -75,7 +97,7 @@ class YeastDisplayPlan(ExternalPlan):
         :return: boolean
         """
         protease_sample_types = ["Protease", "Biotinylated Binding Target"]
-        return isinstance(s, Sample) and s.sample_type.name in protease_sample_types
+        return isinstance(s, Sample) and self.sample_type_name(s) in protease_sample_types
 
 
 class YeastDisplayPlanStep(PlanStep):
@@ -83,7 +105,7 @@ class YeastDisplayPlanStep(PlanStep):
         super().__init__(plan, plan_step)
 
         for txn in self.operator.get('transformations', []):
-            self.transformations.append(YeastDisplayPlanTransformation(self, txn))
+            self.add_transformation(YeastDisplayPlanTransformation(self, txn))
 
         for msmt in self.operator.get('measurements', []):
             self.measurements.append(Measurement(self, msmt))
@@ -91,20 +113,24 @@ class YeastDisplayPlanStep(PlanStep):
         self.measured_samples = [m.source for m in self.measurements]
 
 
+    yeast_sample_types = ["DNA Library", "Yeast Strain", "Yeast Library in Soln 1"]
+
     def yeast_inputs(self):
         """
         Get all the inputs that are a type of yeast.
 
         :return: list
         """
-        yeast_sample_types = ["DNA Library", "Yeast Strain", "Yeast Library in Soln 1"]
         yeast_inputs = []
 
-        for st in yeast_sample_types:
+        for st in self.yeast_sample_types:
             yeast_inputs.extend(self.get_inputs(st))
 
         return yeast_inputs
 
+    def is_yeast_input(self, sample_key):
+        return self.input_sample_type(sample_key) in self.yeast_sample_types
+
     # TODO: Output Operations are handled differently in cloning_plans. Harmonize.
     def add_output_operation(self, uri, op):
         """Adds an Operation to the list of output operations for the PlanStep."""
@@ -166,82 +192,110 @@ class DNASeqStep(YeastDisplayPlanStep):
 
                 ]
             }
-            self.transformations.append(YeastDisplayPlanTransformation(self, txn))
+            self.add_transformation(YeastDisplayPlanTransformation(self, txn))
 
-    @staticmethod
-    def istemplate(item):
-        return isinstance(item, Item) and item.sample.sample_type.name in DNASeqStep.valid_templates
+    def istemplate(self, item):
+        return isinstance(item, Item) and self.plan.sample_type_name(item) in DNASeqStep.valid_templates
 
     def create_step(self, cursor):
+        """
+        Adds the extraction, qPCR and dilution Legs for each template, one
+        column per template. The columns do not depend on each other, so
+        they are built with `ExternalPlan.build_parallel`.
+
+        :param cursor: the Cursor
+        :type cursor: Cursor
+        """
+        tasks = []
+        txn_cursors = []
+
         for txn in self.transformations:
-            template_source = [s for s in txn.source if s["input_name"] == "Template"][0]
+            txn_cursor = copy.copy(cursor)
+            txn_cursors.append(txn_cursor)
+            tasks.append(partial(self.create_template_legs, txn, txn_cursor))
 
-            if template_source.get("item"):
-                library_item = template_source["item"]
-            elif template_source.get("item_id"):
-                library_item = self.plan.session.Item.find(template_source["item_id"])
-            else:
-                raise InputError("Unable to identify Item for source: " + template_source)
+            cursor.incr_x()
+            cursor.return_y()
 
-            library_sample = library_item.sample
+        self.plan.build_parallel(tasks)
 
-            extract_leg = ExtractDNALeg(self, cursor)
-            extract_leg.set_yeast_from_sample(library_sample)
-            extract_leg.add()
+        for txn_cursor in txn_cursors:
+            cursor.include(txn_cursor)
 
-            try:
-                extract_leg.set_field_value(extract_leg.get_input_op(), "Yeast Library", "input", item=library_item)
-            except Exception as e:
-                print("Failed to set fv for {}: {}".format(library_item.id, e))
+        cursor.update_max_x()
 
-            upstr_op = extract_leg.get_output_op()
+    def create_template_legs(self, txn, cursor):
+        """
+        Adds the Legs for one template.
 
-            for opt in ["qPCR1", "qPCR2"]:
-                io_obj = { "Program": opt }
+        :param txn: the Transformation of the template
+        :type txn: YeastDisplayPlanTransformation
+        :param cursor: the Cursor, at the bottom of the template's column
+        :type cursor: Cursor
+        """
+        template_source = [s for s in txn.source if s["input_name"] == "Template"][0]
 
-                if opt == "qPCR1":
-                    plates = False
+        if template_source.get("item"):
+            library_item = template_source["item"]
+        elif template_source.get("item_id"):
+            library_item = self.plan.session.Item.find(template_source["item_id"])
+        else:
+            raise InputError("Unable to identify Item for source: " + template_source)
 
-                    fwd_primer_src = txn.fetch_source("sample_key", "qpcr_1_forward_primer")
-                    fwd_primer = fwd_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(fwd_primer_src["name"])
-                    io_obj["Forward Primer"] = fwd_primer
+        library_sample = library_item.sample
 
-                    rev_primer_src = txn.fetch_source("sample_key", "qpcr_1_reverse_primer")
-                    rev_primer = rev_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(rev_primer_src["name"])
-                    io_obj["Reverse Primer"] = rev_primer
+        extract_leg = ExtractDNALeg(self, cursor)
+        extract_leg.set_yeast_from_sample(library_sample)
+        extract_leg.add()
 
-                elif opt == "qPCR2":
-                    plates = True
+        try:
+            extract_leg.set_field_value(extract_leg.get_input_op(), "Yeast Library", "input", item=library_item)
+        except Exception as e:
+            print("Failed to set fv for {}: {}".format(library_item.id, e))
 
-                    fwd_primer_src = txn.fetch_source("sample_key", "qpcr_2_forward_primer")
-                    fwd_primer = fwd_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(fwd_primer_src["name"])
-                    io_obj["Forward Primer"] = fwd_primer
+        upstr_op = extract_leg.get_output_op()
 
-                    rev_primer_src = txn.fetch_source("sample_key", "qpcr_2_reverse_primer")
-                    rev_primer = rev_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(rev_primer_src["name"])
-                    io_obj["Reverse Primer"] = rev_primer
+        for opt in ["qPCR1", "qPCR2"]:
+            io_obj = { "Program": opt }
 
-                qpcr_leg = QPCRLeg(self, cursor, plates)
-                qpcr_leg.set_yeast_from_sample(library_sample)
+            if opt == "qPCR1":
+                plates = False
 
-                qpcr_leg.set_sample_io(io_obj)
-                qpcr_leg.add(opt)
+                fwd_primer_src = txn.fetch_source("sample_key", "qpcr_1_forward_primer")
+                fwd_primer = fwd_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(fwd_primer_src["name"])
+                io_obj["Forward Primer"] = fwd_primer
 
-                dnstr_op = qpcr_leg.get_input_op()
-                qpcr_leg.wire_ops(upstr_op, dnstr_op)
-                upstr_op = qpcr_leg.get_output_op()
+                rev_primer_src = txn.fetch_source("sample_key", "qpcr_1_reverse_primer")
+                rev_primer = rev_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(rev_primer_src["name"])
+                io_obj["Reverse Primer"] = rev_primer
 
-            dilute_leg = DiluteLibraryLeg(self, cursor)
-            dilute_leg.set_yeast_from_sample(library_sample)
-            dilute_leg.add()
+            elif opt == "qPCR2":
+                plates = True
 
-            dnstr_op = dilute_leg.get_input_op()
-            dilute_leg.wire_ops(upstr_op, dnstr_op)
+                fwd_primer_src = txn.fetch_source("sample_key", "qpcr_2_forward_primer")
+                fwd_primer = fwd_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(fwd_primer_src["name"])
+                io_obj["Forward Primer"] = fwd_primer
 
-            cursor.incr_x()
-            cursor.return_y()
+                rev_primer_src = txn.fetch_source("sample_key", "qpcr_2_reverse_primer")
+                rev_primer = rev_primer_src.get("sample") #or self.plan.session.Sample.find_by_name(rev_primer_src["name"])
+                io_obj["Reverse Primer"] = rev_primer
 
-        cursor.update_max_x()
+            qpcr_leg = QPCRLeg(self, cursor, plates)
+            qpcr_leg.set_yeast_from_sample(library_sample)
+
+            qpcr_leg.set_sample_io(io_obj)
+            qpcr_leg.add(opt)
+
+            dnstr_op = qpcr_leg.get_input_op()
+            qpcr_leg.wire_ops(upstr_op, dnstr_op)
+            upstr_op = qpcr_leg.get_output_op()
+
+        dilute_leg = DiluteLibraryLeg(self, cursor)
+        dilute_leg.set_yeast_from_sample(library_sample)
+        dilute_leg.add()
+
+        dnstr_op = dilute_leg.get_input_op()
+        dilute_leg.wire_ops(upstr_op, dnstr_op)
 
 
 class YeastDisplayStep(YeastDisplayPlanStep):
@@ -259,7 +313,7 @@ class YeastDisplayStep(YeastDisplayPlanStep):
         new_inputs = {}
 
         for input_yeast in self.yeast_inputs():
-            st_name = self.plan.input_sample(input_yeast).sample_type.name
+            st_name = self.plan.sample_type_name(self.plan.input_sample(input_yeast))
             is_library = st_name == 'DNA Library'
 
             if not prev_step_outputs.get(input_yeast):
@@ -336,8 +390,9 @@ class YeastDisplayStep(YeastDisplayPlanStep):
 
             if int(self.step_id) > 1 and is_library:
                 # cursor.decr_x(2)
-                temp_ops = [op for op in self.plan.aq_plan.operations if op.y <= cursor.y]
-                current_x = max([op.x for op in temp_ops] or [cursor.x_home])
+                current_x = self.plan.graph.positions.rightmost_x(cursor.y)
+                if current_x is None:
+                    current_x = cursor.x_home
             else:
                 current_x = upstr_op.x
 
@@ -371,57 +426,82 @@ class YeastDisplayStep(YeastDisplayPlanStep):
             proteases = list(partitioned.keys())
             proteases.sort(key=lambda p: p.name)
 
+            tasks = []
+            leg_cursors = []
+
             for p in proteases:
                 txns = partitioned[p]
                 txns.sort(key=lambda t: t.protease().get('concentration', 0))
 
                 for txn in txns:
-                    src = txn.source
                     for dst in txn.destination_samples():
-                        ngs_sample = dst in self.plan.ngs_sample_keys
-                        if ngs_sample:
-                            this_leg = SortLeg(self, cursor)
-                        else:
-                            this_leg = FlowLeg(self, cursor)
-
-                        this_leg.set_yeast(input_yeast)
-                        this_leg.set_protease(src)
-                        this_leg.set_antibody(src)
-
-                        # This is not a good way to set these variables
-                        if ngs_sample:
-                            this_leg.sample_io['Control?'] = 'no'
-                        else:
-                            yeast_name = this_leg.sample_io['Labeled Yeast Library'].name
-                            if yeast_name in ['EBY100 + pETcon3', 'EBY100 + PETCONv3_baker']:
-                                this_leg.sample_io['Control?'] = 'autofluorescence'
-                            elif yeast_name == 'AMA1-best':
-                                if this_leg.sample_io['Protease Concentration'] == 0:
-                                    this_leg.sample_io['Control?'] = 'high-fitc'
-                                else:
-                                    this_leg.sample_io['Control?'] = 'protease'
-
-                        this_leg.add(container_opt)
-
-                        upstr_op = induction_leg.select_op('Dilute Yeast Library')
-                        dnstr_op = this_leg.select_op('Challenge and Label')
-                        this_leg.wire_ops(upstr_op, dnstr_op)
-
-                        output_op = this_leg.get_innoculate_op()
-
-                        if output_op:
-                            self.add_output_operation(dst, output_op)
-                            # self.plan.add_input_sample(dst, output_op.output('Yeast Culture').sample)
+                        leg_cursor = copy.copy(cursor)
+                        leg_cursors.append(leg_cursor)
+                        tasks.append(partial(
+                            self.create_treatment_leg, input_yeast, container_opt,
+                            induction_leg, txn, dst, leg_cursor
+                        ))
 
                         cursor.incr_x()
                         cursor.return_y()
 
                 cursor.incr_x()
 
+            # The treatment Legs only read the induction Leg, so they can be
+            # built in parallel
+            output_ops = self.plan.build_parallel(tasks)
+
+            for leg_cursor in leg_cursors:
+                cursor.include(leg_cursor)
+
+            for dst, output_op in output_ops:
+                if output_op:
+                    self.add_output_operation(dst, output_op)
+                    # self.plan.add_input_sample(dst, output_op.output('Yeast Culture').sample)
+
         cursor.update_max_x()
         cursor.decr_y(SortLeg.length() + 3)
         cursor.set_y_home()
 
+    def create_treatment_leg(self, input_yeast, container_opt, induction_leg, txn, dst, cursor):
+        """
+        Adds a SortLeg or FlowLeg for one destination of a Transformation,
+        wired to the induction Leg.
+
+        :return: the destination and the output Operation of the Leg
+        """
+        src = txn.source
+        ngs_sample = dst in self.plan.ngs_sample_keys
+        if ngs_sample:
+            this_leg = SortLeg(self, cursor)
+        else:
+            this_leg = FlowLeg(self, cursor)
+
+        this_leg.set_yeast(input_yeast)
+        this_leg.set_protease(src)
+        this_leg.set_antibody(src)
+
+        # This is not a good way to set these variables
+        if ngs_sample:
+            this_leg.sample_io['Control?'] = 'no'
+        else:
+            yeast_name = this_leg.sample_io['Labeled Yeast Library'].name
+            if yeast_name in ['EBY100 + pETcon3', 'EBY100 + PETCONv3_baker']:
+                this_leg.sample_io['Control?'] = 'autofluorescence'
+            elif yeast_name == 'AMA1-best':
+                if this_leg.sample_io['Protease Concentration'] == 0:
+                    this_leg.sample_io['Control?'] = 'high-fitc'
+                else:
+                    this_leg.sample_io['Control?'] = 'protease'
+
+        this_leg.add(container_opt)
+
+        upstr_op = induction_leg.select_op('Dilute Yeast Library')
+        dnstr_op = this_leg.select_op('Challenge and Label')
+        this_leg.wire_ops(upstr_op, dnstr_op)
+
+        return dst, this_leg.get_innoculate_op()
+
 
 class YeastDisplayPlanTransformation(Transformation):
     def __init__(self, plan_step, transformation):
@@ -429,7 +509,7 @@ class YeastDisplayPlanTransformation(Transformation):
 
     def protease(self):
         provisioned = self.plan.prov_protease_inputs()
-        proteases = [x for x in self.source if self.sample_key(x) in provisioned.keys()]
+        proteases = [x for x in self.source if self.sample_key(x) in provisioned]
 
         if proteases:
             return proteases[0]
@@ -437,4 +517,4 @@ class YeastDisplayPlanTransformation(Transformation):
             return {}
 
     def yeast(self):
-        return [x for x in self.source_samples() if x in self.plan_step.yeast_inputs()]
+        return [x for x in self.source_samples() if self.plan_step.is_yeast_input(x)]
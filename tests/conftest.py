@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The modules of menagerie import each other as `util.*`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "menagerie"))
+
+from tests import fakes
+
+@pytest.fixture
+def session():
+    return fakes.offline_session()
+
+@pytest.fixture
+def server_session(monkeypatch, tmp_path):
+    monkeypatch.setenv("MENAGERIE_JOURNAL_DIR", str(tmp_path))
+    return fakes.fake_server_session()
+
+@pytest.fixture
+def chain(server_session):
+    """Makes ChainPlans of Operations of one OperationType."""
+    grow = fakes.operation_type(server_session, "Grow", [
+        fakes.field_type("Culture", afts=[(fakes.YEAST, fakes.TUBE)]),
+        fakes.field_type("Culture", role="output", afts=[(fakes.YEAST, fakes.TUBE)])
+    ])
+    yeast = fakes.sample(server_session, "yeast", fakes.YEAST)
+    return lambda n_operations: fakes.ChainPlan(server_session, grow, yeast, n_operations)
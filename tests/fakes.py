@@ -0,0 +1,298 @@
+"""Models for tests that do not need an Aquarium server
+
+`offline_session` returns a pydent session whose requests fail, so that
+tests notice if the code under test queries the server. Models are loaded
+into it from plain data, as pydent does with the server's responses.
+`FakeServer` answers the requests used to create and change Plans from an
+in-memory database, and records them, and `ChainPlan` stands in for an
+ExternalPlan to push to it. `FakeCatalog` holds the records of a test in
+place of a `Catalog`.
+
+"""
+
+import collections
+import copy
+import itertools
+import json
+import logging
+import re
+
+from pydent import AqSession
+from pydent.aqhttp import AqHTTP
+from pydent.models import Plan
+
+from util.plan_ir import PlanGraph
+from util.server_inputs import ServerInputs
+
+ids = itertools.count(1000)
+
+YEAST = 1
+TUBE = 10
+
+class OfflineHTTP(AqHTTP):
+    """An AqHTTP that raises on every request."""
+
+    def __init__(self):
+        self.login = "test"
+        self.aquarium_url = "http://offline"
+        self._requests_session = None
+        self.timeout = 10
+        self._using_requests = True
+        self.log = logging.getLogger("offline")
+
+    def request(self, method, path, timeout=None, allow_none=True, **kwargs):
+        raise AssertionError("Unexpected request: {} {}".format(method, path))
+
+def offline_session():
+    return AqSession(None, None, None, aqhttp=OfflineHTTP())
+
+class FakeServer(OfflineHTTP):
+    """
+    An AqHTTP that keeps Plans, Operations, FieldValues, PlanAssociations
+    and Wires in memory. Saving a Plan replaces its Operations and the
+    Wires between them with those sent, as Aquarium does.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tables = collections.defaultdict(dict)
+        self.requests = []
+        self.fail_after = None
+        self.add("User", login=self.login)
+
+    def add(self, model, **record):
+        record["id"] = next(ids)
+        self.tables[model][record["id"]] = record
+        return record
+
+    def where(self, model, query):
+        def matches(record, key, value):
+            values = value if isinstance(value, list) else [value]
+            return record.get(key) in values
+
+        records = self.tables[model].values()
+        return [r for r in records if all(matches(r, k, v) for k, v in query.items())]
+
+    def plan_operations(self, plan_id):
+        op_ids = [pa["operation_id"] for pa in self.where("PlanAssociation", { "plan_id": plan_id })]
+        return self.where("Operation", { "id": op_ids })
+
+    def request(self, method, path, timeout=None, allow_none=True, **kwargs):
+        data = kwargs.get("json") or {}
+        self.requests.append((method, path, data))
+
+        if self.fail_after is not None and len(self.requests) > self.fail_after:
+            raise ConnectionError("Request failed: {} {}".format(method, path))
+
+        return copy.deepcopy(self.respond(method, path, data))
+
+    def respond(self, method, path, data):
+        plan_path = re.match(r"plans/(\d+)\.json", path)
+
+        if path == "json" and data.get("method") == "where":
+            return [self.expand(data["model"], r) for r in self.where(data["model"], data["arguments"])]
+
+        elif path == "json":
+            return self.expand(data["model"], self.tables[data["model"]].get(data["id"]))
+
+        elif path == "json/save":
+            values = { k: v for k, v in data.items() if k != "model" }
+            model = data["model"]["model"]
+            if values.get("id") in self.tables[model]:
+                record = self.tables[model][values["id"]]
+                record.update(values)
+                return record
+            return self.add(model, **values)
+
+        elif path == "json/delete":
+            return self.tables[data["model"]["model"]].pop(data["id"], None)
+
+        elif path == "browser/create_samples":
+            samples = [{ k: v for k, v in s.items() if k != "field_values" } for s in data["samples"]]
+            return { "samples": [self.add("Sample", **s) for s in samples] }
+
+        elif path == "plans.json" and method == "post":
+            return self.save_plan(self.add("Plan", name=data.get("name")), data)
+
+        elif plan_path and method == "put":
+            return self.save_plan(self.tables["Plan"][int(plan_path.group(1))], data)
+
+        raise AssertionError("Unexpected request: {} {}".format(method, path))
+
+    def expand(self, model, record):
+        if record is None: return None
+
+        record = dict(record)
+        if model == "Plan":
+            record["plan_associations"] = self.where("PlanAssociation", { "plan_id": record["id"] })
+            record["operations"] = self.plan_operations(record["id"])
+        elif model == "Operation":
+            record["field_values"] = self.where("FieldValue", { "parent_id": record["id"] })
+        return record
+
+    def save_plan(self, plan, data):
+        fv_ids = {}
+        op_ids = []
+
+        for op in data.get("operations") or []:
+            record = self.tables["Operation"].get(op.get("id"))
+            if not record:
+                record = self.add("Operation", operation_type_id=op["operation_type_id"], status="planning")
+                self.add("PlanAssociation", plan_id=plan["id"], operation_id=record["id"])
+            record.update(x=op.get("x"), y=op.get("y"))
+            op_ids.append(record["id"])
+
+            for fv in op.get("field_values") or []:
+                values = { k: v for k, v in fv.items() if not isinstance(v, (dict, list)) }
+                values.update(parent_class="Operation", parent_id=record["id"])
+                fv_record = self.tables["FieldValue"].get(fv.get("id")) or self.add("FieldValue", **values)
+                fv_ids[fv["rid"]] = fv_record["id"]
+
+        for pa in self.where("PlanAssociation", { "plan_id": plan["id"] }):
+            if pa["operation_id"] not in op_ids:
+                del self.tables["PlanAssociation"][pa["id"]]
+
+        plan_fvs = set(fv["id"] for fv in self.where("FieldValue", { "parent_id": op_ids }))
+        sent = set()
+        for wire in data.get("wires") or []:
+            ends = (wire.get("from_id") or fv_ids[wire["from"]["rid"]], wire.get("to_id") or fv_ids[wire["to"]["rid"]])
+            sent.add(ends)
+            if not self.where("Wire", { "from_id": ends[0], "to_id": ends[1] }):
+                self.add("Wire", from_id=ends[0], to_id=ends[1], active=True)
+
+        for wire in list(self.tables["Wire"].values()):
+            ends = (wire["from_id"], wire["to_id"])
+            if set(ends) <= plan_fvs and ends not in sent:
+                del self.tables["Wire"][wire["id"]]
+
+        return self.expand("Plan", plan)
+
+    def wires(self, plan_id):
+        """(from_id, to_id) of the Wires between the Operations of a Plan."""
+        op_ids = [op["id"] for op in self.plan_operations(plan_id)]
+        fv_ids = set(fv["id"] for fv in self.where("FieldValue", { "parent_id": op_ids }))
+        wires = self.tables["Wire"].values()
+        return [(w["from_id"], w["to_id"]) for w in wires if w["from_id"] in fv_ids and w["to_id"] in fv_ids]
+
+    def largest_request(self):
+        return max(len(json.dumps(data)) for method, path, data in self.requests)
+
+def fake_server_session():
+    return AqSession(None, None, None, aqhttp=FakeServer())
+
+def field_type(name, role="input", array=False, choices=None, afts=()):
+    """
+    Returns the data of a FieldType.
+
+    :param afts: (sample_type_id, object_type_id) for each AllowableFieldType
+    :type afts: list
+    :return: dict
+    """
+    ft_id = next(ids)
+    return {
+        "id": ft_id,
+        "name": name,
+        "role": role,
+        "array": array,
+        "choices": choices,
+        "parent_class": "OperationType",
+        "allowable_field_types": [
+            {
+                "id": next(ids), "field_type_id": ft_id,
+                "sample_type_id": st, "sample_type": named(st, "SampleType"),
+                "object_type_id": ot, "object_type": named(ot, "ObjectType")
+            }
+            for st, ot in afts
+        ]
+    }
+
+def named(model_id, kind):
+    if model_id is not None:
+        return { "id": model_id, "name": "{} {}".format(kind, model_id) }
+
+def operation_type(session, name, field_types, category="Test"):
+    """
+    Loads an OperationType with FieldTypes made by `field_type`.
+
+    :return: OperationType
+    """
+    return session.OperationType.load({
+        "id": next(ids),
+        "name": name,
+        "category": category,
+        "deployed": True,
+        "field_types": field_types
+    })
+
+def sample(session, name, sample_type_id):
+    return session.Sample.load({
+        "id": next(ids), "name": name,
+        "sample_type_id": sample_type_id, "sample_type": named(sample_type_id, "SampleType")
+    })
+
+def item(session, sample, object_type_id):
+    return session.Item.load({
+        "id": next(ids), "sample_id": sample.id, "object_type_id": object_type_id
+    })
+
+def object_type(session, object_type_id, name):
+    return session.ObjectType.load({ "id": object_type_id, "name": name })
+
+class ChainPlan:
+    """Stands in for an ExternalPlan with a chain of wired Operations."""
+
+    def __init__(self, session, operation_type, sample, n_operations):
+        self.session = session
+        self.operation_type = operation_type
+        self.sample = sample
+        self.aq_instance = "test"
+        self.plan_path = "chain"
+        self.aq_plan_name = "Chain"
+        self.graph = PlanGraph()
+        self.aq_plan = Plan(name=self.aq_plan_name)
+        self.aq_plan.connect_to_session(session)
+        self.temp_data_associations = {}
+        self.server_inputs = ServerInputs()
+        self.extend(n_operations)
+
+    def extend(self, n_operations):
+        """Adds Operations to the end of the chain."""
+        for i in range(n_operations):
+            previous = self.graph.operations[-1] if self.graph.operations else None
+
+            op = self.graph.add_operation(self.operation_type, 0, 64 * len(self.graph.operations))
+            op.set_input("Culture", sample=self.sample)
+            op.set_output("Culture", sample=self.sample)
+
+            if previous:
+                self.graph.add_wire(previous.output("Culture"), op.input("Culture"))
+
+class FakeCatalog:
+    """
+    Serves OperationTypes and SampleTypes that were loaded into a session.
+    Its version changes only when `change` is called.
+    """
+
+    def __init__(self, operation_types=(), sample_types=()):
+        self.operation_types_by_name = { ot.name: ot for ot in operation_types }
+        self.sample_types_by_name = { st.name: st for st in sample_types }
+        self.n_changes = 0
+
+    def change(self):
+        self.n_changes += 1
+
+    def version(self, keys):
+        return "version {}".format(self.n_changes)
+
+    def prefetch_operation_types(self, names):
+        pass
+
+    def operation_types(self, name, category=None):
+        ot = self.operation_types_by_name.get(name)
+        return [ot] if ot and category in (None, ot.category) else []
+
+    def object_types(self, names):
+        return { name: None for name in names }
+
+    def sample_types(self, names):
+        return { name: self.sample_types_by_name.get(name) for name in names }
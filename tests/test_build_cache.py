@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from util.build_cache import BuildCache
+from util.plan_session import PlanSession
+from util.server_inputs import find_plan_outputs
+
+from tests import fakes
+
+@pytest.fixture
+def server(server_session, monkeypatch, tmp_path):
+    monkeypatch.setenv("MENAGERIE_BUILD_CACHE_DIR", str(tmp_path / "builds"))
+    monkeypatch.setenv("MENAGERIE_CACHE_DIR", str(tmp_path / "catalog"))
+    return server_session._aqhttp
+
+@pytest.fixture
+def grow(server_session):
+    return fakes.operation_type(server_session, "Grow", [
+        fakes.field_type("Culture", afts=[(fakes.YEAST, fakes.TUBE)]),
+        fakes.field_type("Culture", role="output", afts=[(fakes.YEAST, fakes.TUBE)])
+    ])
+
+@pytest.fixture
+def plan_session(server_session, grow):
+    plan_session = PlanSession("test", server_session)
+    plan_session.catalog = fakes.FakeCatalog([grow])
+    return plan_session
+
+def server_sample(server, session, name):
+    return session.Sample.load(server.add("Sample", name=name, sample_type_id=fakes.YEAST))
+
+def built_plan(server, plan_session, grow):
+    """Builds a ChainPlan from a Sample that it looks up by name."""
+    session = plan_session.session
+    yeast = server_sample(server, session, "yeast")
+
+    plan = fakes.ChainPlan(session, grow, yeast, 3)
+    plan.catalog = plan_session.catalog
+    plan.server_inputs.record_samples({ "yeast": [yeast] })
+    return plan
+
+def cache_for(plan):
+    return BuildCache(plan.plan_path, "test", "chain")
+
+def test_cached_build_is_used_while_nothing_changed(server, plan_session, grow):
+    plan = built_plan(server, plan_session, grow)
+    cache_for(plan).save(plan)
+
+    cached = cache_for(plan).load(plan_session)
+
+    assert cached.graph.fingerprint() == plan.graph.fingerprint()
+
+def test_cached_build_is_not_used_after_the_catalog_changes(server, plan_session, grow):
+    plan = built_plan(server, plan_session, grow)
+    cache_for(plan).save(plan)
+
+    plan_session.catalog.change()
+
+    assert cache_for(plan).load(plan_session) is None
+
+def test_cached_build_is_not_used_when_a_name_finds_other_samples(server, plan_session, grow):
+    plan = built_plan(server, plan_session, grow)
+    cache_for(plan).save(plan)
+
+    server_sample(server, plan_session.session, "yeast")
+
+    assert cache_for(plan).load(plan_session) is None
+
+def test_build_is_not_cached_if_its_lookups_are_already_out_of_date(server, plan_session, grow):
+    plan = built_plan(server, plan_session, grow)
+
+    # As when a build creates a Sample with a name it looked up earlier
+    server_sample(server, plan_session.session, "yeast")
+    cache_for(plan).save(plan)
+
+    assert not os.path.exists(cache_for(plan).path)
+
+def test_cached_build_is_not_used_when_plan_outputs_change(server, plan_session, grow):
+    session = plan_session.session
+    make = server.add("OperationType", name="Make", category="Test")
+    source_plan = server.add("Plan", name="Source")
+    op = server.add("Operation", operation_type_id=make["id"], status="done")
+    server.add("PlanAssociation", plan_id=source_plan["id"], operation_id=op["id"])
+
+    culture = server.add("Sample", name="culture", sample_type_id=fakes.YEAST)
+    item = server.add("Item", sample_id=culture["id"], object_type_id=fakes.TUBE)
+    fv = server.add("FieldValue", parent_class="Operation", parent_id=op["id"],
+                    role="output", name="Culture", child_item_id=item["id"])
+
+    plan = built_plan(server, plan_session, grow)
+    lookup = (source_plan["id"], "Make", "Culture")
+    outputs = find_plan_outputs(session, *lookup)
+    plan.server_inputs.record_plan_outputs(*lookup, outputs)
+    cache_for(plan).save(plan)
+
+    assert [i.id for o, i in outputs] == [item["id"]]
+    assert cache_for(plan).load(plan_session) is not None
+
+    other = server.add("Item", sample_id=culture["id"], object_type_id=fakes.TUBE)
+    fv["child_item_id"] = other["id"]
+
+    assert cache_for(plan).load(plan_session) is None
@@ -0,0 +1,43 @@
+import pytest
+
+from util.catalog import Catalog
+
+from tests import fakes
+
+@pytest.fixture
+def server(server_session, monkeypatch, tmp_path):
+    monkeypatch.setenv("MENAGERIE_CACHE_DIR", str(tmp_path))
+    server = server_session._aqhttp
+    server.add("SampleType", name="Yeast Strain")
+    server.add("ObjectType", name="Tube")
+    return server
+
+def test_save_keeps_records_saved_by_another_catalog(server, server_session):
+    first = Catalog("test", server_session)
+    second = Catalog("test", server_session)
+
+    first.sample_type("Yeast Strain")
+    second.object_type("Tube")
+
+    records = Catalog("test").records
+    assert list(records["sample_types"]) == ["Yeast Strain"]
+    assert list(records["object_types"]) == ["Tube"]
+
+def test_save_keeps_the_later_of_two_records(server, server_session):
+    first = Catalog("test", server_session)
+    second = Catalog("test", server_session)
+
+    first.sample_type("Yeast Strain")
+    second.sample_type("Yeast Strain")
+    fetched_at = second.records["sample_types"]["Yeast Strain"]["fetched_at"]
+    first.save()
+
+    assert Catalog("test").records["sample_types"]["Yeast Strain"]["fetched_at"] == fetched_at
+
+def test_invalidate_does_not_keep_saved_records(server, server_session):
+    first = Catalog("test", server_session)
+    first.sample_type("Yeast Strain")
+
+    Catalog("test").invalidate("sample_types")
+
+    assert Catalog("test").records["sample_types"] == {}
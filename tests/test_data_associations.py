@@ -0,0 +1,31 @@
+import json
+
+from util.plans import ExternalPlan
+from util.plan_push import PlanPusher
+from util.push_journal import PushJournal
+
+def test_data_associations_are_merged_by_object_and_added(server_session, chain, capsys):
+    server = server_session._aqhttp
+    plan = chain(3)
+    plan.journal = PushJournal("test", plan.graph.fingerprint())
+    PlanPusher(plan, plan.journal).push()
+
+    # ChainPlan stands in for an ExternalPlan
+    op = plan.graph.operations[1]
+    ExternalPlan.update_temp_data_assoc(plan, op, { "note": "second" })
+    ExternalPlan.update_temp_data_assoc(plan, plan.aq_plan, { "round": 1 })
+    ExternalPlan.update_temp_data_assoc(plan, op, { "tries": 2 })
+
+    assert len(plan.temp_data_associations) == 2
+
+    ExternalPlan.add_data_associations(plan)
+
+    das = sorted((da["parent_class"], da["parent_id"], da["key"], json.loads(da["object"]))
+                 for da in server.tables["DataAssociation"].values())
+    assert das == [
+        ("Operation", op.model.id, "note", { "note": "second" }),
+        ("Operation", op.model.id, "tries", { "tries": 2 }),
+        ("Plan", plan.aq_plan.id, "round", { "round": 1 })
+    ]
+    assert "Added 3 data associations" in capsys.readouterr().out
+    assert not plan.journal.exists()
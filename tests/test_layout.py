@@ -0,0 +1,57 @@
+import pytest
+
+from util.layout import layered_layout, X_INCR, Y_INCR
+from util.plan_ir import PlanGraph
+
+from tests import fakes
+
+@pytest.fixture
+def grow(session):
+    return fakes.operation_type(session, "Grow", [
+        fakes.field_type("Culture", afts=[(fakes.YEAST, fakes.TUBE)]),
+        fakes.field_type("Culture", role="output", afts=[(fakes.YEAST, fakes.TUBE)])
+    ])
+
+def graph_of(grow, n_operations, wires, x=0, y=1000):
+    """Builds a graph of Operations wired by their indexes."""
+    graph = PlanGraph()
+    ops = [graph.add_operation(grow, x, y) for i in range(n_operations)]
+
+    for src, dst in wires:
+        graph.add_wire(ops[src].output("Culture"), ops[dst].input("Culture"))
+
+    return graph, ops
+
+def rows(ops, y_home=1000):
+    return [(y_home - op.y) // Y_INCR for op in ops]
+
+def test_operations_are_one_row_above_the_deepest_operation_that_feeds_them(grow):
+    graph, ops = graph_of(grow, 4, [(0, 1), (1, 3), (0, 2), (2, 3), (0, 3)])
+
+    layered_layout(graph)
+
+    assert rows(ops) == [0, 1, 1, 2]
+    assert [op.x for op in ops] == [0, 0, X_INCR, 0]
+
+def test_disconnected_parts_share_rows_side_by_side(grow):
+    graph, ops = graph_of(grow, 5, [(0, 1), (2, 3), (3, 4)], x=64)
+
+    layered_layout(graph)
+
+    assert rows(ops) == [0, 1, 0, 1, 2]
+    assert [op.x for op in ops[:2]] == [64, 64]
+    assert [op.x for op in ops[2:]] == [64 + X_INCR, 64 + X_INCR, 64]
+    assert graph.positions.rightmost_x(1000) == 64 + X_INCR
+
+def test_operations_on_a_cycle_are_put_in_a_final_row(grow):
+    graph, ops = graph_of(grow, 5, [(0, 1), (1, 2), (2, 3), (3, 2), (3, 4)])
+
+    layered_layout(graph)
+
+    assert rows(ops) == [0, 1, 2, 2, 2]
+    assert [op.x for op in ops[2:]] == [0, X_INCR, 2 * X_INCR]
+
+def test_layout_of_no_operations(grow):
+    graph = PlanGraph()
+    layered_layout(graph)
+    assert graph.operations == []
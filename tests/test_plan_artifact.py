@@ -0,0 +1,73 @@
+import gzip
+import json
+
+import pytest
+
+from util.compiled_plans import CompiledPlan
+from util.plan_artifact import write_artifact, ARTIFACT_VERSION
+from util.plan_session import PlanSession
+from util.plans import InputError
+
+from tests import fakes
+
+@pytest.fixture
+def plan_session(server_session):
+    return PlanSession("test", server_session)
+
+@pytest.fixture
+def plan(server_session, plan_session):
+    grow = fakes.operation_type(server_session, "Grow", [
+        fakes.field_type("Culture", afts=[(fakes.YEAST, fakes.TUBE)]),
+        fakes.field_type("Culture", role="output", afts=[(fakes.YEAST, fakes.TUBE)])
+    ])
+    plan_session.catalog = fakes.FakeCatalog([grow])
+
+    server = server_session._aqhttp
+    yeast = server_session.Sample.load(server.add("Sample", name="yeast", sample_type_id=fakes.YEAST))
+
+    plan = fakes.ChainPlan(server_session, grow, yeast, 4)
+    plan.temp_data_associations = {}
+    for obj, values in [(plan.graph.operations[2], { "note": "third" }),
+                        (plan.aq_plan, { "round": 1, "kind": "chain" })]:
+        plan.temp_data_associations[id(obj)] = dict(values, object=obj)
+    return plan
+
+def fields(graph):
+    return [
+        (op.operation_type.id, op.x, op.y,
+         [(fv.field_type.id, fv.sample.id, fv.value) for fv in op.field_values])
+        for op in graph.operations
+    ]
+
+def test_compiled_plan_is_the_plan_that_was_built(plan, plan_session, tmp_path):
+    path = str(tmp_path / "plan.gz")
+    write_artifact(plan, path)
+
+    compiled = CompiledPlan(path, plan_session=plan_session)
+
+    assert compiled.aq_plan_name == plan.aq_plan_name
+    assert compiled.plan_path == plan.plan_path
+    assert compiled.graph.fingerprint() == plan.graph.fingerprint()
+    assert fields(compiled.graph) == fields(plan.graph)
+
+    op_index = { id(op): i for i, op in enumerate(compiled.graph.operations) }
+    wires = [(op_index[id(w.source.operation)], op_index[id(w.destination.operation)])
+             for w in compiled.graph.wires]
+    assert wires == [(0, 1), (1, 2), (2, 3)]
+
+    operation_das, plan_das = compiled.temp_data_associations.values()
+    assert operation_das == { "object": compiled.graph.operations[2], "note": "third" }
+    assert plan_das == { "object": compiled.aq_plan, "round": 1, "kind": "chain" }
+
+def test_artifact_of_another_version_is_rejected(plan, plan_session, tmp_path):
+    path = str(tmp_path / "plan.gz")
+    write_artifact(plan, path)
+
+    with gzip.open(path, "rt") as f:
+        data = json.load(f)
+    data["version"] = ARTIFACT_VERSION + 1
+    with gzip.open(path, "wt") as f:
+        json.dump(data, f)
+
+    with pytest.raises(InputError):
+        CompiledPlan(path, plan_session=plan_session)
@@ -0,0 +1,34 @@
+import json
+import os
+
+import plan_batch
+from util.plan_session import PlanSession
+
+from tests import fakes
+
+def plan_folder(tmp_path, name, samples):
+    path = tmp_path / name
+    path.mkdir()
+    steps = [{ "id": 1, "type": "provision", "operator": { "samples": samples } }]
+    with open(os.path.join(str(path), "plan.json"), "w") as f:
+        json.dump({ "steps": steps }, f)
+    return str(path)
+
+def test_samples_that_several_plans_provision_are_created_once(server_session, tmp_path):
+    server = server_session._aqhttp
+    yeast = server_session.SampleType.load({ "id": fakes.YEAST, "name": "Yeast Strain", "field_types": [] })
+    plan_session = PlanSession("test", server_session)
+    plan_session.catalog = fakes.FakeCatalog(sample_types=[yeast])
+
+    fakes.sample(server_session, "old yeast", fakes.YEAST)
+    new_yeast = { "name": "new yeast", "sample_type": "Yeast Strain" }
+    plan_paths = [
+        plan_folder(tmp_path, "first", [new_yeast, { "name": "old yeast", "sample_type": "Yeast Strain" }]),
+        plan_folder(tmp_path, "second", [new_yeast, { "name": "unknown", "sample_type": "Unknown" }])
+    ]
+
+    plan_batch.provision_samples(plan_session, plan_paths)
+    plan_batch.provision_samples(plan_session, plan_paths)
+
+    names = sorted(s["name"] for s in server.tables["Sample"].values())
+    assert names == ["new yeast", "old yeast"]
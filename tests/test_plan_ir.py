@@ -0,0 +1,256 @@
+import random
+
+import pytest
+from pydent.exceptions import AquariumModelError
+
+from util.plan_ir import PlanGraph, OperationRecord, SpatialIndex
+
+from tests import fakes
+
+YEAST = 1
+MEDIA = 2
+TUBE = 10
+PLATE = 11
+
+@pytest.fixture
+def grow(session):
+    return fakes.operation_type(session, "Grow", [
+        fakes.field_type("Culture", afts=[(YEAST, TUBE), (YEAST, PLATE)]),
+        fakes.field_type("Temperature", choices="30,37"),
+        fakes.field_type("Additives", array=True, afts=[(MEDIA, None)]),
+        fakes.field_type("Culture", role="output", afts=[(YEAST, TUBE)])
+    ])
+
+@pytest.fixture
+def yeast(session):
+    return fakes.sample(session, "yeast", YEAST)
+
+def build(grow, yeast, x=0, temperature=30):
+    graph = PlanGraph()
+    op = graph.add_operation(grow, x, 0)
+    op.set_input("Culture", sample=yeast)
+    op.set_input("Temperature", value=temperature)
+    op.set_output("Culture", sample=yeast)
+    return graph, op
+
+def test_field_values_for_non_array_field_types(grow):
+    op = OperationRecord(grow)
+
+    assert [(fv.role, fv.name) for fv in op.field_values] == [
+        ("input", "Culture"), ("input", "Temperature"), ("output", "Culture")
+    ]
+    assert op.input_array("Additives") == []
+
+def test_set_input_chooses_allowable_field_type(session, grow, yeast):
+    op = OperationRecord(grow)
+    plate = fakes.object_type(session, PLATE, "Plate")
+
+    fv = op.set_input("Culture", sample=yeast, container=plate)
+
+    assert fv.allowable_field_type.object_type_id == PLATE
+    assert fv.assigned == ("sample", "item", "value", "object_type")
+
+def test_sample_without_allowable_field_type_is_rejected(session, grow):
+    op = OperationRecord(grow)
+    media = fakes.sample(session, "media", MEDIA)
+
+    with pytest.raises(AquariumModelError):
+        op.set_input("Culture", sample=media)
+
+    fv = op.input("Culture")
+    assert fv.sample is None
+    assert fv.assigned == ()
+
+def test_value_must_be_one_of_the_choices(grow):
+    op = OperationRecord(grow)
+
+    with pytest.raises(AquariumModelError):
+        op.set_input("Temperature", value=42)
+
+    assert op.set_input("Temperature", value=37).value == 37
+
+def test_value_must_be_json_serializable(grow):
+    op = OperationRecord(grow)
+
+    with pytest.raises(AquariumModelError):
+        op.set_output("Culture", value=object())
+
+def test_item_must_belong_to_sample(session, grow, yeast):
+    op = OperationRecord(grow)
+    other = fakes.sample(session, "other yeast", YEAST)
+    item = fakes.item(session, other, TUBE)
+
+    with pytest.raises(AquariumModelError):
+        op.set_input("Culture", sample=yeast, item=item)
+
+def test_item_must_be_in_container(session, grow, yeast):
+    op = OperationRecord(grow)
+    item = fakes.item(session, yeast, TUBE)
+    plate = fakes.object_type(session, PLATE, "Plate")
+
+    with pytest.raises(AquariumModelError):
+        op.set_input("Culture", sample=yeast, item=item, container=plate)
+
+    fv = op.set_input("Culture", sample=yeast, item=item)
+    assert fv.allowable_field_type.object_type_id == TUBE
+
+def test_array_field_value_is_added_when_set(session, grow):
+    op = OperationRecord(grow)
+    media = fakes.sample(session, "media", MEDIA)
+
+    op.set_input("Additives", sample=media)
+
+    assert [fv.sample for fv in op.input_array("Additives")] == [media]
+
+def test_unknown_field_type_is_rejected(grow):
+    op = OperationRecord(grow)
+
+    with pytest.raises(AquariumModelError):
+        op.set_input("Nothing", value=1)
+
+def test_materialized_operation_has_the_same_values(grow, yeast):
+    graph, record = build(grow, yeast, x=64)
+
+    op = graph.materialize_operation(record)
+
+    assert op.x == 64
+    culture = op.input("Culture")
+    assert culture.child_sample_id == yeast.id
+    assert culture.allowable_field_type_id == record.input("Culture").allowable_field_type.id
+    assert op.input("Temperature").value == 30
+    assert record.model is op
+
+def test_merge_appends_operations_wires_and_positions(grow, yeast):
+    graph, first = build(grow, yeast, x=0)
+    other, second = build(grow, yeast, x=192)
+    third = other.add_operation(grow, 384, 64)
+    wire = other.add_wire(second.output("Culture"), third.input("Culture"))
+
+    graph.merge(other)
+
+    assert graph.operations == [first, second, third]
+    assert graph.wires == [wire]
+    assert graph.positions.rightmost_x(0) == 192
+    assert graph.positions.rightmost_x(64) == 384
+
+def rightmost_by_scan(positions, max_y):
+    xs = [x for x, y in positions if y <= max_y]
+    return max(xs) if xs else None
+
+@pytest.mark.parametrize("seed", range(5))
+def test_spatial_index_matches_a_linear_scan(seed):
+    rng = random.Random(seed)
+    index = SpatialIndex()
+    positions = []
+
+    for i in range(300):
+        x, y = rng.randrange(-500, 5000), rng.randrange(-20, 40) * 64
+        index.add(x, y)
+        positions.append((x, y))
+
+        for max_y in [y - 1, y, y + 1, rng.randrange(-1500, 3000)]:
+            assert index.rightmost_x(max_y) == rightmost_by_scan(positions, max_y)
+
+def test_spatial_index_of_no_operations():
+    index = SpatialIndex()
+    assert index.rightmost_x(0) is None
+
+    index.add(64, 128)
+    assert index.rightmost_x(127) is None
+    assert index.rightmost_x(-2 ** 40) is None
+    assert index.rightmost_x(2 ** 40) == 64
+
+def test_content_hash_ignores_position(grow, yeast):
+    _, a = build(grow, yeast, x=0)
+    _, b = build(grow, yeast, x=500)
+    _, c = build(grow, yeast, x=0, temperature=37)
+
+    assert a.content_hash() == b.content_hash()
+    assert a.content_hash() != c.content_hash()
+
+def test_fingerprint_depends_on_values_positions_and_wires(grow, yeast):
+    def two_ops(x=0, wired=True):
+        graph, a = build(grow, yeast)
+        b = graph.add_operation(grow, x, 64)
+        b.set_input("Culture", sample=yeast)
+        if wired:
+            graph.add_wire(a.output("Culture"), b.input("Culture"))
+        return graph.fingerprint()
+
+    assert two_ops() == two_ops()
+    assert two_ops() != two_ops(x=192)
+    assert two_ops() != two_ops(wired=False)
+
+@pytest.fixture
+def containers(session):
+    return {
+        "tube": fakes.object_type(session, TUBE, "Tube"),
+        "plate": fakes.object_type(session, PLATE, "Plate")
+    }
+
+def set_inputs(session, grow, yeast, containers):
+    """
+    Returns the cases for set_input, each a list of (name, values) pairs
+    that are set in order on one Operation.
+    """
+    other = fakes.sample(session, "other yeast", YEAST)
+    media = fakes.sample(session, "media", MEDIA)
+    in_tube = fakes.item(session, yeast, TUBE)
+    in_plate = fakes.item(session, yeast, PLATE)
+
+    return [
+        [("Culture", { "sample": yeast })],
+        [("Culture", { "sample": yeast, "container": containers["plate"] })],
+        [("Culture", { "sample": media })],
+        [("Culture", { "sample": "yeast" })],
+        [("Culture", { "sample": yeast, "item": in_tube })],
+        [("Culture", { "sample": yeast, "item": in_plate })],
+        [("Culture", { "sample": yeast, "item": in_plate, "container": containers["tube"] })],
+        [("Culture", { "sample": other, "item": in_tube })],
+        [
+            ("Culture", { "sample": yeast, "container": containers["plate"] }),
+            ("Culture", { "sample": yeast, "item": in_tube })
+        ],
+        [("Temperature", { "value": 37 })],
+        [("Temperature", { "value": "30" })],
+        [("Temperature", { "value": 42 })],
+        [("Temperature", { "value": { 30 } })],
+        [("Additives", { "sample": media })]
+    ]
+
+def outcome(set_input, calls):
+    """Returns the AllowableFieldType ids chosen, or None if one is rejected."""
+    fvs = []
+    try:
+        for name, values in calls:
+            fvs.append(set_input(name, **values))
+    except AquariumModelError:
+        return None
+
+    return [fv.allowable_field_type and fv.allowable_field_type.id for fv in fvs]
+
+def test_records_agree_with_pydent_field_values(session, grow, yeast, containers):
+    cases = set_inputs(session, grow, yeast, containers)
+
+    for calls in cases:
+        record = OperationRecord(grow)
+        op = grow.instance()
+
+        def set_pydent_input(name, **values):
+            if grow.field_type(name, "input").array:
+                op.new_field_value(name, "input")
+            op.set_input(name, **values)
+            return op.input(name)
+
+        assert outcome(record.set_input, calls) == outcome(set_pydent_input, calls), calls
+
+def test_records_report_allowable_field_types_as_pydent_does(session, grow):
+    media = fakes.sample(session, "media", MEDIA)
+    op = grow.instance()
+
+    with pytest.raises(AquariumModelError) as record_error:
+        OperationRecord(grow).set_input("Culture", sample=media)
+    with pytest.raises(AquariumModelError) as pydent_error:
+        op.set_input("Culture", sample=media)
+
+    assert str(record_error.value) == str(pydent_error.value)
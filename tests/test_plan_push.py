@@ -0,0 +1,63 @@
+import pytest
+
+from util.plan_push import PlanPusher
+from util.push_journal import PushJournal
+
+def push(plan, batch_size, resume=False):
+    journal = PushJournal("test", plan.graph.fingerprint())
+    if resume:
+        journal.load()
+    PlanPusher(plan, journal, batch_size).push()
+
+def graph_wires(plan):
+    return sorted((w.source.model.id, w.destination.model.id) for w in plan.graph.wires)
+
+def test_batches_keep_the_wires_of_earlier_batches(server_session, chain):
+    server = server_session._aqhttp
+    plan = chain(12)
+
+    push(plan, batch_size=3)
+
+    op_ids = [op["id"] for op in server.plan_operations(plan.aq_plan.id)]
+    assert sorted(op_ids) == sorted(r.model.id for r in plan.graph.operations)
+    assert sorted(server.wires(plan.aq_plan.id)) == graph_wires(plan)
+    assert len(server.wires(plan.aq_plan.id)) == 11
+
+def test_requests_do_not_grow_with_the_plan(server_session, chain):
+    small = chain(4)
+    push(small, batch_size=2)
+    largest_small = server_session._aqhttp.largest_request()
+
+    large = chain(40)
+    push(large, batch_size=2)
+
+    assert server_session._aqhttp.largest_request() == largest_small
+    assert all(method != "put" for method, path, data in server_session._aqhttp.requests)
+
+@pytest.mark.parametrize("fail_after", [5, 12, 30])
+def test_resume_after_a_batch_fails(server_session, chain, fail_after):
+    server = server_session._aqhttp
+    plan = chain(9)
+    server.fail_after = len(server.requests) + fail_after
+
+    with pytest.raises(ConnectionError):
+        push(plan, batch_size=3)
+
+    server.fail_after = None
+    resumed = chain(9)
+    push(resumed, batch_size=3, resume=True)
+
+    assert list(server.tables["Plan"]) == [resumed.aq_plan.id]
+    assert len(server.plan_operations(resumed.aq_plan.id)) == 9
+    assert sorted(server.wires(resumed.aq_plan.id)) == graph_wires(resumed)
+
+def test_journal_is_written_once_per_batch(server_session, chain, monkeypatch):
+    saves = []
+    save = PushJournal.save
+    monkeypatch.setattr(PushJournal, "save", lambda journal: saves.append(save(journal)))
+
+    push(chain(40), batch_size=10)
+
+    # Once for the Plan, then twice per batch: before its Operations are
+    # added to the Plan and after its Wires
+    assert len(saves) == 1 + 2 * 4
@@ -0,0 +1,50 @@
+import pytest
+from pydent.exceptions import AquariumModelError
+
+from util.plan_session import PlanSession
+
+from tests import fakes
+
+@pytest.fixture
+def plan_session(server_session):
+    strain = server_session.SampleType.load({
+        "id": fakes.YEAST, "name": "Yeast Strain",
+        "field_types": [
+            { "id": 901, "name": "Marker", "ftype": "string", "required": False,
+              "parent_class": "SampleType", "parent_id": fakes.YEAST },
+            { "id": 902, "name": "Genotype", "ftype": "string", "required": True,
+              "parent_class": "SampleType", "parent_id": fakes.YEAST }
+        ]
+    })
+    plan_session = PlanSession("test", server_session)
+    plan_session.catalog = fakes.FakeCatalog(sample_types=[strain])
+    return plan_session
+
+def created_samples(server):
+    return [path for method, path, data in server.requests if path == "browser/create_samples"]
+
+def test_new_samples_are_created_together(server_session, plan_session):
+    server = server_session._aqhttp
+
+    found = plan_session.find_or_create_samples([
+        ("Yeast Strain", "first", { "Genotype": "a", "Marker": "URA3" }),
+        ("Yeast Strain", "second", { "Genotype": "b" }),
+        ("Yeast Strain", "first", { "Genotype": "a" })
+    ])
+
+    assert sorted(name for st, name in found) == ["first", "second"]
+    assert all(len(samples) == 1 and samples[0].id for samples in found.values())
+    assert len(created_samples(server)) == 1
+
+def test_samples_missing_required_properties_are_not_created(server_session, plan_session):
+    with pytest.raises(AquariumModelError, match="Genotype"):
+        plan_session.find_or_create_samples([
+            ("Yeast Strain", "first", { "Genotype": "a" }),
+            ("Yeast Strain", "second", {})
+        ])
+
+    assert created_samples(server_session._aqhttp) == []
+
+def test_unknown_sample_type_is_reported(plan_session):
+    with pytest.raises(AquariumModelError, match="SampleType not found: Unknown"):
+        plan_session.find_or_create_samples([("Unknown", "first", {})])
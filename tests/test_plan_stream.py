@@ -0,0 +1,66 @@
+from util.plan_push import PlanPusher
+from util.plan_stream import PlanStreamer, unfinished_journal
+
+from tests import fakes
+
+def graph_wires(plan):
+    return sorted((w.source.model.id, w.destination.model.id) for w in plan.graph.wires)
+
+def stop(streamer):
+    """Stops the upload without finishing it, as if the process had ended."""
+    streamer.queue.put(None)
+    streamer.thread.join()
+
+def test_parts_are_held_until_a_batch_is_ready(server_session, chain):
+    server = server_session._aqhttp
+    plan = chain(0)
+    streamer = PlanStreamer(plan, batch_size=4)
+    streamer.start()
+
+    for i in range(3):
+        plan.extend(1)
+        streamer.submit()
+    assert streamer.n_operations == 0
+
+    plan.extend(2)
+    streamer.submit()
+    assert streamer.n_operations == 4
+
+    plan.extend(1)
+    streamer.finish(plan.graph.fingerprint())
+
+    assert len(server.plan_operations(plan.aq_plan.id)) == 6
+    assert sorted(server.wires(plan.aq_plan.id)) == graph_wires(plan)
+
+def test_resume_finds_the_journal_of_an_unfinished_upload(server_session, chain):
+    server = server_session._aqhttp
+    plan = chain(0)
+    streamer = PlanStreamer(plan, batch_size=2)
+    streamer.start()
+    plan.extend(5)
+    streamer.submit()
+    stop(streamer)
+
+    resumed = chain(7)
+    journal = unfinished_journal(resumed)
+    assert journal.plan_id == plan.aq_plan.id
+
+    PlanPusher(resumed, journal, 2).push()
+
+    assert list(server.tables["Plan"]) == [plan.aq_plan.id]
+    assert len(server.plan_operations(plan.aq_plan.id)) == 7
+    assert sorted(server.wires(plan.aq_plan.id)) == graph_wires(resumed)
+
+def test_journal_of_a_different_plan_is_not_used(server_session, chain):
+    plan = chain(0)
+    streamer = PlanStreamer(plan, batch_size=2)
+    streamer.start()
+    plan.extend(4)
+    streamer.submit()
+    stop(streamer)
+
+    changed = chain(7)
+    other = fakes.sample(server_session, "other yeast", fakes.YEAST)
+    changed.graph.operations[1].set_input("Culture", sample=other)
+
+    assert unfinished_journal(changed) is None
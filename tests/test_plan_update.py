@@ -0,0 +1,128 @@
+import pytest
+
+from util.plan_manifest import PlanManifest
+from util.plan_push import PlanPusher
+from util.plan_update import PlanUpdater
+from util.push_journal import PushJournal
+
+from tests import fakes
+
+@pytest.fixture
+def server(server_session, monkeypatch, tmp_path):
+    monkeypatch.setenv("MENAGERIE_MANIFEST_DIR", str(tmp_path / "manifests"))
+    return server_session._aqhttp
+
+def push(plan):
+    PlanPusher(plan, PushJournal("test", plan.graph.fingerprint())).push()
+
+    manifest = PlanManifest("test", plan.aq_plan.id)
+    manifest.record(plan.graph)
+    manifest.save()
+    return plan.aq_plan.id
+
+def update(plan, plan_id, force=False, batch_size=None):
+    manifest = PlanManifest("test", plan_id)
+    manifest.load()
+    journal = PushJournal("test", plan.graph.fingerprint())
+    journal.load()
+    PlanUpdater(plan, manifest, journal, batch_size, force).update()
+
+def wire_ids(server, plan_id):
+    """Returns the ids of the Wires of a Plan keyed by (from_id, to_id)."""
+    wires = set(server.wires(plan_id))
+    return { (w["from_id"], w["to_id"]): w["id"] for w in server.tables["Wire"].values()
+             if (w["from_id"], w["to_id"]) in wires }
+
+def graph_wires(plan):
+    return sorted((w.source.model.id, w.destination.model.id) for w in plan.graph.wires)
+
+def op_ids(server, plan_id):
+    return sorted(op["id"] for op in server.plan_operations(plan_id))
+
+@pytest.fixture
+def build(server_session, chain):
+    """
+    Makes chains whose Operations feed on different Samples, and so have
+    different content hashes. Operations at the indexes in `changed` feed
+    on another Sample.
+    """
+    samples = [fakes.sample(server_session, "yeast {}".format(i), fakes.YEAST) for i in range(11)]
+
+    def build(*changed, n_operations=5):
+        plan = chain(n_operations)
+        for i, op in enumerate(plan.graph.operations):
+            op.set_input("Culture", sample=samples[10 if i in changed else i])
+        return plan
+
+    return build
+
+def test_unchanged_operations_and_wires_are_kept(server, build):
+    original = build()
+    plan_id = push(original)
+    kept_ops = [r.model.id for r in original.graph.operations]
+    kept_wires = wire_ids(server, plan_id)
+
+    changed = build(2)
+    update(changed, plan_id)
+
+    ids = [r.model.id for r in changed.graph.operations]
+    assert ids[:2] + ids[3:] == kept_ops[:2] + kept_ops[3:]
+    assert ids[2] != kept_ops[2]
+    assert op_ids(server, plan_id) == sorted(ids)
+    assert kept_ops[2] not in server.tables["Operation"]
+
+    # Only the Wires into and out of the changed Operation are replaced
+    wires = wire_ids(server, plan_id)
+    assert sorted(wires) == graph_wires(changed)
+    unchanged = [w for w in graph_wires(changed) if w in kept_wires]
+    assert len(unchanged) == 2
+    assert all(wires[w] == kept_wires[w] for w in unchanged)
+
+def test_update_to_the_same_graph_changes_nothing(server, chain):
+    plan_id = push(chain(4))
+    n_requests = len(server.requests)
+
+    update(chain(4), plan_id)
+
+    writes = [path for method, path, data in server.requests[n_requests:] if path in ("json/save", "json/delete")]
+    assert writes == []
+
+def designer_operation(server, plan_id):
+    op = server.add("Operation", operation_type_id=1, status="planning", x=0, y=0)
+    server.add("PlanAssociation", plan_id=plan_id, operation_id=op["id"])
+    return op["id"]
+
+def test_operations_added_in_the_designer_are_kept(server, chain):
+    plan_id = push(chain(3))
+    op_id = designer_operation(server, plan_id)
+
+    update(chain(2), plan_id)
+
+    assert op_id in op_ids(server, plan_id)
+    assert len(op_ids(server, plan_id)) == 3
+
+def test_operations_added_in_the_designer_are_removed_with_force(server, chain):
+    plan_id = push(chain(3))
+    op_id = designer_operation(server, plan_id)
+
+    update(chain(2), plan_id, force=True)
+
+    assert op_id not in server.tables["Operation"]
+    assert len(op_ids(server, plan_id)) == 2
+
+@pytest.mark.parametrize("fail_after", [3, 8, 15, 30, 40])
+def test_update_that_fails_is_finished_by_running_it_again(server, build, fail_after):
+    plan_id = push(build())
+
+    server.fail_after = len(server.requests) + fail_after
+    with pytest.raises(ConnectionError):
+        update(build(1, 3, n_operations=9), plan_id, batch_size=2)
+
+    server.fail_after = None
+    changed = build(1, 3, n_operations=9)
+    update(changed, plan_id, batch_size=2)
+
+    ids = sorted(r.model.id for r in changed.graph.operations)
+    assert op_ids(server, plan_id) == ids
+    assert sorted(wire_ids(server, plan_id)) == graph_wires(changed)
+    assert len(server.tables["Wire"]) == 8